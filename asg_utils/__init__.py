@@ -1,5 +1,6 @@
 from .main import graph_to_mermaid
 from .main import generateModules
+from .validation import validate_graph
+from .binary import read_asg, write_asg, asg_to_bytes, asg_from_bytes
 
-__all__ = ['graph_to_mermaid', 'generateModules']
-
+__all__ = ['graph_to_mermaid', 'generateModules', 'validate_graph', 'read_asg', 'write_asg', 'asg_to_bytes', 'asg_from_bytes']
@@ -0,0 +1,84 @@
+from schema import AbstractSyntaxGraph, EdgeList, StringList, TextViewList
+from pathlib import Path
+import zlib
+
+from .validation import validate_graph
+
+# Magic number of binary xil ASG files (.xasg)
+FOURCC = b'XASG'
+HEADER_BYTES = len(FOURCC) + 3 * 4
+
+def asg_to_bytes(graph):
+    """
+    Serializes an abstract syntax graph into the binary format.
+
+    Layout: FOURCC, AbstractSyntaxGraph header with the byte size of each
+    section, followed by the zlib compressed EdgeList, TextViewList and
+    StringList sections.
+
+    Args:
+        graph: Dictionary with 'edges', 'strings' and 'textViews'
+
+    Returns:
+        The serialized graph as bytes
+    """
+    edges = zlib.compress(bytes(EdgeList.encode(graph['edges'])))
+    textViews = zlib.compress(bytes(TextViewList.encode(graph.get('textViews') or TextViewList([]))))
+    strings = zlib.compress(bytes(StringList.encode(graph['strings'])))
+    header = AbstractSyntaxGraph(EdgeListBytes=len(edges), TextViewListBytes=len(textViews), StringListBytes=len(strings))
+    return FOURCC + bytes(AbstractSyntaxGraph.encode(header)) + edges + textViews + strings
+
+def asg_from_bytes(data, validate=True):
+    """
+    Deserializes an abstract syntax graph from the binary format.
+
+    Args:
+        data: Serialized graph
+        validate: Check the integrity of the graph with validate_graph
+
+    Returns:
+        Dictionary with 'edges', 'strings' and 'textViews'
+
+    Raises:
+        ValueError: If the data isn't a xil ASG or the graph is malformed
+    """
+    if len(data) < HEADER_BYTES or data[:len(FOURCC)] != FOURCC:
+        raise ValueError("Data is not a binary xil ASG")
+    header = AbstractSyntaxGraph.decode(data[len(FOURCC):HEADER_BYTES])
+    offset = HEADER_BYTES
+    sections = []
+    for size in (header.EdgeListBytes, header.TextViewListBytes, header.StringListBytes):
+        if offset + size > len(data):
+            raise ValueError("Binary xil ASG is truncated")
+        sections.append(zlib.decompress(data[offset:offset + size]))
+        offset += size
+    graph = {
+        'edges': EdgeList.decode(sections[0]),
+        'strings': StringList.decode(sections[2]),
+        'textViews': TextViewList.decode(sections[1]),
+    }
+    if validate:
+        violations = validate_graph(graph)
+        if violations:
+            details = '; '.join(
+                v['message'] + (f" at {v['textView'].row}:{v['textView'].column}" if v['textView'] else '')
+                for v in violations)
+            raise ValueError(f"Malformed xil ASG: {details}")
+    return graph
+
+def write_asg(graph, file_path: str | Path) -> None:
+    """Writes an abstract syntax graph to a binary .xasg file"""
+    Path(file_path).write_bytes(asg_to_bytes(graph))
+
+def read_asg(file_path: str | Path, validate=True) -> dict:
+    """
+    Reads an abstract syntax graph from a binary .xasg file.
+
+    Raises:
+        FileNotFoundError: If the file is not found
+        ValueError: If the file isn't a xil ASG or the graph is malformed
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        raise FileNotFoundError(f"ASG file not found: {file_path}")
+    return asg_from_bytes(file_path.read_bytes(), validate)
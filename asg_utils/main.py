@@ -17,7 +17,9 @@ def generateModules(python_objects):
             'use': [],
             'libs': {},
             'ffi': {},
-            'fun': {}
+            'types': {},
+            'fun': {},
+            'textViews': {}
         }
         
         # Collect all units
@@ -48,6 +50,16 @@ def generateModules(python_objects):
                     )
                 merged['ffi'][ffi_name] = ffi_decl
         
+        # Merge [type] and [struct] declarations (raise error on duplicate names)
+        for obj in objects:
+            for type_name, type_decl in obj.get('types', {}).items():
+                if type_name in merged['types']:
+                    raise ValueError(
+                        f"Duplicate type '{type_name}' found in module '{module}'. "
+                        f"Conflicting units: {[u for u in merged['unit'] if u]}"
+                    )
+                merged['types'][type_name] = type_decl
+        
         # Merge fun dictionaries (raise error on duplicate names)
         for obj in objects:
             for fun_name, fun_decl in obj.get('fun', {}).items():
@@ -57,6 +69,9 @@ def generateModules(python_objects):
                         f"Conflicting units: {[u for u in merged['unit'] if u]}"
                     )
                 merged['fun'][fun_name] = fun_decl
+                # Source positions of the function as (unit, TextViews)
+                if fun_name in obj.get('textViews', {}):
+                    merged['textViews'][fun_name] = (obj.get('unit'), obj['textViews'][fun_name])
         
         merged_objects.append(merged)
     return merged_objects
@@ -0,0 +1,121 @@
+from schema import EdgeType, NodeType
+from array import array
+from itertools import compress, repeat
+from operator import attrgetter, ge, lshift, or_
+
+# Edge ids are stored as uint16 in the binary format.
+MAX_NODE_ID = 0xFFFF
+
+def _columns(edges):
+    """Split the edge list into columns (src_id, sink_id, src_type, sink_type, type)"""
+    # ids are kept as 'q' so overflowing values survive until they are checked
+    src_ids = array('q', map(attrgetter('_src_id'), edges))
+    sink_ids = array('q', map(attrgetter('_sink_id'), edges))
+    src_types = bytes(map(attrgetter('_src_type._value_'), edges))
+    sink_types = bytes(map(attrgetter('_sink_type._value_'), edges))
+    types = bytes(map(attrgetter('_type._value_'), edges))
+    return src_ids, sink_ids, src_types, sink_types, types
+
+def _mask(column, *values):
+    """Return a byte mask which is 1 where the column holds one of the values"""
+    table = bytearray(256)
+    for value in values:
+        table[value] = 1
+    return column.translate(table)
+
+def _and(a, b):
+    """Combine two byte masks"""
+    return (int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+def _not(a):
+    """Invert a byte mask"""
+    return a.translate(bytes([1]) + bytes(255))
+
+def _node_keys(types, ids):
+    """Combine a type and an id column into one node key column"""
+    return map(or_, map(lshift, types, repeat(32)), ids)
+
+def _indices(mask):
+    """Return the edge indices selected by a byte mask"""
+    return compress(range(len(mask)), mask)
+
+def _textview_lookup(columns, textViews):
+    """Map node keys to their first TextView"""
+    src_ids, sink_ids, src_types, _, types = columns
+    lookup = {}
+    for i in _indices(_mask(types, EdgeType.TEXTVIEW.value)):
+        key = (src_types[i] << 32) | src_ids[i]
+        if key not in lookup and 0 <= sink_ids[i] < len(textViews):
+            lookup[key] = textViews[sink_ids[i]]
+    return lookup
+
+def validate_graph(graph, limit=10):
+    """
+    Checks the integrity of an abstract syntax graph.
+
+    All checks run column-wise over the edge list, which keeps the
+    validation cheap enough to run whenever a graph is loaded.
+
+    Checks:
+    - node ids must fit into uint16
+    - STRING edges must point to an ID inside the StringList
+    - TEXTVIEW edges must point inside the TextViewList
+    - PARENTCHILD edges must point to a node which exists in the graph
+
+    Args:
+        graph: Dictionary with 'edges', 'strings' and 'textViews'
+        limit: Maximum number of violations to report
+
+    Returns:
+        List of violations, each a dictionary with 'edge', 'message' and
+        'textView' (None if the node has no TextView). The list is empty
+        if the graph is well formed.
+    """
+    edges = graph['edges'].elements
+    strings = graph['strings'].elements
+    textViews = graph['textViews'].elements if graph.get('textViews') else []
+    columns = _columns(edges)
+    src_ids, sink_ids, src_types, sink_types, types = columns
+    found = {}
+
+    def name(i, types, ids):
+        return f"{NodeType(types[i]).name}-{ids[i]}"
+
+    def report(mask, message):
+        # Each check keeps its first violations, the merged result is cut to limit
+        for i, _ in zip(_indices(mask), range(limit)):
+            found.setdefault(i, message(i))
+
+    def out_of_range(ids, end):
+        return bytes(map(ge, ids, repeat(end)))
+
+    # Id overflow, only scanned in detail if the column range is exceeded
+    if edges and (max(src_ids) > MAX_NODE_ID or max(sink_ids) > MAX_NODE_ID
+                  or min(src_ids) < 0 or min(sink_ids) < 0):
+        overflow = bytes(not (0 <= s <= MAX_NODE_ID and 0 <= k <= MAX_NODE_ID)
+                         for s, k in zip(src_ids, sink_ids))
+        report(overflow, lambda i: f"Node id overflow: {name(i, src_types, src_ids)} --> {name(i, sink_types, sink_ids)}")
+
+    # STRING edges
+    is_string = _mask(types, EdgeType.STRING.value)
+    report(_and(is_string, _not(_mask(sink_types, NodeType.ID.value))),
+           lambda i: f"STRING edge of {name(i, src_types, src_ids)} points to {NodeType(sink_types[i]).name} instead of ID")
+    report(_and(is_string, out_of_range(sink_ids, len(strings))),
+           lambda i: f"STRING edge of {name(i, src_types, src_ids)} points past the StringList ({sink_ids[i]} >= {len(strings)})")
+
+    # TEXTVIEW edges
+    report(_and(_mask(types, EdgeType.TEXTVIEW.value), out_of_range(sink_ids, len(textViews))),
+           lambda i: f"TEXTVIEW edge of {name(i, src_types, src_ids)} points past the TextViewList ({sink_ids[i]} >= {len(textViews)})")
+
+    # PARENTCHILD edges, nodes only exist as the source of an edge
+    nodes = set(_node_keys(src_types, src_ids))
+    missing = _not(bytes(map(nodes.__contains__, _node_keys(sink_types, sink_ids))))
+    report(_and(_mask(types, EdgeType.PARENTCHILD.value), missing),
+           lambda i: f"PARENTCHILD edge {name(i, src_types, src_ids)} --> {name(i, sink_types, sink_ids)} has no sink node")
+
+    first = sorted(found)[:limit]
+    lookup = _textview_lookup(columns, textViews) if first and textViews else {}
+    return [{'edge': i,
+             'message': found[i],
+             'textView': lookup.get((src_types[i] << 32) | src_ids[i])}
+            for i in first]
@@ -0,0 +1,63 @@
+Feature: Graph Validation
+  As a compiler
+  I want to validate abstract syntax graphs
+  So that broken graphs are rejected before they reach the virtual machine
+
+  Scenario: Translated graph is well formed
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I validate the graph
+    Then the graph should have no violations
+
+  Scenario: STRING edge past the end of the StringList is reported
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I add a STRING edge pointing past the StringList
+    And I validate the graph
+    Then the graph should have 1 violation
+    And the violation message should contain "points past the StringList"
+
+  Scenario: Dangling PARENTCHILD edge is reported
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I add a PARENTCHILD edge to a missing FUNCTION node
+    And I validate the graph
+    Then the graph should have 1 violation
+    And the violation message should contain "has no sink node"
+
+  Scenario: Node id overflow is reported
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I add an edge with a node id above 65535
+    And I validate the graph
+    Then the graph should have 1 violation
+    And the violation message should contain "Node id overflow"
+
+  Scenario: Violations are reported with their TextView
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I add a STRING edge pointing past the StringList
+    And I add a TextView for the UNIT node
+    And I validate the graph
+    Then the violation should reference the TextView
+
+  Scenario: Number of reported violations is limited
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I add 5 PARENTCHILD edges to missing FUNCTION nodes
+    And I validate the graph with a limit of 3
+    Then the graph should have 3 violations
+
+  Scenario: Binary ASG keeps the graph
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I write and read the graph in the binary format
+    Then the graph should have no violations
+    And the read graph should equal the written graph
+
+  Scenario: Malformed binary ASG is rejected on load
+    Given a translated Python object
+    When I create a graph from the Python object
+    And I add a PARENTCHILD edge to a missing FUNCTION node
+    And I write and read the graph in the binary format
+    Then reading the graph should fail with "has no sink node"
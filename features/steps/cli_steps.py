@@ -0,0 +1,82 @@
+from behave import when, then
+import sys
+import os
+import shlex
+import subprocess
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+import xil
+import asg_utils
+from schema import Edge, NodeType, EdgeType
+
+XIL = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'xil.py'))
+
+
+@when('I run "{command}" in the project')
+def step_run_command(context, command):
+    """Run the xil command in a fresh interpreter with -X importtime in the project directory"""
+    args = shlex.split(command)
+    assert args[0] == 'xil', f"Not a xil command: {command}"
+    result = subprocess.run([sys.executable, '-X', 'importtime', XIL] + args[1:],
+                            cwd=os.path.dirname(context.project), capture_output=True, text=True, timeout=60)
+    context.command_result = result
+
+
+@when('a PARENTCHILD edge to a missing node is added to "{name}"')
+def step_break_graph(context, name):
+    """Append a PARENTCHILD edge to a FUNCTION node which doesn't exist to a built graph"""
+    path = os.path.join(os.path.dirname(context.project), name)
+    graph = asg_utils.read_asg(path)
+    graph['edges'].elements.append(Edge(src_id=1, sink_id=999, src_type=NodeType.STATEMENT,
+                                        sink_type=NodeType.FUNCTION, type=EdgeType.PARENTCHILD))
+    asg_utils.write_asg(graph, path)
+
+
+@then('the command should succeed')
+def step_command_succeeded(context):
+    """Verify the exit code of the command"""
+    result = context.command_result
+    assert result.returncode == 0, f"Exit code {result.returncode}: {result.stdout}{result.stderr[-2000:]}"
+
+
+@then('the command should fail')
+def step_command_failed(context):
+    """Verify the exit code of the command"""
+    assert context.command_result.returncode == 1, f"Exit code {context.command_result.returncode}"
+
+
+@then('the command output should contain "{text}"')
+def step_command_output(context, text):
+    """Verify the standard output of the command"""
+    assert text in context.command_result.stdout, context.command_result.stdout
+
+
+@then('the project should contain "{first}" and "{second}"')
+def step_project_files(context, first, second):
+    """Verify files written by the command"""
+    directory = os.path.dirname(context.project)
+    for name in (first, second):
+        assert os.path.exists(os.path.join(directory, name)), f"{name} is missing"
+
+
+@then('the command should not have imported "{first}", "{second}" or "{third}"')
+def step_not_imported(context, first, second, third):
+    """Verify the modules imported by the command, as reported by -X importtime"""
+    imported = set()
+    for line in context.command_result.stderr.splitlines():
+        if line.startswith('import time:') and line.count('|') == 2:
+            imported.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    unexpected = imported & {first, second, third}
+    assert not unexpected, f"Imported {sorted(unexpected)}"
+
+
+@then('the imports of the command should stay within the run budget')
+def step_import_budget(context):
+    """Verify the import time the command reported with --import-time"""
+    totals = [line for line in context.command_result.stderr.splitlines()
+              if line.startswith('import time:') and line.endswith('| total')]
+    assert totals, "No import report"
+    milliseconds = int(totals[-1].split('|')[0].split(':')[1]) / 1000
+    assert milliseconds <= xil.RUN_IMPORT_BUDGET_MS, \
+        f"Imports took {milliseconds:.1f} ms, the budget is {xil.RUN_IMPORT_BUDGET_MS} ms"
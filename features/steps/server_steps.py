@@ -0,0 +1,127 @@
+from behave import given, when, then
+import sys
+import os
+import tempfile
+import threading
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+import server
+
+LIBM = ctypes.util.find_library('m') or ctypes.util.find_library('c') or 'msvcrt.dll'
+
+PROJECT = """apiVersion: v1
+name: app
+description: VM server test
+type: application
+version: 1.0.0
+appVersion: 1.0.0
+files:
+  - app.xil
+"""
+
+
+@given('a xil project with the source')
+def step_xil_project(context):
+    """Write a xil.yaml project with one source file into a temporary directory"""
+    directory = tempfile.TemporaryDirectory()
+    context.add_cleanup(directory.cleanup)
+    context.project = os.path.join(directory.name, 'xil.yaml')
+    context.source = os.path.join(directory.name, 'app.xil')
+    with open(context.project, 'w', encoding='utf-8') as f:
+        f.write(PROJECT)
+    with open(context.source, 'w', encoding='utf-8') as f:
+        f.write(context.text.replace('{libm}', LIBM))
+
+
+@given('a running VM server with {workers:d} workers')
+def step_running_server(context, workers):
+    """Start a VM server on a temporary socket"""
+    context.socket_path = os.path.join(os.path.dirname(context.project), 'vm.sock')
+    vm_server = server.VMServer(context.socket_path, workers)
+    thread = threading.Thread(target=vm_server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        vm_server.shutdown()
+        thread.join()
+        vm_server.server_close()
+    context.add_cleanup(stop)
+
+
+def _run_request(context, mode='closure'):
+    return server.request({'op': 'run', 'files': [context.project], 'mode': mode}, context.socket_path)
+
+
+@when('I send a run request for the project')
+def step_send_run_request(context):
+    """Run the project on the server"""
+    context.response = _run_request(context)
+    assert context.response['ok'], context.response
+
+
+@when('I send a run request for the project in {mode} mode')
+def step_send_run_request_mode(context, mode):
+    """Run the project on the server in a mode, the response may be an error"""
+    context.response = _run_request(context, mode)
+
+
+@when('I send {count:d} run requests for the project at once')
+def step_send_concurrent_requests(context, count):
+    """Run the project several times in parallel"""
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        context.responses = list(pool.map(lambda _: _run_request(context), range(count)))
+
+
+@when('I change "{old}" to "{new}" in the source')
+def step_change_source(context, old, new):
+    """Edit the source file, the modification time has to change"""
+    with open(context.source, encoding='utf-8') as f:
+        content = f.read()
+    stat = os.stat(context.source)
+    with open(context.source, 'w', encoding='utf-8') as f:
+        f.write(content.replace(old, new))
+    os.utime(context.source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@then('the response should hold the stack "{values}"')
+def step_response_stack(context, values):
+    """Verify the stack of the only module"""
+    stacks = [[str(value) for value in result['stack']] for result in context.response['results']]
+    assert stacks == [[value.strip() for value in values.split(',')]], f"Unexpected response {context.response}"
+
+
+@then('the response should report the exit code {code:d}')
+def step_response_exit_code(context, code):
+    """Verify the exit code the only module passed to the builtin exit"""
+    codes = [result.get('exit') for result in context.response['results']]
+    assert codes == [code], f"Unexpected response {context.response}"
+
+
+@then('the response should report the error "{text}"')
+def step_response_error(context, text):
+    """Verify the request failed with an error"""
+    assert not context.response['ok'] and text in context.response['error'], f"Unexpected response {context.response}"
+
+
+@then('every response should hold the stack "{values}"')
+def step_responses_stack(context, values):
+    """Verify the stacks of all responses"""
+    expected = [[value.strip() for value in values.split(',')]]
+    for response in context.responses:
+        assert response['ok'], response
+        assert [[str(value) for value in result['stack']] for result in response['results']] == expected, response
+
+
+@then('the response should come from the cache')
+def step_response_cached(context):
+    """Verify the program was already warm"""
+    assert context.response['cached'], f"Expected a cached program, got {context.response}"
+
+
+@then('the response should not come from the cache')
+def step_response_not_cached(context):
+    """Verify the program was loaded for this request"""
+    assert not context.response['cached'], f"Expected a freshly loaded program, got {context.response}"
@@ -70,6 +70,24 @@ call=exit,0"""
     context.filename = "test.xil"
 
 
+@given('an XIL file with type and struct blocks')
+def step_xil_with_types(context):
+    """Create an XIL file with a type and two structs"""
+    context.xil_content = """[module app]
+[type integer32bit]
+bytes=4
+align=8
+
+[struct file_stats]
+u64=size
+
+[struct file]
+i32=bytes
+ptr=path
+embed=file_stats"""
+    context.filename = "test.xil"
+
+
 @given('an XIL file with a function containing a call statement')
 def step_xil_with_call(context):
     """Create an XIL file with a function containing a call statement"""
@@ -222,6 +240,21 @@ def step_function_has_return_type(context):
         assert 'returns' in func_decl, f"Function '{func_name}' should have 'returns' field"
 
 
+@then('the type should have its size and alignment')
+def step_type_has_size(context):
+    """Verify the bytes and align of the type block"""
+    types = context.translated_object['types']
+    assert types['integer32bit'] == {'bytes': 4, 'align': 8}, f"Type is {types['integer32bit']}"
+
+
+@then('the struct should list its fields and embedded structs')
+def step_struct_has_fields(context):
+    """Verify the fields of the struct block in declaration order"""
+    fields = context.translated_object['types']['file']['fields']
+    assert fields == [{'name': 'bytes', 'type': 'i32'}, {'name': 'path', 'type': 'ptr'},
+                      {'name': 'file_stats', 'type': 'file_stats', 'embed': True}], f"Fields are {fields}"
+
+
 @then('the function should contain a call statement')
 def step_function_has_call(context):
     """Verify the function contains a call statement"""
@@ -0,0 +1,109 @@
+from behave import when, then
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+import asg_utils
+from schema import Edge, NodeType, EdgeType, TextView
+
+
+@when('I add a STRING edge pointing past the StringList')
+def step_add_string_edge_past_end(context):
+    """Append a STRING edge with an out of range sink"""
+    strings = context.graph['strings'].elements
+    context.graph['edges'].elements.append(Edge(src_id=1, sink_id=len(strings) + 10, src_type=NodeType.UNIT, sink_type=NodeType.ID, type=EdgeType.STRING))
+
+
+@when('I add a PARENTCHILD edge to a missing FUNCTION node')
+def step_add_dangling_edge(context):
+    """Append a PARENTCHILD edge to a FUNCTION node which doesn't exist"""
+    context.graph['edges'].elements.append(Edge(src_id=1, sink_id=999, src_type=NodeType.STATEMENT, sink_type=NodeType.FUNCTION, type=EdgeType.PARENTCHILD))
+
+
+@when('I add {count:d} PARENTCHILD edges to missing FUNCTION nodes')
+def step_add_dangling_edges(context, count):
+    """Append several PARENTCHILD edges to FUNCTION nodes which don't exist"""
+    for i in range(count):
+        context.graph['edges'].elements.append(Edge(src_id=1, sink_id=900 + i, src_type=NodeType.STATEMENT, sink_type=NodeType.FUNCTION, type=EdgeType.PARENTCHILD))
+
+
+@when('I add an edge with a node id above 65535')
+def step_add_overflow_edge(context):
+    """Append an edge whose source id doesn't fit into uint16"""
+    context.graph['edges'].elements.append(Edge(src_id=70000, sink_id=0, src_type=NodeType.ID, sink_type=NodeType.ID, type=EdgeType.STRING))
+
+
+@when('I add a TextView for the UNIT node')
+def step_add_unit_textview(context):
+    """Attach a TextView to the UNIT node"""
+    textViews = context.graph['textViews'].elements
+    context.graph['edges'].elements.append(Edge(src_id=1, sink_id=len(textViews), src_type=NodeType.UNIT, sink_type=NodeType.ID, type=EdgeType.TEXTVIEW))
+    textViews.append(TextView(row=1, column=1))
+
+
+@when('I validate the graph')
+def step_validate_graph(context):
+    """Validate the graph"""
+    context.violations = asg_utils.validate_graph(context.graph)
+
+
+@when('I validate the graph with a limit of {limit:d}')
+def step_validate_graph_limit(context, limit):
+    """Validate the graph with a violation limit"""
+    context.violations = asg_utils.validate_graph(context.graph, limit=limit)
+
+
+@then('the graph should have no violations')
+def step_no_violations(context):
+    """Verify the graph is well formed"""
+    assert context.violations == [], f"Unexpected violations: {context.violations}"
+
+
+@then('the graph should have {count:d} violation')
+@then('the graph should have {count:d} violations')
+def step_violation_count(context, count):
+    """Verify the number of violations"""
+    assert len(context.violations) == count, f"Expected {count} violations, got {context.violations}"
+
+
+@then('the violation message should contain "{text}"')
+def step_violation_message(context, text):
+    """Verify the message of the first violation"""
+    assert text in context.violations[0]['message'], f"'{text}' not in '{context.violations[0]['message']}'"
+
+
+@then('the violation should reference the TextView')
+def step_violation_textview(context):
+    """Verify the violation carries the TextView of its node"""
+    textView = context.violations[0]['textView']
+    assert textView is not None, "Violation should reference a TextView"
+    assert textView.row == 1 and textView.column == 1
+
+
+@when('I write and read the graph in the binary format')
+def step_binary_round_trip(context):
+    """Serialize the graph and read it back with validation"""
+    try:
+        context.read_graph = asg_utils.asg_from_bytes(asg_utils.asg_to_bytes(context.graph))
+        context.read_error = None
+        context.violations = asg_utils.validate_graph(context.read_graph)
+    except ValueError as e:
+        context.read_graph = None
+        context.read_error = e
+
+
+@then('the read graph should equal the written graph')
+def step_read_graph_equal(context):
+    """Verify the round trip kept edges and strings"""
+    def edges(graph):
+        return [(e.src_id, e.sink_id, e.src_type, e.sink_type, e.type) for e in graph['edges'].elements]
+    assert edges(context.read_graph) == edges(context.graph)
+    assert context.read_graph['strings'].elements == context.graph['strings'].elements
+
+
+@then('reading the graph should fail with "{text}"')
+def step_read_graph_fails(context, text):
+    """Verify the malformed graph was rejected"""
+    assert context.read_error is not None, "Reading the graph should fail"
+    assert text in str(context.read_error), f"'{text}' not in '{context.read_error}'"
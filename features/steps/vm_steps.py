@@ -0,0 +1,683 @@
+from behave import given, when, then
+import sys
+import os
+import io
+import tempfile
+import threading
+import time
+import ctypes.util
+from contextlib import redirect_stdout
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+import translator
+import virtual_machine
+import asg_utils
+
+LIBRARIES = {
+    'libc': ctypes.util.find_library('c') or 'msvcrt.dll',
+    'libm': ctypes.util.find_library('m') or ctypes.util.find_library('c') or 'msvcrt.dll',
+}
+
+
+def _load_module(content):
+    """Translate xil content into a linked module"""
+    python_object = translator.translate('test.xil', content)
+    return asg_utils.generateModules([python_object])[0]
+
+
+@given('a xil program')
+def step_xil_program(context):
+    """Store a xil program, {libc} and {libm} are replaced by the platform libraries"""
+    content = context.text
+    for name, path in LIBRARIES.items():
+        content = content.replace('{' + name + '}', path)
+    context.xil_content = content
+    context.vm_results = {}
+
+
+@when('I run the program in {mode} mode')
+def step_run_program(context, mode):
+    """Run the main function of the program"""
+    module = _load_module(context.xil_content)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(output):
+        context.vm_results[mode] = virtual_machine.run(module, mode=mode)
+    context.vm_elapsed = time.perf_counter() - start
+    context.vm_stack = context.vm_results[mode]
+    context.vm_output = output.getvalue()
+
+
+@when('I run {count:d} executions of the program as tasks with a budget of {budget:d}')
+def step_run_tasks(context, count, budget):
+    """Link the program once and run its main function as concurrent tasks of one event loop"""
+    import asyncio
+    from virtual_machine.linker import _bind_ffi
+    from virtual_machine.scheduler import run_task
+    module = _load_module(context.xil_content)
+    with redirect_stdout(io.StringIO()):
+        image = virtual_machine.load(module, mode='task')
+    compiled, ffi_functions = image.functions, image.ffi_functions
+    blocking = frozenset([id(_bind_ffi(ffi_functions, 'usleep'))])
+
+    async def execution():
+        stack = [0, 0]
+        await run_task(compiled, 'main', ffi_functions, stack, blocking, budget)
+        return stack
+
+    async def executions():
+        return await asyncio.gather(*[execution() for _ in range(count)])
+
+    start = time.perf_counter()
+    context.task_stacks = asyncio.run(executions())
+    context.vm_elapsed = time.perf_counter() - start
+    context.vm_stack = context.task_stacks[0]
+
+
+@then('every task should leave the stack of the {mode} mode')
+def step_tasks_match(context, mode):
+    """Verify all tasks left the stack of a single run"""
+    for stack in context.task_stacks:
+        assert stack == context.vm_results[mode], f"Task stack {stack} differs from {context.vm_results[mode]}"
+
+
+@when('I run the program in {mode} mode until it exits')
+def step_run_program_until_exit(context, mode):
+    """Run main of the program and keep the exit code and the stack it left"""
+    module = _load_module(context.xil_content)
+    output = io.StringIO()
+    stack = [0, 0]
+    context.vm_exit_code = None
+    with redirect_stdout(output):
+        try:
+            virtual_machine.load(module, mode).execute('main', stack)
+        except SystemExit as e:
+            context.vm_exit_code = e.code
+    context.vm_results[mode] = context.vm_stack = stack
+    context.vm_output = output.getvalue()
+
+
+@then('running the program in {mode} mode should raise "{error}"')
+def step_run_program_raises(context, mode, error):
+    """Run main of the program and verify the name of the exception it raised"""
+    module = _load_module(context.xil_content)
+    raised = None
+    with redirect_stdout(io.StringIO()):
+        try:
+            virtual_machine.run(module, mode=mode)
+        except Exception as e:
+            raised = type(e).__name__
+    assert raised == error, f"Expected {error}, got {raised}"
+
+
+@then('the program should exit with code {code:d}')
+def step_exit_code(context, code):
+    """Verify the exit code of the last run"""
+    assert context.vm_exit_code == code, f"Expected exit code {code}, got {context.vm_exit_code}"
+
+
+@then('the output should contain "{text}"')
+def step_output_contains(context, text):
+    """Verify the text printed by the last run"""
+    assert text in context.vm_output, f"{text!r} not in {context.vm_output!r}"
+
+
+@then('function "{name}" should link "{callee}" to an intrinsic')
+def step_linked_intrinsic(context, name, callee):
+    """Verify a call is bound to the Python function of an intrinsic"""
+    from virtual_machine.bytecode import OP_CALL_FFI
+    with redirect_stdout(io.StringIO()):
+        code = virtual_machine.link_module(_load_module(context.xil_content))[name].code
+    targets = [a for op, a, _ in code if op == OP_CALL_FFI]
+    assert virtual_machine.INTRINSICS[callee] in targets, f"{callee} isn't bound in {code}"
+
+
+@when('I run the program in {mode} mode at opt level {level:d}')
+def step_run_program_optimized(context, mode, level):
+    """Run the main function of the program with the given optimization level"""
+    module = _load_module(context.xil_content)
+    with redirect_stdout(io.StringIO()):
+        context.vm_results[f"{mode} O{level}"] = virtual_machine.run(module, mode=mode, opt_level=level)
+    context.vm_stack = context.vm_results[f"{mode} O{level}"]
+
+
+@when('I link the program')
+def step_link_program(context):
+    """Link the program for the bytecode interpreter and keep the link error"""
+    module = _load_module(context.xil_content)
+    context.link_error = None
+    with redirect_stdout(io.StringIO()):
+        try:
+            virtual_machine.prepare(module, mode='bytecode')
+        except virtual_machine.LinkError as e:
+            context.link_error = e
+
+
+@then('linking should fail for "{name}" at row {row:d} column {column:d}')
+def step_link_error(context, name, row, column):
+    """Verify the unresolved call reported by the linker"""
+    assert context.link_error is not None, "Linking succeeded"
+    unresolved = [(callee, call_row, call_column)
+                  for _, call_row, call_column, _, callee in context.link_error.unresolved]
+    assert unresolved == [(name, row, column)], f"Unexpected link error {context.link_error}"
+
+
+@when('I run the program with late binding in {mode} mode')
+def step_run_program_late_binding(context, mode):
+    """Run the main function of the program, unknown calls are looked up when they run"""
+    module = _load_module(context.xil_content)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        context.vm_results[mode] = virtual_machine.run(module, mode=mode, late_binding=True)
+    context.vm_stack = context.vm_results[mode]
+    context.vm_output = output.getvalue()
+
+
+@then('the output should warn that function "{name}" was not found')
+def step_warned_not_found(context, name):
+    """Verify the warning of a late bound call of an unknown function"""
+    assert f"Warning: Function '{name}' not found" in context.vm_output, context.vm_output
+
+
+@then('function "{name}" should compile to {count:d} instructions without cmp and if')
+def step_optimized_instructions(context, name, count):
+    """Verify the optimized instructions of a function"""
+    from virtual_machine.bytecode import compile_module, OPCODE_NAMES
+    code = compile_module(_load_module(context.xil_content))[name].code
+    ops = [OPCODE_NAMES[op] for op, _, _ in code]
+    assert len(code) == count and 'cmp' not in ops and 'if' not in ops, f"Unexpected instructions {ops}"
+
+
+@when('I run the program from its binary ASG')
+def step_run_program_from_asg(context):
+    """Serialize the graph of the program and run it without the translator"""
+    python_object = translator.translate('test.xil', context.xil_content)
+    data = asg_utils.asg_to_bytes(translator.python_object_to_graph(python_object))
+    module = virtual_machine.load_graph_modules([asg_utils.asg_from_bytes(data)])[0]
+    output = io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(output):
+        context.vm_results['graph'] = virtual_machine.run(module)
+    context.vm_elapsed = time.perf_counter() - start
+    context.vm_stack = context.vm_results['graph']
+    context.vm_output = output.getvalue()
+
+
+@when('I run the program from its binary ASG with a compile cache')
+def step_run_program_cached(context):
+    """Run the graph of the program with a compile cache in a temporary directory"""
+    if not hasattr(context, 'cache_dir'):
+        context.cache_dir = tempfile.TemporaryDirectory()
+        context.add_cleanup(context.cache_dir.cleanup)
+        context.cache_runs = 0
+    python_object = translator.translate('test.xil', context.xil_content)
+    graph_path = os.path.join(context.cache_dir.name, 'test.xasg')
+    asg_utils.write_asg(translator.python_object_to_graph(python_object), graph_path)
+    module = virtual_machine.load_graph_modules([asg_utils.read_asg(graph_path)])[0]
+    context.compile_cache = virtual_machine.CompileCache(virtual_machine.cache_path(graph_path, module['module']))
+    context.cache_runs += 1
+    with redirect_stdout(io.StringIO()):
+        context.vm_results[f"cache {context.cache_runs}"] = virtual_machine.run(module, cache=context.compile_cache)
+    context.vm_stack = context.vm_results[f"cache {context.cache_runs}"]
+
+
+@then('the compile cache should have {hits:d} hits and {misses:d} misses')
+def step_compile_cache_hits(context, hits, misses):
+    """Verify how many functions were taken from the compile cache"""
+    cache = context.compile_cache
+    assert (cache.hits, cache.misses) == (hits, misses), f"Got {cache.hits} hits and {cache.misses} misses"
+
+
+@when('the line "{line}" is appended to the program')
+def step_append_line(context, line):
+    """Append a statement to the last function of the program"""
+    context.xil_content = context.xil_content.rstrip('\n') + '\n' + line + '\n'
+    context.vm_results = {}
+
+
+@when('I run the program with the profiler')
+def step_run_program_profiled(context):
+    """Run the main function of the program with a profiler"""
+    module = _load_module(context.xil_content)
+    context.profile = virtual_machine.Profiler()
+    with redirect_stdout(io.StringIO()):
+        context.vm_stack = virtual_machine.run(module, profile=context.profile)
+
+
+@when('I run the program with a tracer of capacity {capacity:d}')
+def step_run_program_traced(context, capacity):
+    """Run the main function of the program with a tracer"""
+    module = _load_module(context.xil_content)
+    context.tracer = virtual_machine.Tracer(capacity)
+    with redirect_stdout(io.StringIO()):
+        context.vm_stack = virtual_machine.run(module, profile=context.tracer)
+    context.trace = context.tracer.chrome_trace()['traceEvents']
+
+
+@when('I run the program with a tracer of capacity {capacity:d} on another thread')
+def step_run_program_traced_thread(context, capacity):
+    """Run the main function of the program with a tracer on a new thread, the trace is exported here"""
+    module = _load_module(context.xil_content)
+    context.tracer = virtual_machine.Tracer(capacity)
+
+    def traced():
+        context.traced_thread = threading.get_ident()
+        context.vm_stack = virtual_machine.run(module, profile=context.tracer)
+
+    with redirect_stdout(io.StringIO()):
+        thread = threading.Thread(target=traced)
+        thread.start()
+        thread.join()
+    context.trace = context.tracer.chrome_trace()['traceEvents']
+
+
+@then('every trace event should carry the id of that thread')
+def step_trace_thread(context):
+    """Verify the events name the thread they were recorded on, not the exporting one"""
+    tids = {event['tid'] for event in context.trace}
+    assert tids == {context.traced_thread}, f"Events of threads {tids}, traced on {context.traced_thread}"
+
+
+@when('I load the program in {mode} mode')
+def step_load_program(context, mode):
+    """Link the program into an image"""
+    context.vm_module = _load_module(context.xil_content)
+    context.vm_module_keys = set(context.vm_module)
+    with redirect_stdout(io.StringIO()):
+        context.vm_image = virtual_machine.load(context.vm_module, mode=mode)
+    context.vm_images = getattr(context, 'vm_images', []) + [context.vm_image]
+
+
+@when('I load the program again in {mode} mode')
+def step_load_program_again(context, mode):
+    """Link a freshly translated copy of the program into an image"""
+    step_load_program(context, mode)
+
+
+@when('{threads:d} threads run main of the image {runs:d} times each')
+def step_run_image_threads(context, threads, runs):
+    """Run main of one image from several threads at the same time"""
+    from concurrent.futures import ThreadPoolExecutor
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        return [context.vm_image.execute('main') for _ in range(runs)]
+
+    with ThreadPoolExecutor(threads) as pool:
+        context.thread_stacks = [stack for stacks in pool.map(lambda _: worker(), range(threads))
+                                 for stack in stacks]
+
+
+@when('I embed the program in {mode} mode')
+def step_embed_program(context, mode):
+    """Load the program and keep its functions as Python callables"""
+    with redirect_stdout(io.StringIO()):
+        context.vm_exports = virtual_machine.embed(_load_module(context.xil_content), mode)
+
+
+def _arguments(text):
+    return [] if text == 'no arguments' else [float(value) if '.' in value else int(value)
+                                               for value in text.split(',')]
+
+
+@then('calling "{name}" with a buffer of {size:d} bytes should return {result} and the buffer should read "{text}"')
+def step_call_embedded_buffer(context, name, size, result, text):
+    """Call an embedded function with a buffer of the linear memory and read it back"""
+    memory = virtual_machine.linear_memory()
+    buffer = memory.alloc(size)
+    actual = context.vm_exports[name](buffer)
+    data = bytes(memory.view(buffer, size)).split(b'\0', 1)[0]
+    memory.free(buffer)
+    assert repr(actual) == result, f"Expected {result}, got {actual!r}"
+    assert data == text.encode('utf-8'), f"Buffer holds {data!r}"
+
+
+@then('type "{name}" should take {size:d} bytes aligned to {align:d}')
+def step_type_layout(context, name, size, align):
+    """Verify the size and alignment of a declared type and of its structure"""
+    layout = context.vm_image.layouts.get(name)
+    assert (layout.size, layout.align) == (size, align), f"Layout is {layout}"
+    structure = context.vm_image.structure(name)
+    assert ctypes.sizeof(structure) == size, "Structure size differs from the layout"
+    assert ctypes.alignment(structure) == align, f"Structure is aligned to {ctypes.alignment(structure)}"
+
+
+@then('the fields of "{name}" should be at "{offsets}"')
+def step_field_offsets(context, name, offsets):
+    """Verify the field offsets of a struct, members of embedded structs included"""
+    expected = {field: int(offset) for field, offset in (item.strip().split('@') for item in offsets.split(','))}
+    layout = context.vm_image.layouts.get(name)
+    assert layout.offsets == expected, f"Offsets are {layout.offsets}"
+    structure = context.vm_image.structure(name)
+    actual = {field: getattr(structure, field).offset for field in expected if field in dict(structure._fields_)}
+    assert all(actual[field] == expected[field] for field in actual), f"Structure offsets are {actual}"
+    assert context.vm_image.structure(name) is structure, "The structure should be built once"
+
+
+@then('the types should survive a binary ASG round trip')
+def step_types_round_trip(context):
+    """Load the types of the program back from its binary ASG"""
+    python_object = translator.translate('test.xil', context.xil_content)
+    data = asg_utils.asg_to_bytes(translator.python_object_to_graph(python_object))
+    module = virtual_machine.load_graph_modules([asg_utils.asg_from_bytes(data)])[0]
+    assert module['types'] == python_object['types'], f"Loaded {module['types']}"
+
+
+@then('the struct returned by "{name}" for {args} should hold "{fields}"')
+def step_returned_struct(context, name, args, fields):
+    """Call an embedded function which returns a struct by value"""
+    result = context.vm_exports[name](*_arguments(args))
+    actual = ', '.join(f"{field}={getattr(result, field)}" for field, _ in result._fields_)
+    assert actual == fields, f"Struct holds {actual}"
+
+
+@then('the linked function "{name}" should keep its arena alive')
+def step_arena_alive(context, name):
+    """Link the program on its own and read its strings after the constants are gone"""
+    import gc
+    from virtual_machine.bytecode import OPERAND_CONSTPROP, _map_operands
+    with redirect_stdout(io.StringIO()):
+        func = virtual_machine.link_module(_load_module(context.xil_content))[name]
+    gc.collect()
+    # Reuse the memory of freed objects
+    garbage = [bytes([88]) * 16 for _ in range(10000)]
+    addresses = []
+    for instruction in func.code:
+        _map_operands(instruction, lambda operand: addresses.append(operand[1])
+                      if operand[0] == OPERAND_CONSTPROP else None)
+    del garbage
+    assert func.arena is not None, "The function doesn't reference its arena"
+    for address in addresses:
+        assert ctypes.string_at(address) == b'shared', f"{address} reads {ctypes.string_at(address)!r}"
+
+
+@given('a linear memory of {size:d} bytes')
+def step_linear_memory(context, size):
+    """Create a memory apart from the one of the process"""
+    context.memory = virtual_machine.Memory(size)
+    context.buffers = []
+
+
+@given('a linear memory of {size:d} bytes reserving {reserve:d} bytes')
+def step_linear_memory_reserve(context, size, reserve):
+    """Create a memory apart from the one of the process which can't grow beyond reserve"""
+    context.memory = virtual_machine.Memory(size, reserve)
+    context.buffers = []
+
+
+@when('I allocate {count:d} buffers of {size:d} bytes')
+def step_allocate_buffers(context, count, size):
+    """Allocate buffers in the memory of the scenario"""
+    context.buffers.extend(context.memory.alloc(size) for _ in range(count))
+
+
+@when('I take the address of buffer {index:d}')
+def step_take_address(context, index):
+    """Keep the real address of a buffer like native code would"""
+    context.buffer_address = context.memory.address + context.buffers[index]
+
+
+@when('native code writes "{text}" at the address taken before')
+def step_write_address(context, text):
+    """Write a text through the kept address, bypassing the memory"""
+    data = text.encode('utf-8')
+    ctypes.memmove(context.buffer_address, data, len(data))
+
+
+@then('the memory should not have moved')
+def step_memory_not_moved(context):
+    """Verify the kept address still points into the memory"""
+    buffer = context.buffers[0]
+    assert context.memory.address + buffer == context.buffer_address, "The memory moved when it grew"
+
+
+@then('allocating a buffer of {size:d} bytes should fail with a MemoryError')
+def step_alloc_fails(context, size):
+    """Verify the memory refuses to grow beyond its reserved size"""
+    try:
+        context.memory.alloc(size)
+    except MemoryError:
+        return
+    raise AssertionError("The allocation succeeded")
+
+
+@when('I write "{text}" into buffer {index:d}')
+def step_write_buffer(context, text, index):
+    """Write a text into a buffer through a view"""
+    data = text.encode('utf-8')
+    context.memory.view(context.buffers[index], len(data))[:] = data
+
+
+@then('the memory should have grown to {size:d} bytes')
+def step_memory_capacity(context, size):
+    """Verify the capacity of the memory"""
+    assert context.memory.capacity == size, f"Memory has {context.memory.capacity} bytes"
+
+
+@then('buffer {index:d} should read "{text}"')
+def step_read_buffer(context, index, text):
+    """Verify the bytes of a buffer"""
+    data = bytes(context.memory.view(context.buffers[index], len(text)))
+    assert data == text.encode('utf-8'), f"Buffer holds {data!r}"
+
+
+@when('I free every second buffer')
+def step_free_second_buffers(context):
+    """Free the buffers with an even index"""
+    context.freed = context.buffers[::2]
+    for buffer in context.freed:
+        context.memory.free(buffer)
+    context.buffers = [None if index % 2 == 0 else buffer for index, buffer in enumerate(context.buffers)]
+
+
+@then('the new buffer should take the place of buffer 0')
+def step_reused_buffer(context):
+    """Verify the first fit allocator reused the first freed buffer"""
+    assert context.buffers[-1] == context.freed[0], f"Got {context.buffers[-1]}, expected {context.freed[0]}"
+
+
+@when('I free all buffers')
+def step_free_all_buffers(context):
+    """Free the buffers which are still allocated"""
+    for buffer in context.buffers:
+        if buffer is not None:
+            context.memory.free(buffer)
+
+
+@then('the memory should be empty')
+def step_memory_empty(context):
+    """Verify no buffer is allocated and no free block is left below the top"""
+    memory = context.memory
+    assert not memory.sizes and not memory.free_blocks, (memory.sizes, memory.free_blocks)
+
+
+@then('calling "{name}" with {arguments} {times:d} times should return {result} each time')
+def step_call_embedded_repeatedly(context, name, arguments, times, result):
+    """Verify repeated calls of an embedded function"""
+    function = context.vm_exports[name]
+    results = {repr(function(*_arguments(arguments))) for _ in range(times)}
+    assert results == {result}, f"Expected {result}, got {results}"
+
+
+@then('calling "{name}" with {arguments} should return {result}')
+def step_call_embedded(context, name, arguments, result):
+    """Verify the result of an embedded function"""
+    actual = context.vm_exports[name](*_arguments(arguments))
+    assert repr(actual) == result, f"Expected {result}, got {actual!r}"
+
+
+@then('every thread should leave the stack of the {mode} mode')
+def step_threads_match(context, mode):
+    """Verify all runs of the threads left the stack of a single run"""
+    expected = context.vm_results[mode]
+    for stack in context.thread_stacks:
+        assert stack == expected, f"Thread stack {stack} differs from {expected}"
+
+
+@then('the arena should hold {count:d} strings in {size:d} bytes')
+def step_arena_size(context, count, size):
+    """Verify the strings materialized into the arena of the image"""
+    from virtual_machine.arena import ARENA_KEY
+    arena = context.vm_image.constants[ARENA_KEY]
+    assert (len(arena.offsets), len(arena)) == (count, size), f"Arena holds {arena.offsets} in {len(arena)} bytes"
+
+
+@then('the .ptr operands of function "{name}" should be addresses in the arena')
+def step_arena_operands(context, name):
+    """Verify .ptr operands were replaced by immediate addresses"""
+    import ctypes
+    from virtual_machine.arena import ARENA_KEY
+    from virtual_machine.bytecode import OPERAND_CONSTPROP, _map_operands
+    arena = context.vm_image.constants[ARENA_KEY]
+    addresses = []
+    for instruction in context.vm_image.functions[name].code:
+        _map_operands(instruction, lambda operand: addresses.append(operand[1])
+                      if operand[0] == OPERAND_CONSTPROP else None)
+    assert addresses and all(isinstance(address, int) for address in addresses), addresses
+    for address in addresses:
+        assert arena.address <= address < arena.address + len(arena), f"{address} is outside of the arena"
+        assert ctypes.string_at(address) == b'shared'
+
+
+@then("the module shouldn't be changed by loading it")
+def step_module_unchanged(context):
+    """Verify load() didn't add keys to the module"""
+    assert set(context.vm_module) == context.vm_module_keys, set(context.vm_module) - context.vm_module_keys
+
+
+@then('the last run should take less than {milliseconds:d} ms')
+def step_run_time(context, milliseconds):
+    """Verify the wall clock time of the last run"""
+    assert context.vm_elapsed * 1000 < milliseconds, f"The run took {context.vm_elapsed * 1000:.0f} ms"
+
+
+@then('the stack should be "{values}"')
+def step_stack_should_be(context, values):
+    """Verify the value stack after main returned"""
+    expected = [value.strip() for value in values.split(',')] if values else []
+    actual = [str(value) for value in context.vm_stack]
+    assert actual == expected, f"Expected stack {expected}, got {actual}"
+
+
+@then('the stack should have {count:d} values')
+def step_stack_size(context, count):
+    """Verify the number of values on the stack"""
+    assert len(context.vm_stack) == count, f"Expected {count} values, got {len(context.vm_stack)}"
+
+
+@then('all modes should leave the same stack')
+def step_modes_match(context):
+    """Verify every executed mode left the same stack"""
+    results = list(context.vm_results.items())
+    assert len(results) > 1, "At least two modes have to be executed"
+    reference_mode, reference = results[0]
+    for mode, stack in results[1:]:
+        assert stack == reference, f"{mode} stack {stack} differs from {reference_mode} stack {reference}"
+
+
+@when('I index the basic blocks of function "{name}"')
+def step_index_blocks(context, name):
+    """Build the block index of a function"""
+    module = _load_module(context.xil_content)
+    context.blocks = virtual_machine.build_block_index(module['fun'][name])
+
+
+@then('the function should have {count:d} basic blocks')
+def step_block_count(context, count):
+    """Verify the number of basic blocks"""
+    assert len(context.blocks.block_starts) == count, f"Expected {count} blocks, got {context.blocks}"
+
+
+@then('the if statement should jump to block {block_id:d}')
+def step_if_target(context, block_id):
+    """Verify the jump target of the only if statement"""
+    targets = list(context.blocks.jump_targets.values())
+    assert targets == [block_id], f"Expected jump to block {block_id}, got {targets}"
+
+
+@then('the function should have {count:d} decl statement')
+def step_decl_count(context, count):
+    """Verify the number of indexed decl statements"""
+    assert len(context.blocks.decls) == count, f"Expected {count} decls, got {context.blocks.decls}"
+
+
+@then('all stack values should be equal')
+def step_stack_values_equal(context):
+    """Verify the stack holds the same value several times"""
+    assert len(context.vm_stack) > 1, f"Expected several values, got {context.vm_stack}"
+    assert len(set(context.vm_stack)) == 1, f"Expected equal values, got {context.vm_stack}"
+
+
+@then('both runs should call the same foreign function "{name}"')
+def step_shared_foreign_function(context, name):
+    """Verify the resolved foreign function is shared between modules"""
+    first, second = context.vm_images[-2:]
+    assert first.module is not second.module
+    assert first.ffi_functions[name] is second.ffi_functions[name], "Foreign function should be resolved once per process"
+
+
+@then('the profile should count {count:d} calls of function "{name}"')
+def step_profile_function_calls(context, count, name):
+    """Verify the recorded calls of a xil function"""
+    record = context.profile.functions[name]
+    assert record['calls'] == count, f"Expected {count} calls, got {record}"
+    assert record['inclusive'] >= record['exclusive'] >= 0, f"Inconsistent times {record}"
+
+
+@then('the profile should count {count:d} calls of foreign function "{name}"')
+def step_profile_ffi_calls(context, count, name):
+    """Verify the recorded calls of a FFI function"""
+    record = context.profile.ffi[name]
+    assert record['calls'] == count, f"Expected {count} calls, got {record}"
+
+
+@then('the profile should count {count:d} executed "{opcode}" instructions')
+def step_profile_opcodes(context, count, opcode):
+    """Verify the number of executed instructions of an opcode"""
+    assert context.profile.opcodes[opcode] == count, f"Expected {count}, got {context.profile.opcodes}"
+
+
+@then('the profile should survive a JSON round trip')
+def step_profile_json(context):
+    """Verify the JSON dump holds the same profile as the table"""
+    import json
+    assert json.loads(context.profile.to_json()) == context.profile.as_dict()
+    assert 'step' in context.profile.table()
+
+
+@then('the trace should hold {count:d} events')
+def step_trace_events(context, count):
+    """Verify the number of events in the trace"""
+    assert len(context.trace) == count, f"Expected {count} events, got {context.trace}"
+
+
+@then('the trace should have dropped {count:d} events')
+def step_trace_dropped(context, count):
+    """Verify the number of events overwritten in the ring"""
+    assert context.tracer.dropped == count, f"Expected {count} dropped events, got {context.tracer.dropped}"
+
+
+@then('the trace should enter function "{name}" at row {row:d} column {column:d}')
+def step_trace_enter(context, name, row, column):
+    """Verify a function entry event and its source position"""
+    events = [event for event in context.trace if event['ph'] == 'B' and event['name'] == name]
+    assert events, f"No entry of {name} in {context.trace}"
+    assert events[0]['args'] == {'unit': 'test.xil', 'function': name, 'row': row, 'column': column}, events[0]
+
+
+@then('the trace should call "{name}" at row {row:d} column {column:d}')
+def step_trace_ffi(context, name, row, column):
+    """Verify a FFI call event and the source position of the call"""
+    events = [event for event in context.trace if event['ph'] == 'X' and event['name'] == name]
+    assert events, f"No call of {name} in {context.trace}"
+    assert (events[0]['args']['row'], events[0]['args']['column']) == (row, column), events[0]
+    assert events[0]['dur'] >= 0
+
+
+@then('the folded stacks should contain "{stack}"')
+def step_folded_stacks(context, stack):
+    """Verify a stack of the flame graph input"""
+    stacks = [line.rsplit(' ', 1)[0] for line in context.tracer.folded_stacks().splitlines()]
+    assert stack in stacks, f"Expected {stack} in {stacks}"
@@ -37,6 +37,12 @@ Feature: XIL Translation
     And the function should have arguments
     And the function should have a return type
 
+  Scenario: Type and struct blocks are parsed correctly
+    Given an XIL file with type and struct blocks
+    When I translate the XIL content
+    Then the type should have its size and alignment
+    And the struct should list its fields and embedded structs
+
   Scenario: Function with call statement is parsed correctly
     Given an XIL file with a function containing a call statement
     When I translate the XIL content
@@ -0,0 +1,943 @@
+Feature: Virtual Machine
+  As a developer
+  I want to execute translated xil modules
+  So that I can run xil programs without a native toolchain
+
+  Scenario: FFI call results are pushed on the stack
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 5, 2
+      """
+    When I run the program in bytecode mode
+    Then the stack should be "3.0"
+
+  Scenario: Loops with cmp and if count down
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 10, 0
+      move=n
+      label=loop
+      call=fdim, n, 1
+      move=n
+      cmp=n, 0
+      if=0, loop
+      call=fdim, n, 0
+      """
+    When I run the program in bytecode mode
+    Then the stack should be "0.0"
+    When I run the program in closure mode
+    Then the stack should be "0.0"
+
+  Scenario: Closure mode matches the bytecode interpreter on jumps
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun twice]
+      decl=(a:f64, a:f64)void
+      call=fdim, a, 0
+
+      [fun countdown]
+      decl=(n:f64)void
+      cmp=n, 0
+      if=1, done
+      call=fdim, n, 1
+      move=n
+      call=countdown, n
+      label=done
+      call=fdim, n, 0
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=countdown, 3
+      call=twice, 4, 6
+      cmp=argn, 0
+      if=0, end
+      call=fdim, 1, 0
+      move=
+      label=end
+      if=1, nowhere
+      """
+    When I run the program in bytecode mode
+    And I run the program in closure mode
+    Then all modes should leave the same stack
+
+  Scenario: Calls are bound at link time
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 5, 2
+      call=missing, 1
+      call=fdim, 4, 0
+      """
+    When I link the program
+    Then linking should fail for "missing" at row 12 column 1
+    When I run the program with late binding in reference mode
+    And I run the program with late binding in bytecode mode
+    And I run the program with late binding in closure mode
+    Then all modes should leave the same stack
+    And the stack should be "3.0, 4.0"
+    And the output should warn that function "missing" was not found
+
+  Scenario: Async foreign functions overlap until their result is used
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libc}"]
+      usleep="usleep"
+      abs="abs"
+
+      [ffi]
+      usleep=async (us:u32)i32
+      abs=(x:i32)i32
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=usleep, 100000
+      move=a
+      call=usleep, 100000
+      move=b
+      call=usleep, 100000
+      move=c
+      call=abs, a
+      cmp=b, 0
+      if=0, end
+      call=abs, c
+      label=end
+      call=abs, -4
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode
+    Then the last run should take less than 250 ms
+    When I run the program in closure mode
+    Then the last run should take less than 250 ms
+    When I run the program from its binary ASG
+    Then the last run should take less than 250 ms
+    And all modes should leave the same stack
+    And the stack should be "0, 0, 4"
+
+  Scenario: An async call whose result is never read still reports its error
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libc}"]
+      usleep="usleep"
+      abs="abs"
+
+      [ffi]
+      usleep=async (us:u32)i32
+      abs=(x:i32)i32
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=usleep, never
+      move=unread
+      call=abs, -4
+      """
+    Then running the program in reference mode should raise "ArgumentError"
+    And running the program in bytecode mode should raise "ArgumentError"
+    And running the program in closure mode should raise "ArgumentError"
+    And running the program in task mode should raise "ArgumentError"
+
+  Scenario: Async foreign functions without a result push nothing
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libc}"]
+      usleep="usleep"
+      abs="abs"
+
+      [ffi]
+      usleep=async (us:u32)void
+      abs=(x:i32)i32
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=abs, -7
+      call=usleep, 1000
+      move=done
+      call=abs, done
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode
+    And I run the program in closure mode
+    And I run the program in task mode
+    Then all modes should leave the same stack
+    And the stack should be "7"
+
+  Scenario: Many executions run as tasks of one event loop
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libc}"]
+      usleep="usleep"
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      usleep=async (us:u32)i32
+      fdim=(x:f64, y:f64)f64
+
+      [fun dec]
+      decl=(n:f64)void
+      call=fdim, n, 1
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=usleep, 30000
+      move=slept
+      call=fdim, 30, 0
+      move=n
+      label=loop
+      call=dec, n
+      move=n
+      cmp=n, 0
+      if=0, loop
+      call=fdim, slept, n
+      call=usleep, 30000
+      """
+    When I run the program in bytecode mode
+    And I run 20 executions of the program as tasks with a budget of 7
+    Then every task should leave the stack of the bytecode mode
+    And the stack should be "0.0, 0"
+    And the last run should take less than 600 ms
+
+  Scenario: Threads run functions of one loaded image at the same time
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun down]
+      decl=(n:f64)void
+      cmp=n, 0
+      if=1, done
+      call=fdim, n, 1
+      move=n
+      call=down, n
+      label=done
+      call=fdim, n, 0
+
+      [fun count]
+      decl=(n:f64)void
+      label=loop
+      call=fdim, n, 1
+      move=n
+      cmp=n, 0
+      if=0, loop
+      const=text, "done"
+      call=fdim, text.bytes, n
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=down, 20
+      call=count, 50
+      """
+    When I run the program in reference mode
+    And I load the program in bytecode mode
+    And 8 threads run main of the image 20 times each
+    Then every thread should leave the stack of the reference mode
+    And the module shouldn't be changed by loading it
+    When I load the program in closure mode
+    And 8 threads run main of the image 20 times each
+    Then every thread should leave the stack of the reference mode
+    When I load the program in reference mode
+    And 8 threads run main of the image 20 times each
+    Then every thread should leave the stack of the reference mode
+    And the module shouldn't be changed by loading it
+
+  Scenario: Python calls xil functions through the embedding API
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun sub]
+      decl=(a:f64, b:f64)void
+      call=fdim, a, b
+
+      [fun pair]
+      decl=(a:f64, b:f64)void
+      call=fdim, a, b
+      call=fdim, b, a
+
+      [fun down]
+      decl=(n:f64)void
+      cmp=n, 0
+      if=1, done
+      call=fdim, n, 1
+      move=n
+      call=down, n
+      label=done
+
+      [fun nothing]
+      cmp=1, 1
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=sub, 3, 1
+      """
+    When I embed the program in closure mode
+    Then calling "sub" with 7, 2 should return 5.0
+    And calling "sub" with 7, 2 1000 times should return 5.0 each time
+    And calling "pair" with 1, 4 should return (0.0, 3.0)
+    And calling "down" with 5 should return None
+    And calling "nothing" with no arguments should return None
+    And calling "sub" with 9, 7, 2 should return (9, 5.0)
+    When I embed the program in bytecode mode
+    Then calling "sub" with 7, 2 should return 5.0
+    And calling "pair" with 1, 4 should return (0.0, 3.0)
+    And calling "sub" with 9, 7, 2 should return (9, 5.0)
+    When I embed the program in reference mode
+    Then calling "pair" with 1, 4 should return (0.0, 3.0)
+    And calling "sub" with 9, 7, 2 should return (9, 5.0)
+
+  Scenario: The builtin module provides intrinsics without a library
+    Given a xil program
+      """
+      [module app]
+
+      [use builtin]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      const=hello, "Hello world!"
+      call=print, hello.ptr, hello.bytes
+      call=strlen, hello.ptr
+      move=length
+      call=print, hello.ptr, 5
+      call=strlen, hello.ptr
+      cmp=length, 12
+      if=0, wrong
+      call=exit, 0
+      label=wrong
+      call=exit, 3
+      """
+    When I run the program in reference mode until it exits
+    Then the program should exit with code 0
+    And the output should contain "Hello world!Hello"
+    When I run the program in bytecode mode until it exits
+    Then the program should exit with code 0
+    When I run the program in closure mode until it exits
+    Then the program should exit with code 0
+    And the output should contain "Hello world!Hello"
+    And all modes should leave the same stack
+    And the stack should be "12"
+    And function "main" should link "print" to an intrinsic
+
+    Given a xil program
+      """
+      [module app]
+
+      [use builtin]
+
+      [fun print]
+      decl=(text:ptr, bytes:i32)void
+      call=strlen, text
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      const=text, "four"
+      call=print, text.ptr, text.bytes
+      """
+    When I run the program in reference mode
+    And I run the program in closure mode
+    Then all modes should leave the same stack
+    And the stack should be "4"
+
+    Given a xil program
+      """
+      [module app]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=strlen, "abc"
+      """
+    When I link the program
+    Then linking should fail for "strlen" at row 5 column 1
+
+    Given a xil program
+      """
+      [module app]
+
+      [use builtin]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=exit, 2
+      call=strlen, "unreachable"
+      """
+    Then function "main" should compile to 1 instructions without cmp and if
+    When I run the program in closure mode until it exits
+    Then the program should exit with code 2
+
+  Scenario: Deep xil call chains don't overflow the Python stack
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun down]
+      decl=(n:f64)void
+      cmp=n, 0
+      if=1, done
+      call=fdim, n, 1
+      move=n
+      call=down, n
+      label=done
+      call=fdim, n, 0
+
+      [fun tail]
+      decl=(n:f64)void
+      cmp=n, 0
+      if=1, done
+      call=fdim, n, 1
+      move=n
+      call=tail, n
+      label=done
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=down, 5000
+      call=tail, 20000
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode
+    And I run the program in closure mode
+    And I run the program in task mode
+    Then all modes should leave the same stack
+    And the stack should have 5001 values
+
+  Scenario: The optimizer folds, fuses and threads compares and jumps
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      cmp=1, 1
+      if=0, skip
+      call=fdim, 1, 0
+      label=skip
+      cmp=2, 1
+      if=0, over
+      call=fdim, 99, 0
+      label=over
+      cmp=argn, 0
+      if=1, hop
+      call=fdim, 3, 0
+      label=hop
+      cmp=1, 2
+      if=0, end
+      call=fdim, 98, 0
+      label=end
+      call=fdim, 4, 0
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode at opt level 0
+    And I run the program in bytecode mode at opt level 1
+    And I run the program in closure mode at opt level 1
+    Then all modes should leave the same stack
+    And the stack should be "1.0, 4.0"
+    And function "main" should compile to 4 instructions without cmp and if
+
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun sub]
+      decl=(a:f64, b:f64)void
+      call=fdim, a, b
+      move=result
+      cmp=result, 2
+      if=1, small
+      call=fdim, result, 0
+      label=small
+      const=text, "done"
+      call=fdim, text.bytes, 0
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=sub, 7, 1
+      call=sub, 3, 2
+      cmp=argn, 0
+      if=0, missing
+      call=fdim, 1, 0
+      label=missing
+      call=fdim, 2, 0
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode
+    And I run the program in closure mode
+    And I run the program from its binary ASG
+    Then all modes should leave the same stack
+
+  Scenario: A folded compare before an undecided if runs alike in every tier
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(x:f64)void
+      const=x, 1
+      cmp=2, 1
+      if=x, skip
+      call=fdim, 3, 1
+      label=skip
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode at opt level 1
+    And I run the program in task mode
+    And I run the program in closure mode at opt level 0
+    And I run the program in closure mode at opt level 1
+    Then all modes should leave the same stack
+    And the stack should be "0, 2.0"
+
+  Scenario: Compiled functions are cached on disk between runs
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libc}"]
+      strlen="strlen"
+
+      [ffi]
+      strlen=(s:ptr)u64
+
+      [fun measure]
+      decl=(n:i64)void
+      const=text, "hello"
+      call=strlen, text.ptr
+      cmp=n, 0
+      if=1, short
+      const=text, "hi"
+      label=short
+      call=strlen, text.ptr
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=measure, 1
+      call=measure, 0
+      """
+    When I run the program in reference mode
+    And I run the program from its binary ASG with a compile cache
+    Then the compile cache should have 0 hits and 2 misses
+    When I run the program from its binary ASG with a compile cache
+    Then the compile cache should have 2 hits and 0 misses
+    And all modes should leave the same stack
+    And the stack should be "5, 2, 5, 5"
+    When the line "call=measure, 0" is appended to the program
+    And I run the program from its binary ASG with a compile cache
+    Then the compile cache should have 1 hits and 1 misses
+    And the stack should be "5, 2, 5, 5, 5, 5"
+
+  Scenario: Literal operands are classified by kind
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      const=text, "four"
+      call=fdim, 2.5, 0.5
+      call=fdim, text.bytes, -1
+      call=fdim, argn, -3
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode
+    And I run the program in closure mode
+    And I run the program from its binary ASG
+    Then all modes should leave the same stack
+    And the stack should be "2.0, 5.0, 3.0"
+
+  Scenario: Basic blocks are indexed per function
+    Given a xil program
+      """
+      [module app]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      cmp=argn, 0
+      if=1, noArgs
+      call=exit, 0
+      label=noArgs
+      call=exit, 1
+      """
+    When I index the basic blocks of function "main"
+    Then the function should have 3 basic blocks
+    And the if statement should jump to block 2
+    And the function should have 1 decl statement
+
+  Scenario: Call arguments are passed like the reference interpreter
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun pair]
+      decl=(a:f64, b:f64)void
+      call=fdim, a, b
+
+      [fun nodecl]
+      call=fdim, 9, 1
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=pair, 8, 3
+      call=pair, 1, 7, 2
+      call=nodecl, 4
+      call=pair, 5
+      move=last
+      call=fdim, last, 0
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode
+    And I run the program in closure mode
+    And I run the program from its binary ASG
+    Then all modes should leave the same stack
+
+  Scenario: String constants share one buffer
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libc}"]
+      strchr="strchr"
+
+      [ffi]
+      strchr=(s:ptr, c:i32)ptr
+
+      [fun other]
+      const=text, "shared"
+      call=strchr, text.ptr, 0
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      const=text, "shared"
+      call=strchr, text.ptr, 0
+      call=other
+      call=other
+      """
+    When I run the program in bytecode mode
+    Then all stack values should be equal
+    When I run the program in reference mode
+    Then all stack values should be equal
+    When I run the program in closure mode
+    Then all stack values should be equal
+
+  Scenario: String constants are stored once in a read-only arena
+    Given a xil program
+      """
+      [module app]
+
+      [use builtin]
+
+      [fun other]
+      const=text, "shared"
+      call=strlen, text.ptr
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      const=text, "shared"
+      call=strlen, text.ptr
+      const=greeting, "hi"
+      call=strlen, greeting.ptr
+      const=greeting, "hello"
+      call=strlen, greeting.ptr
+      call=other
+      """
+    When I run the program in reference mode
+    And I run the program in bytecode mode
+    And I run the program in closure mode
+    And I run the program from its binary ASG
+    Then all modes should leave the same stack
+    And the stack should be "6, 2, 5, 6"
+    When I load the program in closure mode
+    Then the arena should hold 3 strings in 16 bytes
+    And the .ptr operands of function "other" should be addresses in the arena
+    And the linked function "other" should keep its arena alive
+    When I run the program with the profiler
+    Then the stack should be "6, 2, 5, 6"
+
+  Scenario: Native code writes into buffers of the linear memory
+    Given a xil program
+      """
+      [module app]
+
+      [use builtin]
+
+      [lib "{libc}"]
+      strcpy="strcpy"
+      strlen="strlen"
+
+      [ffi]
+      strcpy=(destination:ptr, source:ptr)ptr
+      strlen=(text:ptr)u64
+
+      [fun fill]
+      decl=(buffer:ptr)void
+      const=text, "zero copy"
+      call=strcpy, buffer, text.ptr
+      move=copied
+      call=memset, buffer, 65, 4
+      call=strlen, buffer
+
+      [fun scratch]
+      call=alloc, 16
+      move=buffer
+      const=text, "ok"
+      call=strcpy, buffer, text.ptr
+      move=copied
+      call=strlen, buffer
+      call=free, buffer
+      """
+    When I embed the program in closure mode
+    Then calling "fill" with a buffer of 32 bytes should return 9 and the buffer should read "AAAA copy"
+    And calling "scratch" with no arguments should return 2
+    When I embed the program in bytecode mode
+    Then calling "fill" with a buffer of 32 bytes should return 9 and the buffer should read "AAAA copy"
+    And calling "scratch" with no arguments should return 2
+    When I embed the program in reference mode
+    Then calling "fill" with a buffer of 32 bytes should return 9 and the buffer should read "AAAA copy"
+    And calling "scratch" with no arguments should return 2
+
+  Scenario: The allocator reuses freed buffers and grows the memory
+    Given a linear memory of 256 bytes
+    When I allocate 1 buffers of 24 bytes
+    And I take the address of buffer 0
+    And I allocate 9 buffers of 24 bytes
+    Then the memory should have grown to 512 bytes
+    And the memory should not have moved
+    When I allocate 10 buffers of 24 bytes
+    And I write "kept" into buffer 3
+    Then the memory should have grown to 1024 bytes
+    And buffer 3 should read "kept"
+    When native code writes "early" at the address taken before
+    Then buffer 0 should read "early"
+    When I free every second buffer
+    And I allocate 1 buffers of 24 bytes
+    Then the new buffer should take the place of buffer 0
+    When I free all buffers
+    Then the memory should be empty
+
+  Scenario: The linear memory grows in place up to its reserved size
+    Given a linear memory of 256 bytes reserving 1024 bytes
+    When I allocate 2 buffers of 496 bytes
+    Then the memory should have grown to 1024 bytes
+    And allocating a buffer of 32 bytes should fail with a MemoryError
+
+  Scenario: Types and structs are laid out once and passed to native code
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libc}"]
+      div="div"
+
+      [ffi]
+      div=(numerator:i32, denominator:i32)div_t
+
+      [type handle]
+      bytes=4
+      align=8
+
+      [struct stats]
+      u8=flags
+      i64=size
+
+      [struct file]
+      i32=bytes
+      handle=h
+      ptr=path
+      embed=stats
+      u16=mode
+
+      [struct div_t]
+      i32=quot
+      i32=rem
+
+      [struct boxed]
+      u8=tag
+      handle=h
+
+      [fun quotient]
+      decl=(a:i32, b:i32)div_t
+      call=div, a, b
+      """
+    When I load the program in closure mode
+    Then type "handle" should take 8 bytes aligned to 8
+    And type "file" should take 48 bytes aligned to 8
+    And the fields of "file" should be at "bytes@0, h@8, path@16, stats@24, flags@24, size@32, mode@40"
+    And type "boxed" should take 16 bytes aligned to 8
+    And the fields of "boxed" should be at "tag@0, h@8"
+    And the types should survive a binary ASG round trip
+    When I embed the program in closure mode
+    Then the struct returned by "quotient" for 17, 5 should hold "quot=3, rem=2"
+    When I embed the program in bytecode mode
+    Then the struct returned by "quotient" for 17, 5 should hold "quot=3, rem=2"
+
+  Scenario: Libraries and symbols are shared by all modules of a process
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 5, 2
+      """
+    When I load the program in bytecode mode
+    And I load the program again in bytecode mode
+    Then both runs should call the same foreign function "fdim"
+
+  Scenario: The profiler counts calls and executed opcodes
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun step]
+      decl=(n:f64)void
+      call=fdim, n, 1
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 3, 0
+      move=n
+      label=loop
+      call=step, n
+      move=n
+      cmp=n, 0
+      if=0, loop
+      """
+    When I run the program with the profiler
+    Then the stack should have 0 values
+    And the profile should count 3 calls of function "step"
+    And the profile should count 4 calls of foreign function "fdim"
+    And the profile should count 3 executed "branch" instructions
+    And the profile should survive a JSON round trip
+
+  Scenario: The tracer records a timeline mapped to the xil source
+    Given a xil program
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun step]
+      decl=(n:f64)void
+      call=fdim, n, 1
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=step, 3
+      call=step, 2
+      """
+    When I run the program with a tracer of capacity 100
+    Then the trace should hold 8 events
+    And the trace should enter function "step" at row 9 column 6
+    And the trace should call "fdim" at row 11 column 1
+    And the folded stacks should contain "main;step;fdim"
+    When I run the program with a tracer of capacity 3
+    Then the trace should hold 3 events
+    And the trace should have dropped 5 events
+    When I run the program with a tracer of capacity 100 on another thread
+    Then every trace event should carry the id of that thread
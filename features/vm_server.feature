@@ -0,0 +1,94 @@
+Feature: VM Server
+  As a developer
+  I want a long-running VM server with warm modules
+  So that repeated xil jobs don't pay for translation and linking again
+
+  Scenario: Repeated jobs run from the warm cache until a source changes
+    Given a xil project with the source
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 5, 2
+      """
+    And a running VM server with 2 workers
+    When I send a run request for the project
+    Then the response should hold the stack "3.0"
+    And the response should not come from the cache
+    When I send a run request for the project
+    Then the response should hold the stack "3.0"
+    And the response should come from the cache
+    When I change "5, 2" to "9, 2" in the source
+    And I send a run request for the project
+    Then the response should hold the stack "7.0"
+    And the response should not come from the cache
+
+  Scenario: Concurrent jobs are answered by the worker pool
+    Given a xil project with the source
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 4, 1
+      """
+    And a running VM server with 4 workers
+    When I send 8 run requests for the project at once
+    Then every response should hold the stack "3.0"
+
+  Scenario: The builtin exit ends the program but not the server
+    Given a xil project with the source
+      """
+      [module app]
+
+      [use builtin]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      const=text, "bye"
+      call=strlen, text.ptr
+      call=exit, 3
+      """
+    And a running VM server with 2 workers
+    When I send a run request for the project
+    Then the response should hold the stack "3"
+    And the response should report the exit code 3
+    When I send a run request for the project
+    Then the response should report the exit code 3
+    And the response should come from the cache
+
+  Scenario: Jobs run in the mode of the request
+    Given a xil project with the source
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 5, 2
+      """
+    And a running VM server with 2 workers
+    When I send a run request for the project in task mode
+    Then the response should hold the stack "3.0"
+    When I send a run request for the project in bytecode mode
+    Then the response should hold the stack "3.0"
+    When I send a run request for the project in fast mode
+    Then the response should report the error "Unknown mode 'fast'"
@@ -0,0 +1,92 @@
+Feature: xil command line
+  As a developer
+  I want one xil command to build, run, check and dump programs
+  So that editor hooks and batch jobs start fast
+
+  Scenario: Running a built program stays within the startup budget
+    Given a xil project with the source
+      """
+      [module app]
+
+      [lib "{libm}"]
+      fdim="fdim"
+
+      [ffi]
+      fdim=(x:f64, y:f64)f64
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=fdim, 5, 2
+      """
+    When I run "xil build" in the project
+    Then the command should succeed
+    And the project should contain "app.xasg" and "__xilcache__/app.xvmc"
+    When I run "xil --import-time run app.xasg --profile" in the project
+    Then the command should succeed
+    And the command output should contain "fdim"
+    And the command should not have imported "translator", "yaml" or "lark"
+    And the imports of the command should stay within the run budget
+
+  Scenario: A profiled program which exits still prints its profile
+    Given a xil project with the source
+      """
+      [module app]
+
+      [use builtin]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=exit, 1
+      """
+    When I run "xil run --profile" in the project
+    Then the command should fail
+    And the command output should contain "exit"
+    And the command output should contain "opcode"
+
+  Scenario: check reports calls of unknown functions
+    Given a xil project with the source
+      """
+      [module app]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      call=missing, 1
+      """
+    When I run "xil check" in the project
+    Then the command should fail
+    And the command output should contain "app.xil:5:1: function 'main' calls unknown function 'missing'"
+    When I run "xil check --late-binding" in the project
+    Then the command should succeed
+
+  Scenario: check reports the violations of a malformed graph
+    Given a xil project with the source
+      """
+      [module app]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      """
+    When I run "xil build" in the project
+    And a PARENTCHILD edge to a missing node is added to "app.xasg"
+    And I run "xil check app.xasg" in the project
+    Then the command should fail
+    And the command output should contain "Invalid graph: app.xasg:"
+    And the command output should contain "has no sink node"
+    When I run "xil check" in the project
+    Then the command should succeed
+
+  Scenario: dump prints the compiled functions of a source
+    Given a xil project with the source
+      """
+      [module app]
+
+      [fun main]
+      decl=(argn:i32, argv:ptr)void
+      cmp=argn, 0
+      if=0, end
+      call=main, 0, 0
+      label=end
+      """
+    When I run "xil dump app.xil" in the project
+    Then the command should succeed
+    And the command output should contain "branch"
@@ -416,7 +416,8 @@ class XilFormatter:
         # Lade Grammatik
         with open(grammar_path, 'r', encoding='utf-8') as f:
             grammar = f.read()
-        self.parser = Lark(grammar, start='unit', parser='lalr', maybe_placeholders=False)
+        # cache=True speichert die LALR-Tabellen im Temp-Verzeichnis, spätere Starts laden sie nur noch
+        self.parser = Lark(grammar, start='unit', parser='lalr', maybe_placeholders=False, cache=True)
         
         # Lade Formatierungsregeln
         with open(rules_path, 'r', encoding='utf-8') as f:
@@ -522,8 +523,8 @@ class XilFormatter:
 
 
 # CLI-Interface
-if __name__ == "__main__":
-    import sys
+def main(argv=None) -> int:
+    """Kommandozeile des Formatters, gibt den Exit-Code zurück"""
     import argparse
     
     parser = argparse.ArgumentParser(description='Format xil files or check formatting')
@@ -535,9 +536,7 @@ if __name__ == "__main__":
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Show detailed error information (first problem found)')
     
-    args = parser.parse_args()
-    
-    formatter = XilFormatter()
+    args = parser.parse_args(argv)
     
     # Wenn keine Dateien angegeben, finde alle .xil Dateien
     if not args.files:
@@ -554,7 +553,10 @@ if __name__ == "__main__":
     
     if not xil_files:
         print("No xil files found.")
-        sys.exit(0)
+        return 0
+    
+    # Parser erst bauen, wenn es etwas zu formatieren gibt
+    formatter = XilFormatter()
     
     # Standardmäßig Check-Modus, nur wenn --format übergeben wird, wird formatiert
     check_mode = not args.format
@@ -625,7 +627,12 @@ if __name__ == "__main__":
             errors_found = True
     
     if check_mode and errors_found:
-        sys.exit(1)
+        return 1
     elif check_mode:
         print(f"\nAll {len(xil_files)} file(s) are correctly formatted.")
-        sys.exit(0)
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
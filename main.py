@@ -1,9 +1,8 @@
-import translator
-import virtual_machine
-import asg_utils
-import yaml
 from pathlib import Path
 
+# Subsystems are imported where they are used, so commands which don't need
+# the translator or yaml don't pay for importing them, see xil.py
+
 def validate_yaml(yaml_data: dict) -> None:
     """
     Validates YAML data for required fields and their types.
@@ -62,6 +61,7 @@ def load_yaml(file_path: str | Path) -> dict:
         FileNotFoundError: If the file is not found
         yaml.YAMLError: If the YAML file cannot be parsed
     """
+    import yaml
     file_path = Path(file_path)
     if not file_path.exists():
         raise FileNotFoundError(f"YAML file not found: {file_path}")
@@ -69,38 +69,115 @@ def load_yaml(file_path: str | Path) -> dict:
     with open(file_path, 'r', encoding='utf-8') as file:
         return yaml.safe_load(file)
 
-if __name__ == "__main__":
-    try:
-      yaml_file_path = Path('xil.yaml')
-      yaml_data = load_yaml(yaml_file_path)
-      validate_yaml(yaml_data)
-      
-      # Get the directory of the YAML file to resolve relative paths
-      yaml_dir = yaml_file_path.parent
-      
-    except FileNotFoundError as e:
-      print(f"Error loading YAML file: {e}")
-      exit(1)
-    except yaml.YAMLError as e:
-      print(f"Error parsing YAML file: {e}")
-      exit(1)
-    except ValueError as e:
-      print(f"Validation error: {e}")
-      exit(1)
+def source_files(paths) -> list[Path]:
+    """
+    Returns the source files of a job.
+
+    Args:
+        paths: xil.yaml projects, directories holding a xil.yaml, .xil
+               sources or .xasg graphs
+
+    Returns:
+        Resolved paths, a project stands for the files it lists
 
+    Raises:
+        FileNotFoundError: If a project or source file is not found
+        ValueError: If a project is invalid
+    """
+    files = []
+    for path in paths:
+        path = Path(path).resolve()
+        if path.is_dir():
+            path = path / 'xil.yaml'
+        if path.suffix in ('.yaml', '.yml'):
+            yaml_data = load_yaml(path)
+            validate_yaml(yaml_data)
+            files.extend((path.parent / file).resolve() for file in yaml_data['files'])
+        else:
+            files.append(path)
+    for file in files:
+        if not file.exists():
+            raise FileNotFoundError(f"File not found: {file}")
+    return files
+
+def load_modules(paths) -> list[dict]:
+    """
+    Translates and links the sources of a job, .xasg graphs are loaded
+    without translation.
+
+    Args:
+        paths: Same as source_files
+
+    Returns:
+        Linked modules
+    """
+    import asg_utils
+    files = source_files(paths)
+    graphs = [asg_utils.read_asg(file) for file in files if file.suffix == '.xasg']
     python_objects = []
-    for file in yaml_data['files']:
-      # Resolve file path relative to YAML file's directory
-      file_path = (yaml_dir / file).resolve()
-      if not file_path.exists():
-        print(f"Error: File not found: {file_path}")
-        exit(1)
-      with open(file_path, 'r', encoding='utf-8') as f:
-         content = f.read()
-         python_object = translator.translate(file_path.name, content)
-         python_objects.append(python_object)
-         #graph = translator.python_object_to_graph(python_object)
-         #asg_utils.graph_to_mermaid(graph)
-    modules = asg_utils.generateModules(python_objects)
-    for module in modules:
-      virtual_machine.run(module)
\ No newline at end of file
+    for file in files:
+        if file.suffix != '.xasg':
+            import translator
+            python_objects.append(translator.translate(file.name, file.read_text(encoding='utf-8')))
+    modules = asg_utils.generateModules(python_objects) if python_objects else []
+    if graphs:
+        import virtual_machine
+        modules.extend(virtual_machine.load_graph_modules(graphs))
+    return modules
+
+def run_module(module, profile_option: str | None = None, trace_option: str | None = None,
+               late_binding: bool = False, cache=None, mode: str = 'closure', opt_level: int = 1) -> int:
+    """
+    Runs a module, optionally profiled or traced.
+
+    Args:
+        module: Linked module
+        profile_option: None to run without profiler, '' to print the profile
+                        table, a file path to write the profile as JSON as well
+        trace_option: None to run without tracer, else the file path of the
+                      Chrome trace JSON, the folded stacks are written next
+                      to it with the suffix .folded
+        late_binding: Look calls of unknown functions up when they run instead
+                      of failing with a link error
+        cache: virtual_machine.CompileCache with the compiled functions of
+               earlier runs, None to compile every function
+        mode: Execution tier, see virtual_machine.run
+        opt_level: 0 turns the peephole optimizer off
+
+    Returns:
+        Exit code passed to the builtin exit, 0 if main returned
+
+    Raises:
+        virtual_machine.LinkError: If calls can't be bound to their targets
+    """
+    import virtual_machine
+    options = {'mode': mode, 'opt_level': opt_level, 'late_binding': late_binding, 'cache': cache}
+
+    def run(profile=None):
+        # The builtin exit ends the program, not the recording of it
+        try:
+            virtual_machine.run(module, profile=profile, **options)
+        except virtual_machine.ProgramExit as e:
+            return e.code or 0
+        return 0
+
+    if trace_option:
+        tracer = virtual_machine.Tracer()
+        exit_code = run(tracer)
+        tracer.write_chrome_trace(trace_option)
+        tracer.write_folded_stacks(Path(trace_option).with_suffix('.folded'))
+        return exit_code
+    if profile_option is None:
+        return run()
+    profile = virtual_machine.Profiler()
+    exit_code = run(profile)
+    print(profile.table())
+    if profile_option:
+        Path(profile_option).write_text(profile.to_json(), encoding='utf-8')
+    return exit_code
+
+if __name__ == "__main__":
+    # Same as `python xil.py run`, e.g. python main.py --profile app.xasg
+    import sys
+    import xil
+    sys.exit(xil.main(['run'] + sys.argv[1:]))
@@ -40,7 +40,10 @@ class NodeType(Enum):
     STRING = 27
     OPIF = 246
     OPLABEL = 247
+    OPMOVE = 248
     OPCMP = 249
+    OPCONST = 250
+    OPDECL = 251
     OPCALL = 255
 
 class Edge:
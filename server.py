@@ -0,0 +1,219 @@
+import virtual_machine
+import asyncio
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from main import source_files, load_modules
+
+DEFAULT_SOCKET = '/tmp/xil-vm.sock'
+
+class _ThreadOutput(io.TextIOBase):
+    """Stand-in for sys.stdout which keeps the prints of each worker apart
+
+    Writes of a thread which captures go into its own buffer, all other
+    writes go to the original stream. Output of foreign functions is
+    written by the C library and isn't captured.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.buffer = io.StringIO()
+
+    def release(self):
+        buffer = getattr(self.local, 'buffer', None)
+        self.local.buffer = None
+        return buffer.getvalue() if buffer is not None else ''
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+def fingerprint(paths):
+    """Return the size and modification time of every file a job depends on"""
+    paths = [Path(path).resolve() for path in paths]
+    files = paths + [file for file in source_files(paths) if file not in paths]
+    stamps = []
+    for file in files:
+        stat = file.stat()
+        stamps.append((str(file), stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+class _Program:
+    """Linked and compiled modules of a job with the fingerprint of their sources"""
+
+    def __init__(self, stamps, programs):
+        self.stamps = stamps
+        self.programs = programs
+
+class ModuleCache:
+    """Warm programs per job, reloaded when a source unit changes"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, paths, mode):
+        """Return the program of a job and whether it was taken from the cache"""
+        key = (tuple(str(Path(path).resolve()) for path in paths), mode)
+        stamps = fingerprint(paths)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.stamps == stamps:
+                return entry, True
+            programs = []
+            for module in load_modules(paths):
+                main = virtual_machine.prepare(module, mode)
+                if main is not None:
+                    programs.append((module.get('module'), main))
+            entry = _Program(stamps, programs)
+            self.entries[key] = entry
+            return entry, False
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+def _run_program(name, main):
+    """Run the main function of a module, the builtin exit ends the program and not the server
+
+    Programs prepared in mode 'task' run in an event loop of the worker.
+    """
+    try:
+        stack = main()
+        if asyncio.iscoroutine(stack):
+            stack = asyncio.run(stack)
+        return {'module': name, 'stack': stack}
+    except virtual_machine.ProgramExit as e:
+        return {'module': name, 'stack': e.stack, 'exit': e.code or 0}
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Reads one JSON request per line and answers with one JSON line"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response, default=repr).encode('utf-8') + b'\n')
+            self.wfile.flush()
+            if response.get('shutdown'):
+                return
+
+class VMServer(socketserver.UnixStreamServer):
+    """Runs xil jobs sent over a Unix socket on a pool of worker threads
+
+    Requests are JSON lines:
+    {"op": "run", "files": ["xil.yaml"], "mode": "closure"} runs the main
+    function of every module, files are xil.yaml projects, .xil sources or
+    .xasg graphs. Linked modules, compiled functions and loaded libraries
+    stay warm between requests until one of the files changes.
+    Results of modules which called the builtin exit carry its code as "exit".
+    {"op": "ping"}, {"op": "invalidate"} and {"op": "shutdown"}.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, workers=os.cpu_count() or 1):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.cache = ModuleCache()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='xil-worker')
+        self.output = _ThreadOutput(sys.stdout)
+        super().__init__(socket_path, _Handler)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def dispatch(self, request):
+        """Answer a request"""
+        op = request.get('op', 'run')
+        if op == 'ping':
+            return {'ok': True}
+        if op == 'invalidate':
+            self.cache.clear()
+            return {'ok': True}
+        if op == 'shutdown':
+            threading.Thread(target=self.shutdown).start()
+            return {'ok': True, 'shutdown': True}
+        if op != 'run':
+            return {'ok': False, 'error': f"Unknown operation '{op}'"}
+        mode = request.get('mode', 'closure')
+        if mode not in virtual_machine.MODES:
+            return {'ok': False, 'error': f"Unknown mode '{mode}', expected one of {', '.join(virtual_machine.MODES)}"}
+        self.output.capture()
+        try:
+            entry, cached = self.cache.get(request.get('files', ['xil.yaml']), mode)
+            # Programs are reentrant, jobs of the same files run at the same time
+            results = [_run_program(name, main) for name, main in entry.programs]
+        finally:
+            output = self.output.release()
+        return {'ok': True, 'cached': cached, 'results': results, 'output': output}
+
+    def serve_forever(self, poll_interval=0.5):
+        stdout = sys.stdout
+        sys.stdout = self.output
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            sys.stdout = stdout
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+def request(message, socket_path=DEFAULT_SOCKET):
+    """Send one request to a running server and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Persistent xil VM server')
+    parser.add_argument('command', choices=['serve', 'run', 'stop'])
+    parser.add_argument('files', nargs='*', default=['xil.yaml'])
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--mode', choices=virtual_machine.MODES, default='closure')
+    args = parser.parse_args()
+    if args.command == 'serve':
+        with VMServer(args.socket, args.workers) as server:
+            print(f"Serving xil VM on {args.socket}")
+            server.serve_forever()
+    elif args.command == 'stop':
+        request({'op': 'shutdown'}, args.socket)
+    else:
+        response = request({'op': 'run', 'files': args.files, 'mode': args.mode}, args.socket)
+        if not response['ok']:
+            print(f"Error: {response['error']}")
+            exit(1)
+        print(response['output'], end='')
+        for result in response['results']:
+            print(f"{result['module']}: {result['stack']}")
@@ -10,8 +10,14 @@ def translate(file, content):
     ffi = {}
     fun = {}
     current_fun = None
+    # [type] name -> {'bytes', 'align'}, [struct] name -> {'fields': [{'name', 'type', 'embed'}]}
+    types = {}
+    current_type = None
+    # function name -> TextView of the function name followed by one TextView per statement
+    textViews = {}
+    current_views = None
 
-    for line in lines:
+    for row, line in enumerate(lines, 1):
         if line.startswith('[module') and line.endswith(']'):
             # Parse module name safely: [module name] or [module]
             module_part = line[7:-1].strip()  # Remove '[module' and ']'
@@ -35,12 +41,40 @@ def translate(file, content):
         elif line.startswith('[fun') and line.endswith(']'):
             fun[line[5:-1]] = []
             current_fun = fun[line[5:-1]]
+            textViews[line[5:-1]] = [TextView(row=row, column=6)]
+            current_views = textViews[line[5:-1]]
             currentBlock = 'fun'
+        elif line.startswith('[type') and line.endswith(']'):
+            current_type = types[line[6:-1].strip()] = {}
+            currentBlock = 'type'
+        elif line.startswith('[struct') and line.endswith(']'):
+            current_type = types[line[8:-1].strip()] = {'fields': []}
+            currentBlock = 'struct'
         elif line == '':
             continue
+        elif currentBlock == 'type':
+            key, _, value = line.partition('=')
+            if key.strip() in ('bytes', 'align') and value.strip().lstrip('-').isdigit():
+                current_type[key.strip()] = int(value)
+            else:
+                print("Parse error: Unexpected type statement: ", line)
+        elif currentBlock == 'struct':
+            # type=name declares a field, embed=name places the fields of another struct inline
+            key, _, value = line.partition('=')
+            if key.strip() and value.strip():
+                if key.strip() == 'embed':
+                    current_type['fields'].append({'name': value.strip(), 'type': value.strip(), 'embed': True})
+                else:
+                    current_type['fields'].append({'name': value.strip(), 'type': key.strip()})
+            else:
+                print("Parse error: Unexpected struct field: ", line)
         elif currentBlock == 'ffi':
             key,value = line.split('=')            
             decl={'args':[],'returns':[]}
+            # async=(...) calls the function on a thread pool, see virtual_machine.link
+            if value.startswith('async'):
+                decl['async'] = True
+                value = value[len('async'):].strip()
             if value.startswith('(') and value.index(')') != -1:
                 args = value[1:value.index(')')].split(',')
                 ret = value[value.index(')')+1:]
@@ -53,6 +87,7 @@ def translate(file, content):
           key,value = line.split('=')
           current_lib[key]=value.split('"')[1]
         elif currentBlock == 'fun':
+          statements = len(current_fun)
           if line.startswith('label='):
             current_fun.append({'label':line.split('=')[1]})
           elif line.startswith('call='):
@@ -83,9 +118,11 @@ def translate(file, content):
                 print("Parse error: Unexpected decl declaration: ", line)
           else:
             print("Parse error: Unexpected instruction: ", line)
+          if len(current_fun) > statements:
+            current_views.append(TextView(row=row, column=1))
         else:
             print("Parse error: Unexpected line: ",  line)
-    return {'unit': file, 'module':module, 'use':use, 'libs':libs, 'ffi':ffi, 'fun':fun}
+    return {'unit': file, 'module':module, 'use':use, 'libs':libs, 'ffi':ffi, 'types':types, 'fun':fun, 'textViews':textViews}
 
 def isNumber(arg):
     return arg.isdigit()
@@ -93,26 +130,59 @@ def isNumber(arg):
 def isStringLiteral(arg):
     return arg.startswith('"') and arg.endswith('"')
 
-def processStatement(stmt, asg, nt_counter):
+def addTextView(asg, node_type, node_id, text_view):
+    asg['edges'].elements.append(Edge(src_id=node_id, sink_id=len(asg['textViews'].elements), src_type=node_type, sink_type=NodeType.ID, type=EdgeType.TEXTVIEW))
+    asg['textViews'].elements.append(text_view)
+
+def processStatement(stmt, asg, nt_counter, text_view=None):
     nt_counter[NodeType.STATEMENT] += 1
     asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.STATEMENT], sink_id=nt_counter[NodeType.FUNCTION], src_type=NodeType.STATEMENT, sink_type=NodeType.FUNCTION, type=EdgeType.PARENTCHILD))
+    if text_view is not None:
+        addTextView(asg, NodeType.STATEMENT, nt_counter[NodeType.STATEMENT], text_view)
     # Lookup-Tabelle von String auf NodeType OP-Werte
     op_to_nodetype = {
         'cmp': NodeType.OPCMP,
         'call': NodeType.OPCALL,
         'if': NodeType.OPIF,
         'label': NodeType.OPLABEL,
+        'move': NodeType.OPMOVE,
+        'const': NodeType.OPCONST,
+        'decl': NodeType.OPDECL,
     }
     for key, value in stmt.items():
         if key in op_to_nodetype:
             nt_counter[op_to_nodetype[key]] += 1
             asg['edges'].elements.append(Edge(src_id=nt_counter[op_to_nodetype[key]], sink_id=nt_counter[NodeType.STATEMENT], src_type=op_to_nodetype[key], sink_type=NodeType.STATEMENT, type=EdgeType.PARENTCHILD))
-            for arg in value:
+            if key == 'decl':
+                # Parameters are stored like FFI arguments: name and TYPE child, followed by the return TYPE
+                for param in value:
+                    nt_counter[NodeType.FUNCTIONARGUMENT] += 1
+                    asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.FUNCTIONARGUMENT], sink_id=nt_counter[NodeType.OPDECL], src_type=NodeType.FUNCTIONARGUMENT, sink_type=NodeType.OPDECL, type=EdgeType.PARENTCHILD))
+                    asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.FUNCTIONARGUMENT], sink_id=len(asg['strings'].elements), src_type=NodeType.FUNCTIONARGUMENT, sink_type=NodeType.ID, type=EdgeType.STRING))
+                    asg['strings'].elements.append(param['name'].strip())
+                    nt_counter[NodeType.TYPE] += 1
+                    asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=nt_counter[NodeType.FUNCTIONARGUMENT], src_type=NodeType.TYPE, sink_type=NodeType.FUNCTIONARGUMENT, type=EdgeType.PARENTCHILD))
+                    asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=len(asg['strings'].elements), src_type=NodeType.TYPE, sink_type=NodeType.ID, type=EdgeType.STRING))
+                    asg['strings'].elements.append(param['type'].strip())
+                nt_counter[NodeType.TYPE] += 1
+                asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=nt_counter[NodeType.OPDECL], src_type=NodeType.TYPE, sink_type=NodeType.OPDECL, type=EdgeType.PARENTCHILD))
+                asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=len(asg['strings'].elements), src_type=NodeType.TYPE, sink_type=NodeType.ID, type=EdgeType.STRING))
+                asg['strings'].elements.append(stmt.get('retType', 'void'))
+                continue
+            if key == 'label':
+                # A label is named like a function
+                asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.OPLABEL], sink_id=len(asg['strings'].elements), src_type=NodeType.OPLABEL, sink_type=NodeType.ID, type=EdgeType.STRING))
+                asg['strings'].elements.append(value.strip())
+                continue
+            # move carries a single argument
+            args = [value] if isinstance(value, str) else value
+            for arg in args:
+                arg = arg.strip()
                 nt_counter[NodeType.FUNCTIONARGUMENT] += 1
                 asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.FUNCTIONARGUMENT], sink_id=nt_counter[op_to_nodetype[key]], src_type=NodeType.FUNCTIONARGUMENT, sink_type=op_to_nodetype[key], type=EdgeType.PARENTCHILD))
                 if isNumber(arg):
                     nt_counter[NodeType.NUMBER] += 1
-                    asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.NUMBER], sink_id=nt_counter[NodeType.FUNCTIONARGUMENT], src_type=NodeType.NUMBER, sink_type=NodeType.FUNCTIONARGUMENT, type=EdgeType.STRING))
+                    asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.NUMBER], sink_id=nt_counter[NodeType.FUNCTIONARGUMENT], src_type=NodeType.NUMBER, sink_type=NodeType.FUNCTIONARGUMENT, type=EdgeType.PARENTCHILD))
                     asg['edges'].elements.append(Edge(src_id=nt_counter[NodeType.NUMBER], sink_id=len(asg['strings'].elements), src_type=NodeType.NUMBER, sink_type=NodeType.ID, type=EdgeType.STRING))
                     asg['strings'].elements.append(arg)
                 elif isStringLiteral(arg):
@@ -174,6 +244,10 @@ def python_object_to_graph(object):
                 edges.elements.append(Edge(src_id=nt_counter[NodeType.FFI], sink_id=nt_counter[NodeType.MODULE], src_type=NodeType.FFI, sink_type=NodeType.MODULE, type=EdgeType.PARENTCHILD))
                 edges.elements.append(Edge(src_id=nt_counter[NodeType.FFI], sink_id=len(strings.elements), src_type=NodeType.FFI, sink_type=NodeType.ID, type=EdgeType.STRING))
                 strings.elements.append(ffi)
+                if value[ffi].get('async'):
+                    # Attributes are further strings of the FFI node
+                    edges.elements.append(Edge(src_id=nt_counter[NodeType.FFI], sink_id=len(strings.elements), src_type=NodeType.FFI, sink_type=NodeType.ID, type=EdgeType.STRING))
+                    strings.elements.append('async')
                 for fun in value[ffi]['args']:
                     nt_counter[NodeType.FUNCTIONARGUMENT] += 1
                     edges.elements.append(Edge(src_id=nt_counter[NodeType.FUNCTIONARGUMENT], sink_id=nt_counter[NodeType.FFI], src_type=NodeType.FUNCTIONARGUMENT, sink_type=NodeType.FFI, type=EdgeType.PARENTCHILD))
@@ -188,12 +262,43 @@ def python_object_to_graph(object):
                 edges.elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=nt_counter[NodeType.FFI], src_type=NodeType.TYPE, sink_type=NodeType.FFI, type=EdgeType.PARENTCHILD))
                 edges.elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=len(strings.elements), src_type=NodeType.TYPE, sink_type=NodeType.ID, type=EdgeType.STRING))
                 strings.elements.append(ret)
+        elif key == 'types':
+            for name, decl in value.items():
+                nt_counter[NodeType.TYPE] += 1
+                type_id = nt_counter[NodeType.TYPE]
+                edges.elements.append(Edge(src_id=type_id, sink_id=nt_counter[NodeType.MODULE], src_type=NodeType.TYPE, sink_type=NodeType.MODULE, type=EdgeType.PARENTCHILD))
+                edges.elements.append(Edge(src_id=type_id, sink_id=len(strings.elements), src_type=NodeType.TYPE, sink_type=NodeType.ID, type=EdgeType.STRING))
+                strings.elements.append(name)
+                # Size and alignment are NUMBER children with the key and the value as strings
+                for constant in ('bytes', 'align'):
+                    if constant in decl:
+                        nt_counter[NodeType.NUMBER] += 1
+                        edges.elements.append(Edge(src_id=nt_counter[NodeType.NUMBER], sink_id=type_id, src_type=NodeType.NUMBER, sink_type=NodeType.TYPE, type=EdgeType.PARENTCHILD))
+                        for text in (constant, str(decl[constant])):
+                            edges.elements.append(Edge(src_id=nt_counter[NodeType.NUMBER], sink_id=len(strings.elements), src_type=NodeType.NUMBER, sink_type=NodeType.ID, type=EdgeType.STRING))
+                            strings.elements.append(text)
+                # Fields are stored like FFI arguments, embedding is a further string
+                for field in decl.get('fields', []):
+                    nt_counter[NodeType.FUNCTIONARGUMENT] += 1
+                    edges.elements.append(Edge(src_id=nt_counter[NodeType.FUNCTIONARGUMENT], sink_id=type_id, src_type=NodeType.FUNCTIONARGUMENT, sink_type=NodeType.TYPE, type=EdgeType.PARENTCHILD))
+                    edges.elements.append(Edge(src_id=nt_counter[NodeType.FUNCTIONARGUMENT], sink_id=len(strings.elements), src_type=NodeType.FUNCTIONARGUMENT, sink_type=NodeType.ID, type=EdgeType.STRING))
+                    strings.elements.append(field['name'])
+                    if field.get('embed'):
+                        edges.elements.append(Edge(src_id=nt_counter[NodeType.FUNCTIONARGUMENT], sink_id=len(strings.elements), src_type=NodeType.FUNCTIONARGUMENT, sink_type=NodeType.ID, type=EdgeType.STRING))
+                        strings.elements.append('embed')
+                    nt_counter[NodeType.TYPE] += 1
+                    edges.elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=nt_counter[NodeType.FUNCTIONARGUMENT], src_type=NodeType.TYPE, sink_type=NodeType.FUNCTIONARGUMENT, type=EdgeType.PARENTCHILD))
+                    edges.elements.append(Edge(src_id=nt_counter[NodeType.TYPE], sink_id=len(strings.elements), src_type=NodeType.TYPE, sink_type=NodeType.ID, type=EdgeType.STRING))
+                    strings.elements.append(field['type'])
         elif key == 'fun':
             for fun in value:
                 nt_counter[NodeType.FUNCTION] += 1
                 edges.elements.append(Edge(src_id=nt_counter[NodeType.FUNCTION], sink_id=nt_counter[NodeType.MODULE], src_type=NodeType.FUNCTION, sink_type=NodeType.MODULE, type=EdgeType.PARENTCHILD))
                 edges.elements.append(Edge(src_id=nt_counter[NodeType.FUNCTION], sink_id=len(strings.elements), src_type=NodeType.FUNCTION, sink_type=NodeType.ID, type=EdgeType.STRING))
                 strings.elements.append(fun)
-                for stmt in value[fun]:
-                    processStatement(stmt, asg, nt_counter)
+                views = object.get('textViews', {}).get(fun, [])
+                if views:
+                    addTextView(asg, NodeType.FUNCTION, nt_counter[NodeType.FUNCTION], views[0])
+                for i, stmt in enumerate(value[fun]):
+                    processStatement(stmt, asg, nt_counter, views[i + 1] if i + 1 < len(views) else None)
     return asg
\ No newline at end of file
@@ -1,4 +1,14 @@
-from .main import run
-
-__all__ = ['run']
+from .main import run, prepare, load, embed, link_module, Image, MODES
+from .analysis import build_block_index
+from .graph import load_graph, load_graph_modules
+from .linker import link, LinkError
+from .cache import CompileCache, cache_path
+from .builtin import INTRINSICS, intrinsic, ProgramExit
+from .memory import Memory, Pointer, linear_memory
+from .layout import Layout, TypeLayouts
+from .profiler import Profiler
+from .tracer import Tracer
 
+__all__ = ['run', 'prepare', 'load', 'embed', 'link_module', 'Image', 'MODES', 'build_block_index', 'load_graph', 'load_graph_modules', 'link', 'LinkError',
+           'CompileCache', 'cache_path', 'INTRINSICS', 'intrinsic', 'ProgramExit', 'Memory', 'Pointer',
+           'linear_memory', 'Layout', 'TypeLayouts', 'Profiler', 'Tracer']
@@ -0,0 +1,82 @@
+from bisect import bisect_right
+
+class BlockIndex:
+    """Labels, decls and basic blocks of a xil function
+
+    Built once per function and shared by the interpreters and by tools
+    which inspect the control flow.
+
+    labels: label name -> statement index of the label
+    decls: statement indices of the decl statements
+    block_starts: statement index where each basic block starts
+    jump_targets: statement index of an if -> block id of its label,
+                  None if the label doesn't exist
+    successors: block id -> list of block ids control can continue with
+    """
+    __slots__ = ('labels', 'decls', 'block_starts', 'jump_targets', 'successors')
+
+    def __init__(self, labels, decls, block_starts, jump_targets, successors):
+        self.labels = labels
+        self.decls = decls
+        self.block_starts = block_starts
+        self.jump_targets = jump_targets
+        self.successors = successors
+
+    def block_of(self, stmt_index):
+        """Return the block id containing a statement"""
+        return bisect_right(self.block_starts, stmt_index) - 1
+
+    def __repr__(self):
+        return (f"BlockIndex(labels={self.labels}, decls={self.decls}, "
+                f"block_starts={self.block_starts}, jump_targets={self.jump_targets}, "
+                f"successors={self.successors})")
+
+def _statement_op(stmt):
+    """Return the operation of a statement in the order _execute_statement checks them"""
+    for op in ('call', 'move', 'const', 'decl', 'cmp', 'label', 'if'):
+        if op in stmt:
+            return op, stmt[op]
+    return None, None
+
+def build_block_index(statements):
+    """Scan the statements of a function once and build its BlockIndex"""
+    return index_ops([_statement_op(stmt) for stmt in statements])
+
+def index_ops(ops):
+    """Build the BlockIndex of a function given as (operation, arguments) pairs"""
+    labels = {}
+    decls = []
+    branches = []
+    starts = {0}
+    for i, (op, args) in enumerate(ops):
+        if op == 'decl':
+            decls.append(i)
+        elif op == 'label':
+            # The last label with a name wins, like in the interpreters
+            labels[args.strip()] = i
+            starts.add(i)
+        elif op == 'if':
+            branches.append(i)
+            if i + 1 < len(ops):
+                starts.add(i + 1)
+    block_starts = sorted(starts) if ops else []
+
+    def block_of(stmt_index):
+        return bisect_right(block_starts, stmt_index) - 1
+
+    jump_targets = {}
+    for i in branches:
+        args = ops[i][1]
+        label_index = labels.get(args[1].strip()) if len(args) >= 2 else None
+        jump_targets[i] = block_of(label_index) if label_index is not None else None
+
+    successors = []
+    for block_id, start in enumerate(block_starts):
+        end = block_starts[block_id + 1] if block_id + 1 < len(block_starts) else len(ops)
+        following = [block_id + 1] if block_id + 1 < len(block_starts) else []
+        if end - 1 in jump_targets and jump_targets[end - 1] is not None:
+            target = jump_targets[end - 1]
+            following = following + [target] if target not in following else following
+        successors.append(following)
+
+    return BlockIndex(labels, tuple(decls), block_starts, jump_targets, successors)
@@ -0,0 +1,81 @@
+import ctypes
+
+from .bytecode import OP_CONST, OPERAND_CONSTPROP, _map_operands
+
+# Key of the arena in the constants of a module
+ARENA_KEY = ('arena',)
+
+class ConstArena:
+    """Read-only storage of the string constants of a module
+
+    Every distinct string is stored once, UTF-8 encoded and null-terminated,
+    in one immutable bytes object. Its address doesn't change while the
+    arena lives, so .ptr of a constant can be passed as plain integer.
+    """
+    __slots__ = ('data', 'address', 'offsets')
+
+    def __init__(self, texts):
+        self.offsets = {}
+        parts = []
+        size = 0
+        for text in texts:
+            if text in self.offsets:
+                continue
+            encoded = text.encode('utf-8') + b'\0'
+            self.offsets[text] = size
+            parts.append(encoded)
+            size += len(encoded)
+        self.data = b''.join(parts)
+        self.address = ctypes.cast(ctypes.c_char_p(self.data), ctypes.c_void_p).value
+
+    def ptr(self, text):
+        """Return the address of a string in the arena"""
+        return self.address + self.offsets[text]
+
+    def __len__(self):
+        return len(self.data)
+
+def _ptr_text(operand):
+    """Return the string of a .ptr operand which isn't materialized yet, None for other operands"""
+    kind, value = operand
+    if kind == OPERAND_CONSTPROP and value.__class__ is tuple:
+        return value[1]
+    return None
+
+def materialize(functions, constants):
+    """Move the string constants of linked functions into one arena
+
+    .ptr operands of constants bound once become immediate addresses in
+    the arena, .bytes operands are folded by the compiler already. The
+    addresses are kept in constants too, for the properties of constants
+    bound more than once which are read when they run. Every function
+    keeps a reference to the arena, its code holds raw addresses into it.
+    Returns the arena.
+    """
+    texts = []
+
+    def collect(operand):
+        text = _ptr_text(operand)
+        if text is not None:
+            texts.append(text)
+        return operand
+
+    for func in functions.values():
+        for instruction in func.code:
+            op, _, b = instruction
+            if op == OP_CONST and b.__class__ is str:
+                texts.append(b)
+            _map_operands(instruction, collect)
+    arena = ConstArena(texts)
+    constants[ARENA_KEY] = arena
+    for text in arena.offsets:
+        constants[('ptr', text)] = arena.ptr(text)
+
+    def convert(operand):
+        text = _ptr_text(operand)
+        return operand if text is None else (OPERAND_CONSTPROP, arena.ptr(text))
+
+    for func in functions.values():
+        func.code = tuple(_map_operands(instruction, convert) for instruction in func.code)
+        func.arena = arena
+    return arena
@@ -0,0 +1,106 @@
+"""Intrinsics of the builtin module
+
+Modules which `[use builtin]` can call the Python functions registered
+here like foreign functions, without a library or ctypes marshalling.
+They are bound into the FFI function table of the module, so every tier
+and the linker bind them at the call sites. Declared foreign functions
+and module functions of the same name win.
+"""
+import ctypes
+import sys
+
+from .memory import address, linear_memory
+
+# Name of the module which provides the intrinsics
+BUILTIN_MODULE = 'builtin'
+
+# name -> intrinsic
+INTRINSICS = {}
+
+class ProgramExit(SystemExit):
+    """Raised by the builtin exit, ends the execution of the module
+
+    Image.execute sets stack to the value stack of the execution it ended.
+    Callers which must outlive the program, like the server and the
+    profiler, catch it and report code.
+    """
+
+    def __init__(self, code=0):
+        super().__init__(code)
+        self.stack = None
+
+def intrinsic(name, restype=None, noreturn=False):
+    """Register a Python function as intrinsic
+
+    restype is the ctypes type of the result like for foreign functions,
+    None if nothing is pushed on the stack. The optimizer removes the
+    instructions behind calls of noreturn intrinsics.
+    """
+    def register(function):
+        function.restype = restype
+        function.noreturn = noreturn
+        INTRINSICS[name] = function
+        return function
+    return register
+
+def _bytes(pointer, count=None):
+    """Read count bytes of a pointer or a string, up to the null terminator without count"""
+    if isinstance(pointer, str):
+        data = pointer.encode('utf-8')
+        return data if count is None else data[:count]
+    if isinstance(pointer, bytes):
+        return pointer if count is None else pointer[:count]
+    pointer = address(pointer)
+    return ctypes.string_at(pointer) if count is None else ctypes.string_at(pointer, count)
+
+@intrinsic('print')
+def builtin_print(text, count=None):
+    """Write count bytes of a UTF-8 text to stdout"""
+    sys.stdout.write(_bytes(text, count).decode('utf-8', 'replace'))
+
+@intrinsic('exit', noreturn=True)
+def builtin_exit(code=0):
+    """End the program with an exit code, like ExitProcess or exit of the C library"""
+    raise ProgramExit(code)
+
+@intrinsic('strlen', ctypes.c_uint64)
+def builtin_strlen(text):
+    """Return the number of bytes of a null-terminated string"""
+    return len(_bytes(text))
+
+@intrinsic('memcpy')
+def builtin_memcpy(destination, source, count):
+    """Copy count bytes, the areas may overlap"""
+    ctypes.memmove(address(destination), address(source), count)
+
+@intrinsic('memset')
+def builtin_memset(destination, value, count):
+    """Fill count bytes with a value"""
+    ctypes.memset(address(destination), value, count)
+
+@intrinsic('alloc', ctypes.c_void_p)
+def builtin_alloc(size):
+    """Allocate a zeroed buffer in the linear memory"""
+    return linear_memory().alloc(size)
+
+@intrinsic('free')
+def builtin_free(pointer):
+    """Give a buffer of the linear memory back"""
+    linear_memory().free(pointer)
+
+def noreturn_intrinsics(module):
+    """Return the names of the noreturn intrinsics a module calls, module functions of the same name win"""
+    if BUILTIN_MODULE not in module.get('use', ()):
+        return set()
+    functions = module['ops'] if 'ops' in module else module.get('fun', {})
+    return {name for name, function in INTRINSICS.items() if function.noreturn and name not in functions}
+
+def bind_intrinsics(module, ffi_functions):
+    """Add the intrinsics to the FFI functions of a module which uses the builtin module"""
+    if BUILTIN_MODULE not in module.get('use', ()):
+        return ffi_functions
+    functions = module['ops'] if 'ops' in module else module.get('fun', {})
+    for name, function in INTRINSICS.items():
+        if name not in functions:
+            ffi_functions.setdefault(name, function)
+    return ffi_functions
@@ -0,0 +1,557 @@
+from concurrent.futures import Future
+
+from .main import _parse_const_value, _constant_buffer
+from .analysis import _statement_op, index_ops
+from .ffi import _ffi_pool
+
+# Opcodes, ordered by how often they are executed by typical xil code.
+OP_CALL = 0
+OP_MOVE = 1
+OP_CMP = 2
+OP_IF = 3
+OP_CONST = 4
+# Emitted by the optimizer only
+OP_JUMP = 5      # (OP_JUMP, None, target)
+OP_BRANCH = 6    # (OP_BRANCH, (operand, operand, condition, store compare state), target)
+# Emitted by the linker only, calls bound to their target
+OP_CALL_FFI = 7  # (OP_CALL_FFI, foreign function, operands)
+OP_CALL_XIL = 8  # (OP_CALL_XIL, CompiledFunction, operands)
+OP_CALL_ASYNC = 9  # (OP_CALL_ASYNC, foreign function, operands), pushes a Future
+
+OPCODE_NAMES = ('call', 'move', 'cmp', 'if', 'const', 'jump', 'branch', 'call_ffi', 'call_xil', 'call_async')
+
+# Operand kinds. Operands are (kind, value) records classified at compile
+# time, every kind from OPERAND_IMMEDIATE on carries its final value.
+OPERAND_LOCAL = 0       # value is the frame slot of the local
+OPERAND_PROPERTY = 1    # value is (slot, property, text, constants), const bound more than once,
+                        # property None: a local which may hold the Future of an async call
+OPERAND_IMMEDIATE = 2
+OPERAND_INT = 2
+OPERAND_FLOAT = 3
+OPERAND_STRING = 4
+OPERAND_CONSTPROP = 5   # hello.ptr / hello.bytes of a const string, ('ptr', text) until linked
+OPERAND_SYMBOL = 6      # identifier which isn't a local, e.g. a function name
+
+OPERAND_NAMES = ('local', 'property', 'int', 'float', 'string', 'constprop', 'symbol')
+
+# Name of the hidden compare state, it gets the last frame slot.
+CMP_SLOT_NAME = '.cmp'
+
+class CompiledFunction:
+    """A xil function lowered into a flat instruction list
+
+    Each instruction is a tuple (opcode, a, b). Labels are removed and jumps
+    point to instruction indices, link() binds calls to their targets. Locals live in a frame, a list with one
+    slot per local, parameter and the compare state:
+
+    slots: local name -> slot index, parameters first, '.cmp' last
+    decls: slot indices of the parameters of each decl statement
+    template: initial frame, unset locals hold their own name
+    frames: free list of frames for reuse by later calls
+    statements: statement index of each instruction, for source positions
+    arena: the ConstArena the .ptr addresses of the linked code point into,
+    kept alive as long as the code
+    futures: slots of the locals async calls store their Future in, see link()
+    """
+    __slots__ = ('name', 'code', 'blocks', 'slots', 'decls', 'template', 'frames', 'statements', 'arena',
+                 'futures')
+
+    def __init__(self, name, code, blocks, slots, decls, statements=()):
+        self.name = name
+        self.code = code
+        self.statements = statements
+        self.blocks = blocks
+        self.slots = slots
+        self.decls = decls
+        template = list(slots)
+        template[slots[CMP_SLOT_NAME]] = 0
+        self.template = template
+        self.frames = []
+        self.arena = None
+        self.futures = ()
+
+    def __repr__(self):
+        lines = [f"fun {self.name} slots={self.slots} decls={self.decls}"]
+        for pc, (op, a, b) in enumerate(self.code):
+            if op == OP_CALL_XIL:
+                a = a.name
+            elif op in (OP_CALL_FFI, OP_CALL_ASYNC):
+                a = getattr(a, '__name__', a)
+            lines.append(f"  {pc:4} {OPCODE_NAMES[op]:6} {a!r} {b!r}")
+        return '\n'.join(lines)
+
+def _const_property(value, property_name, constants):
+    """Evaluate a property of a const value, None if it doesn't exist"""
+    if isinstance(value, str):
+        if property_name == 'ptr':
+            return _constant_buffer(constants, value)
+        elif property_name == 'bytes':
+            return len(value.encode('utf-8'))
+    return None
+
+def _resolve_operand(text, slots, const_values, const_only, constants):
+    """Classify an operand once, mirrors the lookup order of _parse_value"""
+    if '.' in text:
+        var_name, property_name = text.split('.', 1)
+        values = const_values.get(var_name)
+        if values is not None:
+            if len(values) == 1 and var_name in const_only:
+                if property_name == 'ptr' and isinstance(values[0], str):
+                    # materialize() replaces the string by its address in the arena of the module
+                    return (OPERAND_CONSTPROP, ('ptr', values[0]))
+                value = _const_property(values[0], property_name, constants)
+                return (OPERAND_CONSTPROP, value) if value is not None else (OPERAND_SYMBOL, text)
+            return (OPERAND_PROPERTY, (slots[var_name], property_name, text, constants))
+    if text in slots and text != CMP_SLOT_NAME:
+        return (OPERAND_LOCAL, slots[text])
+    try:
+        return (OPERAND_INT, int(text))
+    except ValueError:
+        pass
+    try:
+        return (OPERAND_FLOAT, float(text))
+    except ValueError:
+        pass
+    if text.startswith('"') and text.endswith('"'):
+        return (OPERAND_STRING, text[1:-1])
+    return (OPERAND_SYMBOL, text)
+
+def compare(val1, val2):
+    """Return the compare state of cmp: 0 if equal, 1 if greater, -1 otherwise"""
+    if val1 == val2:
+        return 0
+    if isinstance(val1, (int, float)) and isinstance(val2, (int, float)) and val1 > val2:
+        return 1
+    return -1
+
+def _join(value):
+    """Wait for the result of an async call, other values are returned as they are"""
+    return value.result() if value.__class__ is Future else value
+
+def _join_pending(func, frame):
+    """Wait for the async calls of a function whose result wasn't read
+
+    Called when the function returns or hands its frame to a tail call, an
+    exception of the foreign function is raised there then.
+    """
+    for slot in func.futures:
+        _join(frame[slot])
+
+def _read_property(operand, frame):
+    """Read a property of a local which may hold different const values or a Future"""
+    slot, property_name, text, constants = operand
+    if property_name is None:
+        return _join(frame[slot])
+    value = _const_property(frame[slot], property_name, constants)
+    return text if value is None else value
+
+def _map_operands(instruction, convert):
+    """Apply convert to every operand of an instruction"""
+    op, a, b = instruction
+    if op in (OP_CALL, OP_CALL_FFI, OP_CALL_XIL, OP_CALL_ASYNC):
+        return (op, a, tuple(convert(operand) for operand in b))
+    if op == OP_CMP:
+        return (op, convert(a), convert(b))
+    if op == OP_IF:
+        return (op, convert(a), b)
+    if op == OP_BRANCH:
+        return (op, (convert(a[0]), convert(a[1]), convert(a[2]), a[3]), b)
+    return instruction
+
+def compile_function(func_name, statements, constants=None, blocks=None, opt_level=1, noreturn=()):
+    """Lower the statements of a function into a CompiledFunction"""
+    return compile_ops(func_name, [_statement_op(stmt) for stmt in statements], constants, blocks,
+                       opt_level, noreturn)
+
+def compile_ops(func_name, ops, constants=None, blocks=None, opt_level=1, noreturn=()):
+    """Lower a function given as (operation, arguments) pairs into a CompiledFunction
+
+    Arguments are the raw statement values of the translator: a list of
+    strings for call, const, cmp and if, a string for move and label and a
+    list of {'name', 'type'} parameters for decl.
+
+    opt_level 0 keeps one instruction per statement, opt_level 1 runs the
+    peephole optimizer, noreturn are the names of functions which never
+    return.
+    """
+    if blocks is None:
+        blocks = index_ops(ops)
+    if constants is None:
+        constants = {}
+
+    # Frame layout, parameters first in decl order, then the other locals
+    slots = {}
+    for i in blocks.decls:
+        for param in ops[i][1]:
+            slots.setdefault(param['name'].strip(), len(slots))
+    decls = tuple(tuple(slots[param['name'].strip()] for param in ops[i][1]) for i in blocks.decls)
+    decls = tuple(decl for decl in decls if decl)
+
+    const_values = {}
+    moved = set(slots)
+    for op, args in ops:
+        if op == 'move':
+            moved.add(args.strip())
+            slots.setdefault(args.strip(), len(slots))
+        elif op == 'const' and len(args) >= 2:
+            name = args[0].strip()
+            slots.setdefault(name, len(slots))
+            values = const_values.setdefault(name, [])
+            value = _parse_const_value(args[1].strip())
+            if value not in values:
+                values.append(value)
+            constants[value] = value
+    slots[CMP_SLOT_NAME] = len(slots)
+    const_only = set(const_values) - moved
+
+    def operand(text):
+        return _resolve_operand(text.strip(), slots, const_values, const_only, constants)
+
+    body = []
+    stmt_pcs = []
+    statements = []
+    jumps = []
+    for i, (op, args) in enumerate(ops):
+        # A label points to the instruction following it
+        stmt_pcs.append(len(body))
+        # Instructions so far belong to the previous statement
+        statements.extend([i - 1] * (len(body) - len(statements)))
+        if op == 'call':
+            if args:
+                body.append((OP_CALL, args[0].strip(), tuple(operand(arg) for arg in args[1:])))
+        elif op == 'move':
+            body.append((OP_MOVE, slots[args.strip()], args.strip()))
+        elif op == 'const':
+            if len(args) < 2:
+                print(f"Error: const statement requires variable name and value")
+                continue
+            body.append((OP_CONST, slots[args[0].strip()], _parse_const_value(args[1].strip())))
+        elif op == 'cmp':
+            if len(args) < 2:
+                print(f"Error: cmp statement requires two operands")
+                continue
+            body.append((OP_CMP, operand(args[0]), operand(args[1])))
+        elif op == 'if':
+            if len(args) < 2:
+                print(f"Error: if statement requires condition value and label name")
+                continue
+            jumps.append(len(body))
+            body.append((OP_IF, operand(args[0]), args[1].strip()))
+
+    statements.extend([len(ops) - 1] * (len(body) - len(statements)))
+
+    # Resolve jump targets, unknown labels are kept by name and reported when taken
+    for pc in jumps:
+        _, cond, label_name = body[pc]
+        target = blocks.labels.get(label_name)
+        body[pc] = (OP_IF, cond, stmt_pcs[target] if target is not None else label_name)
+
+    statements = tuple(statements)
+    if opt_level >= 1:
+        from .optimizer import optimize
+        body, statements = optimize(body, statements, slots[CMP_SLOT_NAME], noreturn)
+
+    return CompiledFunction(func_name, body, blocks, slots, decls, statements)
+
+def compile_module(module, constants=None, opt_level=1, cache=None):
+    """Lower all functions of a module, const literals are registered in constants
+
+    Functions are taken from 'ops' for modules loaded from a graph and
+    from the statements in 'fun' otherwise. Functions found in a
+    CompileCache aren't compiled again, new ones are added to it.
+    """
+    from .optimizer import NORETURN
+    from .builtin import noreturn_intrinsics
+    # Only foreign functions and intrinsics are known not to return, a module function may be named exit
+    functions = module['ops'] if 'ops' in module else module.get('fun', {})
+    noreturn = {name for name in module.get('ffi', {}) if name in NORETURN and name not in functions}
+    noreturn |= noreturn_intrinsics(module)
+    if constants is None:
+        constants = {}
+    blocks = module.get('blocks', {})
+    compiled = {}
+    for name, body in functions.items():
+        ops = body if 'ops' in module else [_statement_op(stmt) for stmt in body]
+        if cache is None:
+            compiled[name] = compile_ops(name, ops, constants, blocks.get(name), opt_level, noreturn)
+            continue
+        from .cache import function_key
+        key = function_key(name, ops, opt_level, noreturn)
+        func = cache.get(key, constants)
+        if func is None:
+            func = compile_ops(name, ops, constants, blocks.get(name), opt_level, noreturn)
+            cache.put(key, func)
+        compiled[name] = func
+    return compiled
+
+def _pop_params(func, frame, stack):
+    """Assign the parameters of all decl statements from the value stack"""
+    for decl in func.decls:
+        count = len(decl)
+        if len(stack) < count:
+            print(f"Error: Stack has only {len(stack)} values, but {count} parameters expected")
+            continue
+        values = stack[len(stack) - count:]
+        del stack[len(stack) - count:]
+        for slot, value in zip(decl, values):
+            frame[slot] = value
+
+def _enter(func, args, stack):
+    """Take a frame from the free list and copy the arguments into its slots
+
+    Arguments are only passed through the value stack if the function
+    doesn't have exactly one decl which can take them all.
+    """
+    try:
+        # pop() is atomic, threads running the same function never share a frame
+        frame = func.frames.pop()
+    except IndexError:
+        frame = list(func.template)
+    decls = func.decls
+    if len(decls) == 1 and len(args) >= len(decls[0]):
+        decl = decls[0]
+        skip = len(args) - len(decl)
+        if skip:
+            # Surplus arguments stay on the stack, like a decl would leave them
+            stack.extend(args[:skip])
+        for slot, value in zip(decl, args[skip:]):
+            frame[slot] = value
+    else:
+        stack.extend(args)
+        _pop_params(func, frame, stack)
+    return frame
+
+def _leave(func, frame):
+    """Reset a frame and put it back on the free list"""
+    frame[:] = func.template
+    func.frames.append(frame)
+
+def _run(func, frame, functions, ffi_functions, stack, instrument=None):
+    """Run the instructions of a function in the given frame, see _interpret"""
+    for _ in _interpret(func, frame, functions, ffi_functions, stack, instrument):
+        pass
+
+def _interpret(func, frame, functions, ffi_functions, stack, instrument=None, blocking=None, budget=0):
+    """The interpreter loop of the bytecode tier, the profiler and the scheduler
+
+    Module calls don't recurse on the Python stack, the callers wait on an
+    explicit call stack with their return address, so the call depth is
+    only limited by memory. A call which is the last instruction of a
+    function reuses the frame of its caller.
+
+    An Instrument passed as instrument sees function entries and exits and
+    FFI calls through its hooks, async calls run synchronously then. The
+    scheduler passes the ids of the foreign functions to wait for in
+    blocking and a budget of calls and taken jumps, the loop yields None
+    when the budget is used up and (foreign function, args) for async
+    calls and blocking calls, the caller sends the result back. Without
+    them the generator never yields.
+    """
+    # Callers as (function, frame, return address)
+    calls = []
+    code = func.code
+    end = len(code)
+    cmp_slot = len(frame) - 1
+    pc = 0
+    # Never reaches 0 without a budget
+    ticks = budget or -1
+    counts = None
+    if instrument is not None:
+        counts = [0] * len(OPCODE_NAMES)
+        instrument.enter(func)
+    try:
+        while True:
+            while pc < end:
+                op, a, b = code[pc]
+                pc += 1
+                if counts is not None:
+                    counts[op] += 1
+                if op == OP_CALL_FFI:
+                    args = [value if kind >= OPERAND_IMMEDIATE
+                            else frame[value] if kind == OPERAND_LOCAL
+                            else _read_property(value, frame)
+                            for kind, value in b]
+                    if instrument is not None:
+                        result = instrument._call_bound(a, args, func, pc)
+                    elif blocking and id(a) in blocking:
+                        result = yield a, args
+                    else:
+                        result = a(*args)
+                    if result is not None:
+                        stack.append(result)
+                elif op == OP_CALL_XIL:
+                    args = [value if kind >= OPERAND_IMMEDIATE
+                            else frame[value] if kind == OPERAND_LOCAL
+                            else _read_property(value, frame)
+                            for kind, value in b]
+                    ticks -= 1
+                    if not ticks:
+                        ticks = budget
+                        yield None
+                    if pc < end:
+                        calls.append((func, frame, pc))
+                    else:
+                        # Tail call, the callee can take over the frame of the caller
+                        if func.futures:
+                            _join_pending(func, frame)
+                        if instrument is not None:
+                            instrument.leave(func)
+                        _leave(func, frame)
+                    func = a
+                    frame = _enter(a, args, stack)
+                    code = func.code
+                    end = len(code)
+                    cmp_slot = len(frame) - 1
+                    pc = 0
+                    if instrument is not None:
+                        instrument.enter(func)
+                elif op == OP_BRANCH:
+                    (kind, val1), (kind2, val2), (kind3, cond), store = a
+                    if kind < OPERAND_IMMEDIATE:
+                        val1 = frame[val1] if kind == OPERAND_LOCAL else _read_property(val1, frame)
+                    if kind2 < OPERAND_IMMEDIATE:
+                        val2 = frame[val2] if kind2 == OPERAND_LOCAL else _read_property(val2, frame)
+                    if val1 == val2:
+                        result = 0
+                    elif isinstance(val1, (int, float)) and isinstance(val2, (int, float)) and val1 > val2:
+                        result = 1
+                    else:
+                        result = -1
+                    if store:
+                        frame[cmp_slot] = result
+                    if kind3 < OPERAND_IMMEDIATE:
+                        cond = frame[cond] if kind3 == OPERAND_LOCAL else _read_property(cond, frame)
+                    if cond != result:
+                        pc = b
+                        ticks -= 1
+                        if not ticks:
+                            ticks = budget
+                            yield None
+                elif op == OP_MOVE:
+                    if not stack:
+                        print(f"Error: Stack is empty, cannot move to variable '{b}'")
+                        continue
+                    frame[a] = stack.pop()
+                elif op == OP_CMP:
+                    kind, val1 = a
+                    if kind < OPERAND_IMMEDIATE:
+                        val1 = frame[val1] if kind == OPERAND_LOCAL else _read_property(val1, frame)
+                    kind, val2 = b
+                    if kind < OPERAND_IMMEDIATE:
+                        val2 = frame[val2] if kind == OPERAND_LOCAL else _read_property(val2, frame)
+                    if val1 == val2:
+                        frame[cmp_slot] = 0
+                    elif isinstance(val1, (int, float)) and isinstance(val2, (int, float)) and val1 > val2:
+                        frame[cmp_slot] = 1
+                    else:
+                        frame[cmp_slot] = -1
+                elif op == OP_IF:
+                    kind, cond = a
+                    if kind < OPERAND_IMMEDIATE:
+                        cond = frame[cond] if kind == OPERAND_LOCAL else _read_property(cond, frame)
+                    if cond != frame[cmp_slot]:
+                        if b.__class__ is not int:
+                            print(f"Error: Label '{b}' not found")
+                            # Leave the function
+                            break
+                        pc = b
+                        ticks -= 1
+                        if not ticks:
+                            ticks = budget
+                            yield None
+                elif op == OP_CONST:
+                    frame[a] = b
+                elif op == OP_JUMP:
+                    pc = b
+                    ticks -= 1
+                    if not ticks:
+                        ticks = budget
+                        yield None
+                elif op == OP_CALL_ASYNC:
+                    args = [value if kind >= OPERAND_IMMEDIATE
+                            else frame[value] if kind == OPERAND_LOCAL
+                            else _read_property(value, frame)
+                            for kind, value in b]
+                    if instrument is not None:
+                        # Synchronous, so the hooks see the calls in order
+                        stack.append(instrument._call_bound(a, args, func, pc))
+                    elif blocking is not None:
+                        # The task waits instead of the instruction reading the result,
+                        # a Future joined inside the event loop would block all tasks
+                        stack.append((yield a, args))
+                    else:
+                        # The move behind the call replaces the Future of the last call, wait for it first
+                        _join(frame[code[pc][1]])
+                        stack.append(_ffi_pool().submit(a, *args))
+                elif op == OP_CALL:
+                    # Late bound call, unlinked code or a name the linker didn't know
+                    args = [value if kind >= OPERAND_IMMEDIATE
+                            else frame[value] if kind == OPERAND_LOCAL
+                            else _read_property(value, frame)
+                            for kind, value in b]
+                    ffi_function = ffi_functions.get(a)
+                    if ffi_function is not None:
+                        if instrument is not None:
+                            result = instrument.call_ffi(a, ffi_function, args, func, pc)
+                        else:
+                            result = ffi_function(*args)
+                        if result is not None:
+                            stack.append(result)
+                    else:
+                        callee = functions.get(a)
+                        if callee is not None:
+                            ticks -= 1
+                            if not ticks:
+                                ticks = budget
+                                yield None
+                            if pc < end:
+                                calls.append((func, frame, pc))
+                            else:
+                                if func.futures:
+                                    _join_pending(func, frame)
+                                if instrument is not None:
+                                    instrument.leave(func)
+                                _leave(func, frame)
+                            func = callee
+                            frame = _enter(callee, args, stack)
+                            code = func.code
+                            end = len(code)
+                            cmp_slot = len(frame) - 1
+                            pc = 0
+                            if instrument is not None:
+                                instrument.enter(func)
+                        else:
+                            print(f"Warning: Function '{a}' not found")
+
+            # Return to the caller
+            if func.futures:
+                _join_pending(func, frame)
+            if instrument is not None:
+                instrument.leave(func)
+            if not calls:
+                return
+            _leave(func, frame)
+            func, frame, pc = calls.pop()
+            code = func.code
+            end = len(code)
+            cmp_slot = len(frame) - 1
+    except BaseException:
+        if instrument is not None:
+            # The builtin exit or an error ends the run, the calls still running end with it
+            instrument.leave(func)
+            for caller, _, _ in reversed(calls):
+                instrument.leave(caller)
+        raise
+    finally:
+        if instrument is not None:
+            instrument.finish(counts)
+
+def execute(functions, func_name, ffi_functions, stack, constants):
+    """Execute a compiled function, its parameters are taken from the stack"""
+    func = functions.get(func_name)
+    if func is None:
+        print(f"Error: Function '{func_name}' not found")
+        return
+    frame = list(func.template)
+    _pop_params(func, frame, stack)
+    _run(func, frame, functions, ffi_functions, stack)
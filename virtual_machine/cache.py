@@ -0,0 +1,115 @@
+import hashlib
+import marshal
+import os
+import sys
+from pathlib import Path
+
+from .analysis import BlockIndex
+from .bytecode import OP_CONST, OPERAND_PROPERTY, CompiledFunction, _map_operands
+
+# Magic number of compiled function caches (.xvmc)
+FOURCC = b'XVMC'
+# Bump when the lowering or the optimizer changes, older caches are ignored
+COMPILER_VERSION = 2
+# Directory next to the graphs which holds the caches, one file per module
+CACHE_DIR = '__xilcache__'
+
+def cache_path(graph_path, module_name):
+    """Return the cache file of a module loaded from the given graph"""
+    return Path(graph_path).resolve().parent / CACHE_DIR / f"{module_name}.xvmc"
+
+def function_key(name, ops, opt_level, noreturn):
+    """Hash of a function's operations and everything else its compilation depends on"""
+    source = repr((COMPILER_VERSION, name, ops, opt_level, sorted(noreturn)))
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def _dump_operand(operand):
+    """Return an operand without process-local objects"""
+    kind, value = operand
+    if kind == OPERAND_PROPERTY:
+        # The constants of the run are attached again on load
+        return (kind, value[:3])
+    return operand
+
+def _load_operand(operand, constants):
+    """Inverse of _dump_operand"""
+    kind, value = operand
+    if kind == OPERAND_PROPERTY:
+        return (kind, value + (constants,))
+    return operand
+
+class CompileCache:
+    """Compiled functions of a module, kept in one file between processes
+
+    Entries are keyed by function_key, so a function is only compiled again
+    if its operations, the optimization level or the compiler change. The
+    file is read once when the cache is created and written by save() if
+    functions were added, entries no function asked for are dropped then.
+    Foreign symbols and string addresses aren't stored, they change
+    between processes. link() resolves the symbols and materialize() puts
+    the strings into an arena on every start.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        self.entries = self._read()
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+        self._dirty = False
+
+    def _read(self):
+        try:
+            data = self.file_path.read_bytes()
+        except OSError:
+            return {}
+        if data[:len(FOURCC)] != FOURCC:
+            print(f"Warning: {self.file_path} is not a xil compile cache, ignoring it")
+            return {}
+        try:
+            version, python_version, entries = marshal.loads(data[len(FOURCC):])
+        except (EOFError, ValueError, TypeError):
+            print(f"Warning: Compile cache {self.file_path} is damaged, ignoring it")
+            return {}
+        if version != COMPILER_VERSION or python_version != tuple(sys.version_info[:2]):
+            return {}
+        return entries
+
+    def get(self, key, constants):
+        """Return the cached function of a key, None if it isn't cached"""
+        entry = self.entries.get(key)
+        self._used.add(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        name, code, blocks, slots, decls, statements = entry
+        code = [_map_operands(instruction, lambda operand: _load_operand(operand, constants))
+                for instruction in code]
+        for op, _, value in code:
+            if op == OP_CONST:
+                constants[value] = value
+        return CompiledFunction(name, code, BlockIndex(*blocks), slots, decls, statements)
+
+    def put(self, key, func):
+        """Store a function before link() binds its calls"""
+        blocks = func.blocks
+        self.entries[key] = (
+            func.name,
+            [_map_operands(instruction, _dump_operand) for instruction in func.code],
+            (blocks.labels, blocks.decls, blocks.block_starts, blocks.jump_targets, blocks.successors),
+            func.slots, func.decls, func.statements)
+        self._used.add(key)
+        self._dirty = True
+
+    def save(self):
+        """Write the cache if functions were added, the old file is replaced at once"""
+        if not self._dirty:
+            return
+        self.entries = {key: entry for key, entry in self.entries.items() if key in self._used}
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        data = FOURCC + marshal.dumps((COMPILER_VERSION, tuple(sys.version_info[:2]), self.entries))
+        temp_path = self.file_path.with_name(f"{self.file_path.name}.{os.getpid()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, self.file_path)
+        self._dirty = False
@@ -0,0 +1,349 @@
+import ctypes
+
+from .bytecode import (OP_CALL, OP_MOVE, OP_CMP, OP_IF, OP_CONST, OP_JUMP, OP_BRANCH, OP_CALL_FFI, OP_CALL_XIL,
+                       OP_CALL_ASYNC, OPERAND_LOCAL, OPERAND_PROPERTY,
+                       OPERAND_IMMEDIATE, CMP_SLOT_NAME,
+                       _const_property, _join, _enter, _pop_params, _run)
+from .ffi import _ffi_pool
+
+# Return types of foreign functions which never return None
+_NUMERIC_RESTYPES = (ctypes.c_int8, ctypes.c_int16, ctypes.c_int32, ctypes.c_int64,
+                     ctypes.c_uint8, ctypes.c_uint16, ctypes.c_uint32, ctypes.c_uint64,
+                     ctypes.c_float, ctypes.c_double, ctypes.c_bool)
+
+def _property(value, property_name, text, constants):
+    """Read a property of a local which may hold different const values or a Future"""
+    if property_name is None:
+        return _join(value)
+    result = _const_property(value, property_name, constants)
+    return text if result is None else result
+
+def _blocks(code):
+    """Return the instruction index where each basic block of compiled code starts"""
+    starts = {0}
+    for pc, (op, a, b) in enumerate(code):
+        if op in (OP_IF, OP_BRANCH, OP_JUMP):
+            if b.__class__ is int:
+                starts.add(b)
+            starts.add(pc + 1)
+    return sorted(start for start in starts if start < len(code))
+
+class _Generator:
+    """Writes the Python source of one compiled function
+
+    Locals become Python locals named after their frame slot, basic blocks
+    become branches of a dispatch loop and a block which jumps back to its
+    own start becomes an inner while loop.
+    """
+
+    def __init__(self, func, index, namespace):
+        self.func = func
+        self.index = index
+        self.namespace = namespace
+        self.lines = []
+
+    def bind(self, value):
+        """Bind a value into the namespace of the generated code and return its name"""
+        name = f"_k{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def operand(self, operand):
+        """Return the Python expression of an operand"""
+        kind, value = operand
+        if kind == OPERAND_LOCAL:
+            return f"v{value}"
+        if kind == OPERAND_PROPERTY:
+            slot, property_name, text, _ = value
+            return f"_property(v{slot}, {property_name!r}, {text!r}, _constants)"
+        if value.__class__ in (int, str):
+            return repr(value)
+        return self.bind(value)
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def emit_call(self, depth, op, a, operands, target=None):
+        """Emit a call, returns True if its result was moved into the local target"""
+        args = [self.operand(operand) for operand in operands]
+        if op == OP_CALL:
+            # Late bound, looked up when the call runs
+            self.emit(depth, f"_late(_stack, {a!r}{''.join(', ' + arg for arg in args)})")
+            return False
+        if op == OP_CALL_ASYNC:
+            self.namespace.setdefault('_submit', _ffi_pool().submit)
+            call = f"_submit({self.bind(a)}{''.join(', ' + arg for arg in args)})"
+            if target is not None:
+                # Wait for the Future of the last call before replacing it
+                self.emit(depth, f"_join(v{target})")
+                self.emit(depth, f"v{target} = {call}")
+                return True
+            self.emit(depth, f"_stack.append({call})")
+            return False
+        if op == OP_CALL_FFI:
+            ffi_function = a
+            call = f"{self.bind(ffi_function)}({', '.join(args)})"
+            restype = getattr(ffi_function, 'restype', ctypes.c_void_p)
+            if restype is None:
+                self.emit(depth, call)
+            elif restype in _NUMERIC_RESTYPES:
+                if target is not None:
+                    # The result is always pushed, a following move takes it right away
+                    self.emit(depth, f"v{target} = {call}")
+                    return True
+                self.emit(depth, f"_stack.append({call})")
+            else:
+                self.emit(depth, f"_r = {call}")
+                self.emit(depth, "if _r is not None: _stack.append(_r)")
+            return False
+        callee = a
+        index = self.functions_index[callee.name]
+        params = callee.decls[0] if len(callee.decls) == 1 else ()
+        if params and len(args) >= len(params):
+            # Same argument passing as _enter, surplus arguments stay on the stack
+            skip = len(args) - len(params)
+            if skip:
+                self.emit(depth, f"_stack.extend(({', '.join(args[:skip])},))")
+            self.emit(depth, f"_f{index}(_stack{''.join(', ' + arg for arg in args[skip:])})")
+        else:
+            if args:
+                self.emit(depth, f"_stack.extend(({', '.join(args)},))")
+            self.emit(depth, f"_e{index}(_stack)")
+        return False
+
+    def emit_return(self, depth):
+        """Emit a return, which waits for the async calls whose result wasn't read like _join_pending"""
+        for slot in self.func.futures:
+            self.emit(depth, f"_join(v{slot})")
+        self.emit(depth, "return")
+
+    def emit_cmp(self, depth, a, b):
+        values = []
+        for operand in (a, b):
+            expression = self.operand(operand)
+            if operand[0] == OPERAND_PROPERTY:
+                self.emit(depth, f"_t{len(values)} = {expression}")
+                expression = f"_t{len(values)}"
+            values.append(expression)
+        # Immediates are checked for numbers here, locals when the cmp runs
+        checks = [f"isinstance({value}, _NUMBER)" for operand, value in zip((a, b), values)
+                  if operand[0] < OPERAND_IMMEDIATE]
+        numeric = all(operand[0] < OPERAND_IMMEDIATE or isinstance(operand[1], (int, float))
+                      for operand in (a, b))
+        self.emit(depth, f"if {values[0]} == {values[1]}: _c = 0")
+        if numeric:
+            self.emit(depth, f"elif {' and '.join(checks + [f'{values[0]} > {values[1]}'])}: _c = 1")
+        self.emit(depth, "else: _c = -1")
+
+    def emit_block(self, depth, start, end, block_of, loop):
+        """Emit the instructions of a basic block, loop blocks break instead of jumping back"""
+        code = self.func.code
+        fused = False
+        for pc in range(start, end):
+            op, a, b = code[pc]
+            if fused:
+                fused = False
+                continue
+            if op in (OP_CALL_FFI, OP_CALL_XIL, OP_CALL, OP_CALL_ASYNC):
+                following = code[pc + 1] if pc + 1 < end else None
+                target = following[1] if following is not None and following[0] == OP_MOVE else None
+                fused = self.emit_call(depth, op, a, b, target)
+            elif op == OP_MOVE:
+                self.emit(depth, f"if _stack: v{a} = _stack.pop()")
+                self.emit(depth, f"else: print({'Error: Stack is empty, cannot move to variable ' + repr(b)!r})")
+            elif op == OP_CMP:
+                self.emit_cmp(depth, a, b)
+            elif op == OP_JUMP:
+                self.emit(depth, f"_b = {block_of[b]}")
+                self.emit(depth, "continue")
+            elif op in (OP_IF, OP_BRANCH):
+                if op == OP_BRANCH:
+                    # The compare state is a Python local, storing it is cheap
+                    self.emit_cmp(depth, a[0], a[1])
+                    a = a[2]
+                condition = self.operand(a)
+                if b.__class__ is not int:
+                    self.emit(depth, f"if {condition} != _c:")
+                    self.emit(depth + 1, f"print({'Error: Label ' + repr(b) + ' not found'!r})")
+                    self.emit_return(depth + 1)
+                elif loop:
+                    self.emit(depth, f"if {condition} == _c:")
+                    self.emit(depth + 1, "break")
+                else:
+                    self.emit(depth, f"if {condition} != _c:")
+                    self.emit(depth + 1, f"_b = {block_of[b]}")
+                    self.emit(depth + 1, "continue")
+            elif op == OP_CONST:
+                # The optimizer folds compares of literals into a const of the compare state
+                target = '_c' if a == self.func.slots[CMP_SLOT_NAME] else f"v{a}"
+                self.emit(depth, f"{target} = {self.operand((OPERAND_IMMEDIATE, b))}")
+
+    def generate(self, functions_index):
+        """Return the Python source of the function"""
+        self.functions_index = functions_index
+        func = self.func
+        code = func.code
+        params = _direct_params(func)
+        if params:
+            self.emit(0, f"def _f{self.index}(_stack, {', '.join(f'v{slot}' for slot in params)}):")
+        else:
+            self.emit(0, f"def _f{self.index}(_stack):")
+        for name, slot in func.slots.items():
+            if slot not in params and name != CMP_SLOT_NAME:
+                self.emit(1, f"v{slot} = {name!r}")
+        self.emit(1, "_c = 0")
+        if not params:
+            for decl in func.decls:
+                self.emit(1, f"if len(_stack) < {len(decl)}:")
+                self.emit(2, f"print(f\"Error: Stack has only {{len(_stack)}} values, but {len(decl)} parameters expected\")")
+                self.emit(1, "else:")
+                self.emit(2, f"{''.join(f'v{slot}, ' for slot in decl)}= _stack[-{len(decl)}:]")
+                self.emit(2, f"del _stack[-{len(decl)}:]")
+
+        starts = _blocks(code)
+        if len(starts) <= 1 and not any(op in (OP_IF, OP_BRANCH, OP_JUMP) for op, _, _ in code):
+            self.emit_block(1, 0, len(code), {}, False)
+            self.emit_return(1)
+            return '\n'.join(self.lines) + '\n', bool(params)
+
+        block_of = {start: block_id for block_id, start in enumerate(starts)}
+        # A label at the end of the function jumps behind the last block
+        block_of[len(code)] = len(starts)
+        self.emit(1, "_b = 0")
+        self.emit(1, "while True:")
+        for block_id, start in enumerate(starts):
+            end = starts[block_id + 1] if block_id + 1 < len(starts) else len(code)
+            op, _, target = code[end - 1]
+            self.emit(2, f"if _b == {block_id}:")
+            if op in (OP_IF, OP_BRANCH) and target == start:
+                self.emit(3, "while True:")
+                self.emit_block(4, start, end, block_of, True)
+            else:
+                self.emit_block(3, start, end, block_of, False)
+            self.emit(3, f"_b = {block_id + 1}")
+        self.emit_return(2)
+        return '\n'.join(self.lines) + '\n', bool(params)
+
+def _direct_params(func):
+    """Parameter slots a generated function takes as Python parameters
+
+    Only functions with exactly one decl take their parameters directly,
+    like _enter. A parameter name used twice can't be a Python parameter.
+    """
+    params = func.decls[0] if len(func.decls) == 1 else ()
+    return params if len(set(params)) == len(params) else ()
+
+def _interpreted(func, functions, ffi_functions):
+    """Entry points which run a function in the bytecode interpreter"""
+    def direct(stack, *args):
+        # A tail call may hand the frame over to another function, so it isn't left here
+        _run(func, _enter(func, args, stack), functions, ffi_functions, stack)
+
+    def entry(stack):
+        frame = list(func.template)
+        _pop_params(func, frame, stack)
+        _run(func, frame, functions, ffi_functions, stack)
+
+    return direct, entry
+
+def _stack_entry(func, direct):
+    """Entry point which takes the parameters of a function from the value stack"""
+    decl = func.decls[0]
+    count = len(decl)
+    defaults = tuple(func.template[slot] for slot in decl)
+
+    def entry(stack):
+        if len(stack) < count:
+            print(f"Error: Stack has only {len(stack)} values, but {count} parameters expected")
+            return direct(stack, *defaults)
+        args = stack[len(stack) - count:]
+        del stack[len(stack) - count:]
+        return direct(stack, *args)
+
+    return entry
+
+def _stack_call(entry):
+    """Call a function which takes its parameters from the stack with direct arguments"""
+    def direct(stack, *args):
+        stack.extend(args)
+        return entry(stack)
+
+    return direct
+
+def _late_call(functions_index, ffi_functions, namespace):
+    """Call by name for the calls the linker left late bound, looked up on every call"""
+    def call(stack, name, *args):
+        ffi_function = ffi_functions.get(name)
+        if ffi_function is not None:
+            result = ffi_function(*args)
+            if result is not None:
+                stack.append(result)
+        elif name in functions_index:
+            stack.extend(args)
+            namespace[f"_e{functions_index[name]}"](stack)
+        else:
+            print(f"Warning: Function '{name}' not found")
+
+    return call
+
+def _recursive(functions, ffi_functions):
+    """Return the names of the functions which can call themselves, directly or not"""
+    callees = {name: {a.name if op == OP_CALL_XIL else a for op, a, _ in func.code
+                      if op == OP_CALL_XIL or (op == OP_CALL and a not in ffi_functions and a in functions)}
+               for name, func in functions.items()}
+    recursive = set()
+    for name in functions:
+        seen = set()
+        pending = list(callees[name])
+        while pending:
+            callee = pending.pop()
+            if callee == name:
+                recursive.add(name)
+                break
+            if callee not in seen:
+                seen.add(callee)
+                pending.extend(callees[callee])
+    return recursive
+
+def compile_closures(functions, ffi_functions, constants, calls=None):
+    """Turn compiled functions into Python functions
+
+    Each function is generated as Python source and compiled once. Functions
+    which can't be generated fall back to the bytecode interpreter, as do
+    recursive functions: generated functions call each other on the Python
+    stack while the interpreter keeps its own call stack. Calls are expected
+    to be bound by link(), calls by name are looked up when they run.
+    Returns function name -> callable which takes its parameters from the
+    value stack, like execute. A dict passed as calls receives function
+    name -> (callable, count) of the callables which take count parameters
+    as Python arguments after the stack, count None takes any number.
+    """
+    namespace = {'_property': _property, '_join': _join, '_constants': constants, '_NUMBER': (int, float)}
+    functions_index = {name: index for index, name in enumerate(functions)}
+    namespace['_late'] = _late_call(functions_index, ffi_functions, namespace)
+    recursive = _recursive(functions, ffi_functions)
+    entries = {}
+    for name, func in functions.items():
+        index = functions_index[name]
+        # Parameters the direct callable takes as Python arguments, None for any number
+        count = None
+        if name in recursive:
+            namespace[f"_f{index}"], namespace[f"_e{index}"] = _interpreted(func, functions, ffi_functions)
+        else:
+            try:
+                source, direct = _Generator(func, index, namespace).generate(functions_index)
+                exec(compile(source, f"<xil {name}>", 'exec'), namespace)
+                generated = namespace[f"_f{index}"]
+                if direct:
+                    namespace[f"_e{index}"] = _stack_entry(func, generated)
+                    count = len(func.decls[0])
+                else:
+                    namespace[f"_e{index}"] = generated
+                    namespace[f"_f{index}"] = _stack_call(generated)
+            except (SyntaxError, RecursionError, MemoryError, ValueError) as e:
+                print(f"Warning: Function '{name}' runs interpreted: {e}")
+                namespace[f"_f{index}"], namespace[f"_e{index}"] = _interpreted(func, functions, ffi_functions)
+        entries[name] = namespace[f"_e{index}"]
+        if calls is not None:
+            calls[name] = (namespace[f"_f{index}"], count)
+    return entries
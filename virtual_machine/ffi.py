@@ -0,0 +1,200 @@
+import ctypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .memory import address
+from .layout import CTYPES, TypeLayouts
+
+# Process-wide caches, shared by every module run in this process.
+# library name -> loaded library, None if it couldn't be loaded
+_libraries = {}
+# (calling convention, restype, argtypes) -> function prototype
+_prototypes = {}
+# (library name, symbol, restype, argtypes) -> foreign function, None if missing
+_symbols = {}
+_lock = threading.Lock()
+# Workers of async foreign functions, created on the first async call
+_pool = None
+
+def _ffi_pool():
+    """Return the thread pool async foreign functions run on
+
+    ctypes releases the GIL while the foreign function runs, so the VM
+    goes on with the next instructions until the result is used.
+    """
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(thread_name_prefix='xil-ffi')
+    return _pool
+
+def _map_type_to_ctypes(xil_type, layouts=None):
+    """Map XIL type to ctypes type, declared types of the module map to their structure"""
+    if xil_type in CTYPES:
+        return CTYPES[xil_type]
+    if layouts is not None and xil_type in layouts:
+        return layouts.ctype(xil_type)
+    return ctypes.c_void_p
+
+def _argument_converters(arg_types):
+    """Return one converter per argument, None if ctypes converts the value itself
+
+    argtypes already turns addresses (int) and ctypes objects into pointer
+    arguments, only pointers into the linear memory of the VM are turned
+    into addresses first. Structures passed by value are read in place
+    from the address or Pointer the VM holds.
+    """
+    return tuple(address if arg_type is ctypes.c_void_p
+                 else _structure_argument(arg_type) if issubclass(arg_type, ctypes.Structure)
+                 else None for arg_type in arg_types)
+
+def _structure_argument(structure):
+    """Return a converter which views the struct at an address as structure, no copy is made"""
+    def convert(value):
+        if value.__class__ is structure:
+            return value
+        return structure.from_address(address(value))
+    return convert
+
+def _make_ffi_function(c_func, func_name, converters):
+    """Specialize the call of a foreign function for its argument converters"""
+    if not any(converters):
+        # Nothing to convert, call the foreign function directly
+        return c_func
+
+    count = len(converters)
+    def wrapper(*args):
+        converted_args = [arg if convert is None else convert(arg)
+                          for convert, arg in zip(converters, args)]
+        converted_args.extend(args[count:])
+        return c_func(*converted_args)
+    wrapper.__name__ = func_name
+    # The closure tier specializes calls on the result type
+    wrapper.restype = c_func.restype
+    return wrapper
+
+def load_library(lib_name):
+    """Load a shared library once per process, returns None if it can't be loaded"""
+    with _lock:
+        if lib_name in _libraries:
+            return _libraries[lib_name]
+        try:
+            if lib_name.endswith('.dll'):
+                lib = ctypes.WinDLL(lib_name)
+            else:
+                lib = ctypes.CDLL(lib_name)
+        except OSError as e:
+            print(f"Warning: Could not load library {lib_name}: {e}")
+            lib = None
+        _libraries[lib_name] = lib
+        return lib
+
+def _prototype(lib_name, restype, argtypes):
+    """Return the function prototype of a signature, built once per process"""
+    stdcall = lib_name.endswith('.dll')
+    key = (stdcall, restype, argtypes)
+    prototype = _prototypes.get(key)
+    if prototype is None:
+        factory = ctypes.WINFUNCTYPE if stdcall else ctypes.CFUNCTYPE
+        prototype = factory(restype, *argtypes)
+        _prototypes[key] = prototype
+    return prototype
+
+def resolve_symbol(lib_name, symbol_name, restype, argtypes):
+    """Return the foreign function of a symbol and signature, None if it doesn't exist
+
+    Every (symbol, signature) gets its own function object, so argtypes and
+    restype of a function shared with other callers are never changed.
+    """
+    key = (lib_name, symbol_name, restype, argtypes)
+    if key in _symbols:
+        return _symbols[key]
+    lib = load_library(lib_name)
+    with _lock:
+        if key not in _symbols:
+            function = None
+            if lib is not None:
+                try:
+                    function = _prototype(lib_name, restype, argtypes)((symbol_name, lib))
+                except AttributeError:
+                    function = None
+            _symbols[key] = function
+        return _symbols[key]
+
+class _LazySymbol:
+    """Placeholder for a foreign function which is resolved on its first call
+
+    After the symbol is resolved the placeholder replaces itself with the
+    foreign function in the ffi function table of the module.
+    """
+    __slots__ = ('func_name', 'lib_name', 'symbol_name', 'restype', 'argtypes', 'ffi_functions')
+
+    def __init__(self, func_name, lib_name, symbol_name, restype, argtypes, ffi_functions):
+        self.func_name = func_name
+        self.lib_name = lib_name
+        self.symbol_name = symbol_name
+        self.restype = restype
+        self.argtypes = argtypes
+        self.ffi_functions = ffi_functions
+
+    def resolve(self, warn=True):
+        """Resolve the symbol and bind it into the ffi function table"""
+        c_func = resolve_symbol(self.lib_name, self.symbol_name, self.restype, self.argtypes)
+        if c_func is None:
+            if warn:
+                print(f"Warning: Symbol {self.symbol_name} not found in library")
+            return None
+        function = _make_ffi_function(c_func, self.func_name, _argument_converters(self.argtypes))
+        self.ffi_functions[self.func_name] = function
+        return function
+
+    def __call__(self, *args):
+        function = self.resolve()
+        if function is None:
+            return None
+        return function(*args)
+
+def _generate_ffi_functions(module, layouts=None):
+    """Generate Python FFI functions for all FFI declarations
+
+    Libraries are loaded once per process, symbols are looked up on the
+    first call of each function. Declared types map to the structures of
+    layouts, the TypeLayouts of the module.
+    """
+    ffi_functions = {}
+    if layouts is None:
+        layouts = TypeLayouts(module.get('types'))
+
+    # Load libraries
+    for lib_name in module.get('libs', {}):
+        load_library(lib_name)
+
+    # Generate FFI functions
+    for func_name, func_decl in module.get('ffi', {}).items():
+        # Find which library contains this function
+        lib_name = None
+        symbol_name = func_name
+
+        for name, symbols in module.get('libs', {}).items():
+            if func_name in symbols:
+                lib_name = name
+                symbol_name = symbols[func_name]
+                break
+
+        if lib_name is None or _libraries.get(lib_name) is None:
+            print(f"Warning: No library found for FFI function {func_name}")
+            continue
+
+        # Argument and return types
+        arg_types = []
+        for arg in func_decl.get('args', []):
+            arg_type = _map_type_to_ctypes(arg['type'], layouts)
+            if arg_type is not None:
+                arg_types.append(arg_type)
+        return_type = _map_type_to_ctypes(func_decl.get('returns', 'void'), layouts)
+
+        ffi_functions[func_name] = _LazySymbol(func_name, lib_name, symbol_name, return_type,
+                                               tuple(arg_types), ffi_functions)
+
+    return ffi_functions
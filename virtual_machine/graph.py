@@ -0,0 +1,171 @@
+from schema import EdgeType, NodeType
+from operator import attrgetter
+from collections import defaultdict
+
+# Operation nodes of a statement and the statement keyword they stand for
+OPERATIONS = {
+    NodeType.OPCALL: 'call',
+    NodeType.OPMOVE: 'move',
+    NodeType.OPCONST: 'const',
+    NodeType.OPDECL: 'decl',
+    NodeType.OPCMP: 'cmp',
+    NodeType.OPLABEL: 'label',
+    NodeType.OPIF: 'if',
+}
+
+class _GraphIndex:
+    """Strings and children of all nodes, built in one pass over the edge columns"""
+
+    def __init__(self, graph):
+        edges = graph['edges'].elements
+        strings = graph['strings'].elements
+        textViews = graph['textViews'].elements if graph.get('textViews') else []
+        self.strings = defaultdict(list)
+        self.children = defaultdict(list)
+        self.text_views = {}
+        columns = zip(map(attrgetter('_src_type'), edges), map(attrgetter('_src_id'), edges),
+                      map(attrgetter('_sink_type'), edges), map(attrgetter('_sink_id'), edges),
+                      map(attrgetter('_type'), edges))
+        for src_type, src_id, sink_type, sink_id, edge_type in columns:
+            if edge_type is EdgeType.STRING:
+                self.strings[(src_type, src_id)].append(strings[sink_id])
+            elif edge_type is EdgeType.PARENTCHILD:
+                self.children[(sink_type, sink_id)].append((src_type, src_id))
+            elif edge_type is EdgeType.TEXTVIEW and sink_id < len(textViews):
+                self.text_views.setdefault((src_type, src_id), textViews[sink_id])
+
+    def name(self, node):
+        """Return the first string of a node"""
+        names = self.strings.get(node)
+        return names[0] if names else None
+
+    def nodes(self, parent, node_type):
+        """Return the children of a node with the given type, ordered by node id"""
+        return sorted(child for child in self.children.get(parent, ()) if child[0] is node_type)
+
+    def roots(self, node_type):
+        """Return all nodes of a type which own a string, ordered by node id"""
+        return sorted(node for node in self.strings if node[0] is node_type)
+
+    def literal(self, argument):
+        """Return the source text of a FUNCTIONARGUMENT"""
+        for child in self.children.get(argument, ()):
+            if child[0] in (NodeType.NUMBER, NodeType.STRING, NodeType.ID):
+                return self.name(child)
+        return self.name(argument)
+
+    def typed_arguments(self, parent):
+        """Return the FUNCTIONARGUMENT children of a FFI or decl node as name/type records"""
+        args = []
+        for argument in self.nodes(parent, NodeType.FUNCTIONARGUMENT):
+            types = self.nodes(argument, NodeType.TYPE)
+            args.append({'name': self.name(argument), 'type': self.name(types[0]) if types else 'ptr'})
+        return args
+
+    def return_type(self, parent):
+        """Return the TYPE child of a FFI or decl node"""
+        types = self.nodes(parent, NodeType.TYPE)
+        return self.name(types[0]) if types else 'void'
+
+    def type_declaration(self, node):
+        """Return a TYPE child of a module like the translator, size and alignment or fields"""
+        fields = self.nodes(node, NodeType.FUNCTIONARGUMENT)
+        if fields:
+            return {'fields': [dict(field, embed=True) if 'embed' in self.strings[argument][1:] else field
+                               for argument, field in zip(fields, self.typed_arguments(node))]}
+        decl = {}
+        for number in self.nodes(node, NodeType.NUMBER):
+            key, value = (self.strings[number] + [None, None])[:2]
+            if key in ('bytes', 'align') and value is not None:
+                decl[key] = int(value)
+        return decl
+
+    def operation(self, statement):
+        """Return a statement as (operation, arguments) pair"""
+        for child in self.children.get(statement, ()):
+            op = OPERATIONS.get(child[0])
+            if op is None:
+                continue
+            if op == 'label':
+                return op, self.name(child)
+            if op == 'decl':
+                return op, self.typed_arguments(child)
+            args = [self.literal(argument) for argument in self.nodes(child, NodeType.FUNCTIONARGUMENT)]
+            if op == 'move':
+                return op, args[0] if args else ''
+            return op, args
+        return None, None
+
+def load_graph(graph):
+    """
+    Reads the module declarations and function bodies of a graph.
+
+    Functions are returned as lists of (operation, arguments) pairs under
+    'ops', which the bytecode compiler lowers without going through the
+    statement dictionaries of the translator.
+
+    Args:
+        graph: Dictionary with 'edges', 'strings' and 'textViews'
+
+    Returns:
+        Dictionary with 'unit', 'module', 'use', 'libs', 'ffi', 'types', 'ops'
+        and 'textViews', the source positions of each function as (unit, TextViews)
+        like generateModules
+    """
+    index = _GraphIndex(graph)
+    units = index.roots(NodeType.UNIT)
+    modules = index.roots(NodeType.MODULE)
+    loaded = {
+        'unit': index.name(units[0]) if units else None,
+        'module': index.name(modules[0]) if modules else None,
+        'use': [name for node in index.roots(NodeType.USE) for name in index.strings[node]],
+        'libs': {},
+        'ffi': {},
+        'types': {},
+        'ops': {},
+        'textViews': {},
+    }
+    for library in index.roots(NodeType.LIBRARY):
+        imports = {}
+        for imported in index.nodes(library, NodeType.IMPORTLIBRARY):
+            for var in index.nodes(imported, NodeType.ID):
+                imports[index.name(var)] = index.name(imported)
+        loaded['libs'][index.name(library)] = imports
+    for ffi in index.roots(NodeType.FFI):
+        loaded['ffi'][index.name(ffi)] = {'args': index.typed_arguments(ffi), 'returns': index.return_type(ffi)}
+        if 'async' in index.strings[ffi][1:]:
+            loaded['ffi'][index.name(ffi)]['async'] = True
+    # TYPE nodes of arguments and return values have other parents
+    for declared in (index.nodes(modules[0], NodeType.TYPE) if modules else ()):
+        loaded['types'][index.name(declared)] = index.type_declaration(declared)
+    for function in index.roots(NodeType.FUNCTION):
+        statements = index.nodes(function, NodeType.STATEMENT)
+        loaded['ops'][index.name(function)] = [index.operation(statement) for statement in statements]
+        if function in index.text_views:
+            views = [index.text_views[function]] + [index.text_views.get(statement) for statement in statements]
+            loaded['textViews'][index.name(function)] = (loaded['unit'], views)
+    return loaded
+
+def load_graph_modules(graphs):
+    """Load several graphs and merge them per module, like generateModules"""
+    grouped = {}
+    for graph in graphs:
+        loaded = load_graph(graph)
+        merged = grouped.setdefault(loaded['module'], {
+            'unit': [], 'module': loaded['module'], 'use': [], 'libs': {}, 'ffi': {}, 'types': {}, 'ops': {},
+            'textViews': {}})
+        if loaded['unit'] and loaded['unit'] not in merged['unit']:
+            merged['unit'].append(loaded['unit'])
+        merged['use'] = list(dict.fromkeys(merged['use'] + loaded['use']))
+        for lib_name, imports in loaded['libs'].items():
+            merged['libs'].setdefault(lib_name, {}).update(imports)
+        for key, kind in (('ffi', 'FFI declaration'), ('types', 'type'), ('ops', 'function')):
+            for name, value in loaded[key].items():
+                if name in merged[key]:
+                    raise ValueError(
+                        f"Duplicate {kind} '{name}' found in module '{loaded['module']}'. "
+                        f"Conflicting units: {merged['unit']}"
+                    )
+                merged[key][name] = value
+        merged['textViews'].update(loaded['textViews'])
+    return list(grouped.values())
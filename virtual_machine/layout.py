@@ -0,0 +1,196 @@
+"""Memory layout of the [type] and [struct] declarations of a module
+
+A [type] block declares an opaque type by its bytes and align, a [struct]
+block lists its fields as type=name lines, embed=name places the fields
+of another struct inline. Offsets, padding and sizes follow the C rules:
+every field starts at a multiple of its alignment, a struct is aligned
+like its strictest field and padded to a multiple of that.
+
+The layouts of a module are computed once when it's set up, the ctypes
+structures built from them once per process, so foreign functions take
+structs in the linear memory without packing them on each call.
+"""
+import ctypes
+import threading
+
+# Builtin types, name -> ctypes type
+CTYPES = {
+    'i8': ctypes.c_int8,
+    'i16': ctypes.c_int16,
+    'i32': ctypes.c_int32,
+    'i64': ctypes.c_int64,
+    'u8': ctypes.c_uint8,
+    'u16': ctypes.c_uint16,
+    'u32': ctypes.c_uint32,
+    'u64': ctypes.c_uint64,
+    'f32': ctypes.c_float,
+    'f64': ctypes.c_double,
+    'void': None,
+    'bool': ctypes.c_bool,
+    'ptr': ctypes.c_void_p,
+}
+
+# Members which give an opaque type its alignment, the C type of each alignment
+_ALIGNED = {ctypes.alignment(ctype): ctype for ctype in
+            (ctypes.c_longdouble, ctypes.c_uint64, ctypes.c_uint32, ctypes.c_uint16, ctypes.c_uint8)}
+
+# Layout key -> ctypes structure, shared by every module with the same layout
+_structures = {}
+_lock = threading.Lock()
+
+def _align_up(offset, align):
+    return -(-offset // align) * align
+
+class Layout:
+    """Size, alignment and field offsets of a type
+
+    fields: (name, type name, offset, embedded) of each field in declaration order
+    offsets: field name -> offset, including the fields of embedded structs
+    key: hashable description of the layout, equal for equal layouts
+    """
+    __slots__ = ('name', 'size', 'align', 'fields', 'offsets', 'key')
+
+    def __init__(self, name, size, align, fields=(), offsets=None, key=None):
+        self.name = name
+        self.size = size
+        self.align = align
+        self.fields = fields
+        self.offsets = offsets or {}
+        self.key = key or (name, size, align)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}:{type_name}@{offset}" for name, type_name, offset, _ in self.fields)
+        return f"Layout({self.name}, size={self.size}, align={self.align}, fields=[{fields}])"
+
+def _builtin_layout(name):
+    ctype = CTYPES.get(name)
+    if ctype is None:
+        return None
+    return Layout(name, ctypes.sizeof(ctype), ctypes.alignment(ctype))
+
+class TypeLayouts:
+    """Layouts of the types declared by a module, computed once
+
+    types is the 'types' entry of the module: name -> {'bytes', 'align'}
+    for [type] blocks, name -> {'fields': [{'name', 'type', 'embed'}]}
+    for [struct] blocks. Builtin types can be looked up too.
+    """
+
+    def __init__(self, types=None):
+        self.types = types or {}
+        self.layouts = {}
+        # Structs whose layout is being computed, to report cycles
+        self._open = set()
+        for name in self.types:
+            self._layout(name)
+
+    def __contains__(self, name):
+        return name in self.layouts or name in CTYPES
+
+    def get(self, name):
+        """Return the layout of a type, None if it isn't known"""
+        layout = self.layouts.get(name)
+        return layout if layout is not None else _builtin_layout(name)
+
+    def _layout(self, name):
+        layout = self.layouts.get(name)
+        if layout is not None:
+            return layout
+        decl = self.types.get(name)
+        if decl is None:
+            return _builtin_layout(name)
+        if 'fields' in decl:
+            self._open.add(name)
+            layout = self._struct_layout(name, decl['fields'])
+            self._open.discard(name)
+        else:
+            size = decl.get('bytes', 0)
+            # Without align a type is aligned like the largest power of two dividing its size, up to 8
+            align = decl.get('align') or min(size & -size, 8) or 1
+            if size < 0 or align & (align - 1):
+                print(f"Error: Type '{name}' needs a positive size and an alignment which is a power of two")
+                size, align = max(size, 0), 1
+            # Like in C the size is a multiple of the alignment, arrays of the type stay aligned
+            layout = Layout(name, _align_up(size, align), align)
+        self.layouts[name] = layout
+        return layout
+
+    def _field_layout(self, struct_name, field):
+        type_name = field['type']
+        if type_name in self._open:
+            print(f"Error: Struct '{struct_name}' contains itself through field '{field['name']}'")
+            return None
+        layout = self._layout(type_name)
+        if layout is None:
+            print(f"Warning: Unknown type '{type_name}' of field '{field['name']}' in struct '{struct_name}', "
+                  f"using ptr")
+        return layout
+
+    def _struct_layout(self, name, decl_fields):
+        fields = []
+        offsets = {}
+        keys = []
+        offset = 0
+        align = 1
+        for field in decl_fields:
+            field_layout = self._field_layout(name, field)
+            if field_layout is None:
+                field = dict(field, type='ptr', embed=False)
+                field_layout = _builtin_layout('ptr')
+            offset = _align_up(offset, field_layout.align)
+            embedded = bool(field.get('embed')) and bool(field_layout.fields)
+            fields.append((field['name'], field['type'], offset, embedded))
+            keys.append((field['name'], field_layout.key, offset, embedded))
+            offsets[field['name']] = offset
+            if embedded:
+                for member, member_offset in field_layout.offsets.items():
+                    offsets.setdefault(member, offset + member_offset)
+            offset += field_layout.size
+            align = max(align, field_layout.align)
+        size = _align_up(offset, align)
+        return Layout(name, size, align, tuple(fields), offsets, (name, size, align, tuple(keys)))
+
+    def ctype(self, name):
+        """Return the ctypes type of a type, a structure for declared types, None if it isn't known"""
+        if name in CTYPES:
+            return CTYPES[name]
+        layout = self.layouts.get(name)
+        return self.structure(layout) if layout is not None else None
+
+    def structure(self, layout):
+        """Return the ctypes structure of a layout, built once per process
+
+        Padding is added as explicit byte arrays, so the offsets and the size
+        of the structure are the ones of the layout. Embedded structs are
+        anonymous fields, their members are attributes of the structure.
+        The bytes of an opaque type follow an empty array of a member with
+        its alignment, which ctypes gives the structure.
+        """
+        if isinstance(layout, str):
+            layout = self.layouts[layout]
+        structure = _structures.get(layout.key)
+        if structure is not None:
+            return structure
+        fields = []
+        anonymous = []
+        end = 0
+        if not layout.fields and layout.align in _ALIGNED:
+            fields.append(('_align', _ALIGNED[layout.align] * 0))
+        for name, type_name, offset, embedded in layout.fields:
+            if offset > end:
+                fields.append((f'_pad{end}', ctypes.c_ubyte * (offset - end)))
+            fields.append((name, self.ctype(type_name)))
+            if embedded:
+                anonymous.append(name)
+            end = offset + self.get(type_name).size
+        if layout.size > end:
+            # Tail padding, or the bytes of a [type] without fields
+            fields.append((f'_pad{end}' if layout.fields else 'bytes', ctypes.c_ubyte * (layout.size - end)))
+        # _align_ is honored from Python 3.13 on, alignments the members can't give included
+        structure = type(layout.name, (ctypes.Structure,),
+                         {'_align_': layout.align, '_fields_': fields, '_anonymous_': anonymous})
+        if ctypes.alignment(structure) < layout.align:
+            print(f"Warning: Type '{layout.name}' is aligned to {layout.align}, "
+                  f"its ctypes structure only to {ctypes.alignment(structure)}")
+        with _lock:
+            return _structures.setdefault(layout.key, structure)
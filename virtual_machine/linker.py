@@ -0,0 +1,103 @@
+import ctypes
+
+from .bytecode import (OP_CALL, OP_CALL_FFI, OP_CALL_XIL, OP_CALL_ASYNC, OP_MOVE, OPERAND_LOCAL, OPERAND_PROPERTY,
+                       _map_operands)
+from .ffi import _LazySymbol
+
+class LinkError(Exception):
+    """Call targets of a module which couldn't be bound
+
+    unresolved: (unit, row, column, function, callee) per call site, the
+    source position is None if the module has no text views.
+    """
+
+    def __init__(self, unresolved):
+        self.unresolved = unresolved
+        lines = []
+        for unit, row, column, function, callee in unresolved:
+            position = f"{unit}:{row}:{column}: " if row is not None else ''
+            lines.append(f"{position}function '{function}' calls unknown function '{callee}'")
+        super().__init__('\n'.join(lines))
+
+def _position(textViews, func, pc):
+    """Return the unit, row and column of instruction pc of a function"""
+    unit, views = textViews.get(func.name, (None, ()))
+    if pc < len(func.statements):
+        statement = func.statements[pc] + 1
+        if statement < len(views) and views[statement] is not None:
+            return unit, views[statement].row, views[statement].column
+    return unit, None, None
+
+def _bind_ffi(ffi_functions, name):
+    """Return the foreign function of a name with its symbol resolved, None if it doesn't exist"""
+    ffi_function = ffi_functions.get(name)
+    if isinstance(ffi_function, _LazySymbol):
+        ffi_function = ffi_function.resolve(warn=False)
+    return ffi_function
+
+def _await_results(func):
+    """Let reads of the locals async calls store their Future in wait for the result"""
+    code = func.code
+    slots = {code[pc + 1][1] for pc in range(len(code) - 1)
+             if code[pc][0] == OP_CALL_ASYNC and code[pc + 1][0] == OP_MOVE}
+    if not slots:
+        return
+    func.futures = tuple(sorted(slots))
+    names = {slot: name for name, slot in func.slots.items()}
+
+    def convert(operand):
+        kind, value = operand
+        if kind == OPERAND_LOCAL and value in slots:
+            return (OPERAND_PROPERTY, (value, None, names[value], None))
+        return operand
+
+    for pc, instruction in enumerate(code):
+        code[pc] = _map_operands(instruction, convert)
+
+def link(functions, ffi_functions, late_binding=False, textViews=None, async_functions=()):
+    """Bind the call sites of compiled functions to their targets
+
+    Every call by name becomes a call of the foreign function or of the
+    compiled function it names, so running code never looks a name up.
+    Foreign functions win over module functions, like in the reference
+    interpreter. Symbols of foreign functions are resolved here.
+
+    Calls of unknown functions raise a LinkError which lists all of them.
+    With late_binding they stay calls by name instead, looked up when they
+    run and reported then.
+
+    The code of linked functions is frozen into tuples, it's shared by
+    all threads running them.
+
+    Calls of the foreign functions named in async_functions which return
+    a value that is moved into a local right away run on a thread pool. The local holds
+    a Future until an instruction reads it and waits for the result, the
+    instructions between run while the foreign function blocks. Results
+    nobody reads are waited for when the function returns, so exceptions
+    of the foreign function aren't lost. Calls whose result isn't moved
+    into a local, and calls of void functions which push nothing, run
+    synchronously.
+    """
+    textViews = textViews or {}
+    unresolved = []
+    for func in functions.values():
+        code = func.code
+        for pc, (op, a, b) in enumerate(code):
+            if op != OP_CALL:
+                continue
+            ffi_function = _bind_ffi(ffi_functions, a)
+            if ffi_function is not None:
+                if (a in async_functions and getattr(ffi_function, 'restype', ctypes.c_void_p) is not None
+                        and pc + 1 < len(code) and code[pc + 1][0] == OP_MOVE):
+                    code[pc] = (OP_CALL_ASYNC, ffi_function, b)
+                else:
+                    code[pc] = (OP_CALL_FFI, ffi_function, b)
+            elif a in functions and a not in ffi_functions:
+                code[pc] = (OP_CALL_XIL, functions[a], b)
+            elif not late_binding:
+                unresolved.append(_position(textViews, func, pc) + (func.name, a))
+        _await_results(func)
+        func.code = tuple(func.code)
+    if unresolved:
+        raise LinkError(unresolved)
+    return functions
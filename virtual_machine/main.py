@@ -1,107 +1,26 @@
 import ctypes
+from functools import lru_cache
+from .analysis import build_block_index
+from .ffi import _generate_ffi_functions
+from .builtin import bind_intrinsics, ProgramExit
+from .layout import TypeLayouts
 
-def _map_type_to_ctypes(xil_type):
-    """Map XIL type to ctypes type"""
-    type_map = {
-        'i8': ctypes.c_int8,
-        'i16': ctypes.c_int16,
-        'i32': ctypes.c_int32,
-        'i64': ctypes.c_int64,
-        'u8': ctypes.c_uint8,
-        'u16': ctypes.c_uint16,
-        'u32': ctypes.c_uint32,
-        'u64': ctypes.c_uint64,
-        'f32': ctypes.c_float,
-        'f64': ctypes.c_double,
-        'void': None,
-        'bool': ctypes.c_bool,
-        'ptr': ctypes.c_void_p,
-    }
-    return type_map.get(xil_type, ctypes.c_void_p)
-
-def _generate_ffi_functions(module):
-    """Generate Python FFI functions for all FFI declarations"""
-    ffi_functions = {}
-    loaded_libs = {}
-    
-    # Load libraries
-    for lib_name, symbols in module.get('libs', {}).items():
-        try:
-            if lib_name.endswith('.dll'):
-                lib = ctypes.WinDLL(lib_name)
-            else:
-                lib = ctypes.CDLL(lib_name)
-            loaded_libs[lib_name] = lib
-        except OSError as e:
-            print(f"Warning: Could not load library {lib_name}: {e}")
-            continue
-    
-    # Generate FFI functions
-    for func_name, func_decl in module.get('ffi', {}).items():
-        # Find which library contains this function
-        lib = None
-        symbol_name = func_name
-        
-        for lib_name, symbols in module.get('libs', {}).items():
-            if func_name in symbols:
-                lib = loaded_libs.get(lib_name)
-                symbol_name = symbols[func_name]
-                break
-        
-        if lib is None:
-            print(f"Warning: No library found for FFI function {func_name}")
-            continue
-        
-        # Get function from library
-        try:
-            c_func = getattr(lib, symbol_name)
-        except AttributeError:
-            print(f"Warning: Symbol {symbol_name} not found in library")
-            continue
-        
-        # Set argument types
-        arg_types = []
-        for arg in func_decl.get('args', []):
-            arg_type = _map_type_to_ctypes(arg['type'])
-            if arg_type is not None:
-                arg_types.append(arg_type)
-        
-        c_func.argtypes = arg_types
-        
-        # Set return type
-        return_type = _map_type_to_ctypes(func_decl.get('returns', 'void'))
-        c_func.restype = return_type if return_type is not None else None
-        
-        # Create Python wrapper function
-        def make_wrapper(c_func, arg_names, arg_types_list):
-            def wrapper(*args):
-                # Convert arguments to appropriate types
-                converted_args = []
-                for i, arg_value in enumerate(args):
-                    if i < len(arg_types_list) and arg_types_list[i] is not None:
-                        expected_type = arg_types_list[i]
-                        # If expecting a pointer type
-                        if expected_type == ctypes.c_void_p:
-                            # If already a pointer type, use as is
-                            if isinstance(arg_value, (ctypes._Pointer, ctypes._SimpleCData)):
-                                converted_args.append(arg_value)
-                            # If it's an integer (address), convert to pointer
-                            elif isinstance(arg_value, int):
-                                converted_args.append(ctypes.c_void_p(arg_value))
-                            else:
-                                converted_args.append(arg_value)
-                        else:
-                            converted_args.append(arg_value)
-                    else:
-                        converted_args.append(arg_value)
-                return c_func(*converted_args)
-            wrapper.__name__ = func_name
-            return wrapper
-        
-        arg_names = [arg['name'] for arg in func_decl.get('args', [])]
-        ffi_functions[func_name] = make_wrapper(c_func, arg_names, arg_types)
-    
-    return ffi_functions
+# Modes run(), prepare() and load() take
+MODES = ('closure', 'bytecode', 'reference', 'task')
+
+def _constant_buffer(constants, text):
+    """Return the null-terminated UTF-8 buffer of a string constant
+
+    Buffers are created once and kept in the constants of the run, so the
+    same string shares one buffer for the life of the module. Strings
+    materialized into the arena of linked modules return their address.
+    """
+    key = ('ptr', text)
+    buffer = constants.get(key)
+    if buffer is None:
+        # setdefault keeps the first buffer if threads race for it
+        buffer = constants.setdefault(key, ctypes.c_char_p(text.encode('utf-8')))
+    return buffer
 
 def _parse_value(value, locals_dict, constants):
     """Parse a value string to Python value, checking local variables and constants"""
@@ -121,12 +40,11 @@ def _parse_value(value, locals_dict, constants):
                 if isinstance(const_value, str):
                     if property_name == 'ptr':
                         # Return pointer to string (as ctypes pointer)
-                        import ctypes
-                        return ctypes.c_char_p(const_value.encode('utf-8'))
+                        return _constant_buffer(constants, const_value)
                     elif property_name == 'bytes':
                         # Return byte length
                         return len(const_value.encode('utf-8'))
-        return value
+        # Not a property access, e.g. a float literal
     
     # Check if it's a local variable
     if value in locals_dict:
@@ -156,8 +74,9 @@ def _process_string_literal(s):
     """Process string literals by replacing escaped newlines with actual newlines"""
     return s.replace('\\n', '\n')
 
+@lru_cache(maxsize=4096)
 def _parse_const_value(value_str):
-    """Parse a constant value string to Python value"""
+    """Parse a constant value string to Python value, literals are parsed once"""
     value = None
     # Try to parse as integer
     try:
@@ -192,10 +111,10 @@ def _execute_call(call_args, module, stack, locals_dict, constants):
         result = module['ffi_functions'][func_name](*args)
         if result is not None:
             stack.append(result)
-    # Check if it's a module function
+    # Check if it's a module function, _execute_function enters it
     elif 'fun' in module and func_name in module['fun']:
         stack.extend(args)
-        _execute_function(func_name, module, stack, {}, constants)
+        return {'call_function': func_name}
     else:
         print(f"Warning: Function '{func_name}' not found")
 
@@ -309,7 +228,7 @@ def _execute_if(if_args, locals_dict, constants):
 def _execute_statement(stmt, module, stack, locals_dict, constants):
     """Execute a single statement"""
     if 'call' in stmt:
-        _execute_call(stmt['call'], module, stack, locals_dict, constants)
+        return _execute_call(stmt['call'], module, stack, locals_dict, constants)
     elif 'move' in stmt:
         _execute_move(stmt['move'], stack, locals_dict)
     elif 'const' in stmt:
@@ -325,33 +244,46 @@ def _execute_statement(stmt, module, stack, locals_dict, constants):
     elif 'if' in stmt:
         return _execute_if(stmt['if'], locals_dict, constants)
 
+def _enter_function(func_name, module, stack, constants):
+    """Create the locals of a function and assign its parameters from the stack"""
+    statements = module['fun'][func_name]
+    
+    # Labels and decls are indexed once per function by run()
+    blocks = module.get('blocks', {}).get(func_name)
+    if blocks is None:
+        blocks = build_block_index(statements)
+    
+    # first execute args and decl to populate local variables
+    locals_dict = {}
+    for i in blocks.decls:
+        _execute_statement(statements[i], module, stack, locals_dict, constants)
+    return statements, blocks.labels, locals_dict
+
 def _execute_function(func_name, module, stack, parent_locals, constants):
-    """Execute a function by name"""
+    """Execute a function by name
+
+    Calls don't recurse on the Python stack, the callers wait on an explicit
+    frame stack with their return index. A call which is the last statement
+    of a function replaces the frame of its caller.
+    """
     if 'fun' not in module or func_name not in module['fun']:
         print(f"Error: Function '{func_name}' not found")
         return
     
-    # Create local variables dictionary for this function
-    locals_dict = {}
-    
-    statements = module['fun'][func_name]
+    # Callers as (statements, label indices, locals, return index)
+    frames = []
+    statements, label_indices, locals_dict = _enter_function(func_name, module, stack, constants)
     
-    # First, register all labels with their statement index as value
-    label_indices = {}
-    for i, stmt in enumerate(statements):
-        if 'label' in stmt:
-            label_name = stmt['label'].strip()
-            # Store the index of this statement (label points to itself)
-            label_indices[label_name] = i
-    
-    # first execute args and decl to populate local variables
-    for stmt in statements:
-        if 'decl' in stmt:
-            _execute_statement(stmt, module, stack, locals_dict, constants)
-    
-    # Then execute other statements with index-based execution for jumps
+    # Execute the other statements with index-based execution for jumps
     i = 0
-    while i < len(statements):
+    while True:
+        if i >= len(statements):
+            # Return to the caller
+            if not frames:
+                break
+            statements, label_indices, locals_dict, i = frames.pop()
+            continue
+        
         stmt = statements[i]
         
         # Skip args, decl and label statements (already executed)
@@ -372,25 +304,295 @@ def _execute_function(func_name, module, stack, parent_locals, constants):
                 continue
             else:
                 print(f"Error: Label '{label_name}' not found")
-                break
+                # Leave the function
+                i = len(statements)
+                continue
+        
+        # Check if a module function was called
+        if isinstance(result, dict) and 'call_function' in result:
+            if i + 1 < len(statements):
+                frames.append((statements, label_indices, locals_dict, i + 1))
+            # else: tail call, the frame of the caller isn't needed anymore
+            statements, label_indices, locals_dict = _enter_function(
+                result['call_function'], module, stack, constants)
+            i = 0
+            continue
         
         i += 1
 
-def run(module): 
-    print(module)
-    # Generate FFI functions for this module
-    ffi_functions = _generate_ffi_functions(module)
-    module['ffi_functions'] = ffi_functions
-    
+def _setup(module):
+    """Lay out the types, generate the FFI functions, bind the intrinsics and index the blocks of a module
+
+    Returns a copy of the module with them in 'layouts', 'ffi_functions'
+    and 'blocks', the module itself isn't changed.
+    """
+    linked = dict(module)
+    linked['layouts'] = TypeLayouts(module.get('types'))
+    linked['ffi_functions'] = bind_intrinsics(module, _generate_ffi_functions(module, linked['layouts']))
+    # Index labels, decls and basic blocks once per function
+    linked['blocks'] = {name: build_block_index(statements) for name, statements in module.get('fun', {}).items()}
+    return linked
+
+def _compile(module, constants, opt_level, late_binding, cache):
+    """Compile the functions of a module prepared by _setup, bind their calls and materialize their strings"""
+    from .bytecode import compile_module
+    from .linker import link
+    from .arena import materialize
+    compiled = compile_module(module, constants, opt_level, cache)
+    if cache is not None:
+        cache.save()
+    link(compiled, module['ffi_functions'], late_binding, module.get('textViews'), _async_functions(module))
+    materialize(compiled, constants)
+    return compiled
+
+def _async_functions(module):
+    """Return the names of the foreign functions declared async"""
+    return {name for name, decl in module.get('ffi', {}).items() if decl.get('async')}
+
+def link_module(module, opt_level=1, late_binding=False, cache=None):
+    """Compile and link all functions of a module without running it
+
+    Modules without main are linked too. Returns the compiled functions,
+    which keep their constants and string arena alive, raises a LinkError
+    if calls can't be bound.
+    """
+    constants = {}
+    return _compile(_setup(module), constants, opt_level, late_binding, cache)
+
+def _reference_entry(func_name, module, constants):
+    def entry(stack):
+        _execute_function(func_name, module, stack, {}, constants)
+    return entry
+
+def _bytecode_entry(func_name, functions, ffi_functions, constants):
+    from .bytecode import execute
+    def entry(stack):
+        execute(functions, func_name, ffi_functions, stack, constants)
+    return entry
+
+def _task_entry(func_name, functions, ffi_functions, blocking):
+    from .scheduler import run_task
+    async def entry(stack):
+        await run_task(functions, func_name, ffi_functions, stack, blocking)
+    return entry
+
+class Image:
+    """A module linked for one mode, shared by all its executions
+
+    Everything derived from the module is built once by load(): foreign
+    functions, block indexes, the compiled and linked functions and their
+    closures. An execution only creates its value stack and the frames of
+    its calls, which hold the compare state, so threads can run functions
+    of one image at the same time.
+
+    functions: compiled functions, None in mode 'reference'
+    entries: function name -> callable which runs the function on a value
+    stack, a coroutine function in mode 'task'
+    calls: function name -> (callable, count) which takes the value stack
+    and count arguments, None for any number, see compile_closures
+    layouts: TypeLayouts of the types the module declares
+    """
+    __slots__ = ('name', 'mode', 'module', 'ffi_functions', 'layouts', 'functions', 'constants', 'entries',
+                 'calls', '_exports')
+
+    def __init__(self, module, mode, functions, constants, entries, calls=None):
+        self.name = module.get('module')
+        self.mode = mode
+        self.module = module
+        self.ffi_functions = module['ffi_functions']
+        self.layouts = module['layouts']
+        self.functions = functions
+        self.constants = constants
+        self.entries = entries
+        self.calls = calls or {}
+        self._exports = {}
+
+    def function(self, func_name):
+        """Return a Python callable which runs a function with the arguments it's given
+
+        The callable returns None if the function left no value on the
+        stack, the value if it left one and a tuple of all values otherwise.
+        Raises a KeyError for unknown functions.
+        """
+        export = self._exports.get(func_name)
+        if export is None:
+            if self.mode == 'task':
+                raise ValueError("Functions of images in mode 'task' run as tasks, use execute()")
+            export = _export(func_name, self.entries[func_name], *self.calls.get(func_name, (None, None)))
+            self._exports[func_name] = export
+        return export
+
+    def structure(self, type_name):
+        """Return the ctypes structure of a declared type, e.g. to fill a struct in the linear memory
+
+        Raises a KeyError for types the module doesn't declare.
+        """
+        return self.layouts.structure(type_name)
+
+    def execute(self, func_name='main', stack=None):
+        """Run a function and return the value stack, its parameters are taken from the stack
+
+        The stack starts as [0, 0], argn and argv of main. In mode 'task'
+        this returns a coroutine which runs the function as task of the
+        running event loop. A ProgramExit raised by the builtin exit carries
+        the stack.
+        """
+        if stack is None:
+            stack = [0, 0]
+        entry = self.entries.get(func_name)
+        if entry is None:
+            print(f"Error: Function '{func_name}' not found")
+            return stack
+        if self.mode == 'task':
+            return self._execute_task(entry, stack)
+        try:
+            entry(stack)
+        except ProgramExit as e:
+            e.stack = stack
+            raise
+        return stack
+
+    @staticmethod
+    async def _execute_task(entry, stack):
+        try:
+            await entry(stack)
+        except ProgramExit as e:
+            e.stack = stack
+            raise
+        return stack
+
+def _export(func_name, entry, direct, count):
+    """Wrap the callables of a function into a Python function which maps arguments and results"""
+    if direct is None:
+        def call(*args):
+            stack = list(args)
+            entry(stack)
+            return stack[0] if len(stack) == 1 else tuple(stack) if stack else None
+    elif count is None:
+        def call(*args):
+            stack = []
+            direct(stack, *args)
+            return stack[0] if len(stack) == 1 else tuple(stack) if stack else None
+    else:
+        def call(*args):
+            stack = []
+            if len(args) == count:
+                direct(stack, *args)
+            else:
+                # Missing or surplus arguments are passed like a xil call would
+                stack.extend(args)
+                entry(stack)
+            return stack[0] if len(stack) == 1 else tuple(stack) if stack else None
+    call.__name__ = call.__qualname__ = func_name
+    return call
+
+def embed(module, mode='closure', opt_level=1, cache=None):
+    """Load a module and return its functions as Python callables
+
+    Returns function name -> callable, see Image.function. The module is
+    linked once, every call only creates a value stack.
+    """
+    image = load(module, mode, opt_level, cache=cache)
+    return {name: image.function(name) for name in image.entries}
+
+def load(module, mode='closure', opt_level=1, late_binding=False, cache=None):
+    """Link a module into an Image for the given mode
+
+    Takes the same mode, opt_level, late_binding and cache as run(), the
+    module isn't changed. Raises a LinkError if calls can't be bound.
+    """
+    linked = _setup(module)
     # Create constants set (unique storage for constants)
     constants = {}
-    
-    # Find main function and execute it
-    if 'fun' in module and 'main' in module['fun']:
-        stack = [0,0]
-        _execute_function('main', module, stack, {}, constants)
+    if mode == 'reference' and 'ops' not in linked:
+        entries = {name: _reference_entry(name, linked, constants) for name in linked.get('fun', {})}
+        return Image(linked, mode, None, constants, entries)
+    if mode == 'reference':
+        # Graphs carry no statements to interpret
+        mode = 'closure'
+    compiled = _compile(linked, constants, opt_level, late_binding, cache)
+    ffi_functions = linked['ffi_functions']
+    if mode == 'task':
+        from .linker import _bind_ffi
+        blocking = frozenset(id(_bind_ffi(ffi_functions, name)) for name in _async_functions(linked))
+        entries = {name: _task_entry(name, compiled, ffi_functions, blocking) for name in compiled}
+    elif mode == 'bytecode':
+        from .closure import _interpreted
+        entries = {name: _bytecode_entry(name, compiled, ffi_functions, constants) for name in compiled}
+        calls = {name: (_interpreted(func, compiled, ffi_functions)[0], None) for name, func in compiled.items()}
+        return Image(linked, mode, compiled, constants, entries, calls)
     else:
+        from .closure import compile_closures
+        calls = {}
+        entries = compile_closures(compiled, ffi_functions, constants, calls)
+        return Image(linked, mode, compiled, constants, entries, calls)
+    return Image(linked, mode, compiled, constants, entries)
+
+def prepare(module, mode='closure', profile=None, opt_level=1, late_binding=False, cache=None):
+    """Link and compile a module once for repeated runs
+
+    Takes the same mode, profile, opt_level, late_binding and cache as run(). Returns a
+    function which runs main and returns the value stack, None if the module has
+    no main. In mode 'task' the function is a coroutine function, await
+    many of its calls in one event loop to run them concurrently. Without a
+    profile the function may be called from several threads at once, see
+    Image. Raises a LinkError if calls can't be bound.
+    """
+    # Find main function
+    functions = module['ops'] if 'ops' in module else module.get('fun', {})
+    if 'main' not in functions:
         print(f"Warning: No 'main' function found in module {module.get('module', 'unknown')}")
+        return None
+
+    if profile is None:
+        image = load(module, mode, opt_level, late_binding, cache)
+        def main():
+            return image.execute('main')
+        return main
+
+    linked = _setup(module)
+    constants = {}
+    # Recorded runs interpret the compiled functions, the image keeps them and their constants
+    image = Image(linked, 'bytecode', _compile(linked, constants, opt_level, late_binding, cache), constants, {})
+    def main():
+        stack = [0,0]
+        try:
+            profile.execute(image.functions, 'main', image.ffi_functions, stack, linked.get('textViews'))
+        except ProgramExit as e:
+            e.stack = stack
+            raise
+        return stack
+    return main
+
+def run(module, mode='closure', profile=None, opt_level=1, late_binding=False, cache=None):
+    """Run the main function of a module
+
+    mode 'closure' turns every function into a Python function, mode
+    'bytecode' runs the lowered functions in the bytecode interpreter and
+    mode 'reference' interprets the statement dictionaries directly and is
+    kept for differential testing. Mode 'task' runs the bytecode as task of
+    an asyncio event loop, see scheduler.py. Modules loaded from a graph carry their
+    functions in 'ops' and never run in reference mode. A Profiler or
+    Tracer passed as profile records the run, recorded runs use the
+    bytecode interpreter. opt_level 0 turns the peephole optimizer of the
+    compiled tiers off.
+    The compiled tiers bind every call to its target before main runs and
+    raise a LinkError listing the calls of unknown functions. With
+    late_binding those calls are looked up when they run, like in reference
+    mode, and reported then.
+    A CompileCache passed as cache provides the compiled functions of
+    earlier runs and keeps the new ones.
+    Returns the value stack after main returned. A call of the builtin
+    exit raises a ProgramExit with the exit code and the stack.
+    """
+    print(module)
+    main = prepare(module, mode, profile, opt_level, late_binding, cache)
+    if main is None:
+        return None
+    if mode == 'task' and profile is None:
+        import asyncio
+        return asyncio.run(main())
+    return main()
 
 if __name__ == "__main__":
     print("vm")
\ No newline at end of file
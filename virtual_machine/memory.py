@@ -0,0 +1,140 @@
+"""Linear memory of the VM
+
+xil code allocates buffers in one growable block of anonymous memory.
+Pointers into it are offsets, turned into real addresses where they leave
+the VM: at the FFI boundary and in the intrinsics. Native code reads and
+writes the buffers in place, Python code through Memory.view.
+
+The address space of the memory is reserved when it's created, growing
+only raises the limit of the allocator. The memory never moves, so
+addresses native code holds stay valid while other threads allocate.
+"""
+import bisect
+import ctypes
+import mmap
+import threading
+
+# Alignment of allocated buffers
+ALIGNMENT = 16
+# Size of a new memory
+INITIAL_CAPACITY = 64 * 1024
+# Private anonymous mappings only back their pages once they are written,
+# elsewhere (Windows) the whole mapping is committed from the page file
+_LAZY_PAGES = hasattr(mmap, 'MAP_PRIVATE')
+# Address space reserved for a memory, the most it can grow to. Without lazy
+# pages every process pays for it, so the reserve is much smaller there.
+RESERVED_SIZE = (1 << 30) if _LAZY_PAGES else 32 * 1024 * 1024
+
+class Pointer(int):
+    """Offset of a buffer in the linear memory"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"Pointer({int(self)})"
+
+class Memory:
+    """Growable linear memory with a first-fit allocator
+
+    Free blocks are kept sorted by offset and merged with their neighbours.
+    Offset 0 is never allocated, so Pointer(0) is null. The memory grows
+    in place up to reserve bytes, an alloc beyond raises a MemoryError.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY, reserve=RESERVED_SIZE):
+        self.lock = threading.Lock()
+        self.capacity = max(capacity, ALIGNMENT)
+        self._map(max(reserve, self.capacity))
+        # Offset of the first byte never allocated
+        self.top = ALIGNMENT
+        # Sizes of the allocated buffers by offset
+        self.sizes = {}
+        # (offset, size) of the free blocks below top, sorted by offset
+        self.free_blocks = []
+
+    def _map(self, reserve):
+        """Reserve the address space, less if the system refuses, but never less than the capacity"""
+        while True:
+            try:
+                if _LAZY_PAGES:
+                    data = mmap.mmap(-1, reserve, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS
+                                     | getattr(mmap, 'MAP_NORESERVE', 0))
+                else:
+                    data = mmap.mmap(-1, reserve)
+                break
+            except OSError:
+                if reserve // 2 < self.capacity:
+                    raise
+                reserve //= 2
+        self.data = data
+        self.reserved = reserve
+        # The ctypes object would keep the buffer exported, only its address is needed
+        self.address = ctypes.addressof(ctypes.c_char.from_buffer(data))
+
+    def alloc(self, size):
+        """Allocate a zeroed buffer and return its Pointer"""
+        size = max(-(-size // ALIGNMENT) * ALIGNMENT, ALIGNMENT)
+        with self.lock:
+            for index, (offset, free_size) in enumerate(self.free_blocks):
+                if free_size >= size:
+                    if free_size == size:
+                        del self.free_blocks[index]
+                    else:
+                        self.free_blocks[index] = (offset + size, free_size - size)
+                    break
+            else:
+                offset = self.top
+                if offset + size > self.capacity:
+                    capacity = self.capacity
+                    while offset + size > capacity:
+                        capacity *= 2
+                    if offset + size > self.reserved:
+                        raise MemoryError(f"Linear memory is limited to {self.reserved} bytes")
+                    self.capacity = min(capacity, self.reserved)
+                self.top = offset + size
+            # Freed memory is reused by both paths
+            self.data[offset:offset + size] = bytes(size)
+            self.sizes[offset] = size
+        return Pointer(offset)
+
+    def free(self, pointer):
+        """Give a buffer back to the allocator, unknown pointers are reported"""
+        with self.lock:
+            size = self.sizes.pop(pointer, None)
+            if size is None:
+                print(f"Error: Pointer {int(pointer)} wasn't allocated")
+                return
+            offset = int(pointer)
+            index = bisect.bisect(self.free_blocks, (offset, size))
+            # Merge with the following and the preceding free block
+            if index < len(self.free_blocks) and self.free_blocks[index][0] == offset + size:
+                size += self.free_blocks.pop(index)[1]
+            if index > 0 and sum(self.free_blocks[index - 1]) == offset:
+                offset, previous = self.free_blocks.pop(index - 1)
+                size += previous
+                index -= 1
+            if offset + size == self.top:
+                self.top = offset
+            else:
+                self.free_blocks.insert(index, (offset, size))
+
+    def view(self, pointer, size):
+        """Return a memoryview of size bytes at a pointer"""
+        return memoryview(self.data)[pointer:pointer + size]
+
+_memory = None
+_memory_lock = threading.Lock()
+
+def linear_memory():
+    """Return the linear memory of the process, created on first use"""
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                _memory = Memory()
+    return _memory
+
+def address(value):
+    """Turn a Pointer into its real address, other values are returned as they are"""
+    if value.__class__ is Pointer:
+        return linear_memory().address + value
+    return value
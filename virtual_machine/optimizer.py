@@ -0,0 +1,146 @@
+from .bytecode import (OP_CALL, OP_CMP, OP_IF, OP_CONST, OP_JUMP, OP_BRANCH,
+                       OPERAND_IMMEDIATE, compare)
+
+# Calls to these foreign functions never return, intrinsics are flagged by @intrinsic
+NORETURN = ('exit', '_exit', 'abort')
+
+def _is_jump(instruction):
+    """True if the instruction may continue at a resolved jump target"""
+    op, _, target = instruction
+    return op in (OP_IF, OP_BRANCH, OP_JUMP) and target.__class__ is int
+
+def _targets(code):
+    """Return the instruction indices control can jump to"""
+    return {instruction[2] for instruction in code if instruction is not None and _is_jump(instruction)}
+
+def _fold_and_fuse(code, cmp_slot):
+    """Fold compares of literals and fuse compares with the if following them"""
+    targets = _targets(code)
+    for pc, instruction in enumerate(code):
+        if instruction is None or instruction[0] != OP_CMP:
+            continue
+        _, a, b = instruction
+        following = code[pc + 1] if pc + 1 < len(code) and pc + 1 not in targets else None
+        fusable = following is not None and following[0] == OP_IF and following[2].__class__ is int
+        if a[0] >= OPERAND_IMMEDIATE and b[0] >= OPERAND_IMMEDIATE:
+            result = compare(a[1], b[1])
+            code[pc] = (OP_CONST, cmp_slot, result)
+            if fusable and following[1][0] >= OPERAND_IMMEDIATE:
+                # The branch is decided at compile time
+                taken = following[1][1] != result
+                code[pc + 1] = (OP_JUMP, None, following[2]) if taken else None
+        elif fusable:
+            code[pc] = (OP_BRANCH, (a, b, following[1], True), following[2])
+            code[pc + 1] = None
+
+def _remove_unreachable(code, noreturn):
+    """Remove the instructions behind a jump or a call which never returns up to the next jump target"""
+    targets = _targets(code)
+    unreachable = False
+    for pc, instruction in enumerate(code):
+        if pc in targets:
+            unreachable = False
+        if instruction is None:
+            continue
+        if unreachable:
+            code[pc] = None
+            continue
+        op, a, _ = instruction
+        if op == OP_JUMP or (op == OP_CALL and a in noreturn):
+            unreachable = True
+
+def _thread_jumps(code):
+    """Let jumps to an unconditional jump go to its target directly"""
+    def final_target(target):
+        seen = set()
+        while target < len(code) and target not in seen:
+            seen.add(target)
+            # Removed instructions fall through to the next one
+            following = next((pc for pc in range(target, len(code)) if code[pc] is not None), len(code))
+            instruction = code[following] if following < len(code) else None
+            if instruction is None or instruction[0] != OP_JUMP:
+                return following
+            target = instruction[2]
+        return target
+
+    for pc, instruction in enumerate(code):
+        if instruction is not None and _is_jump(instruction):
+            op, a, target = instruction
+            code[pc] = (op, a, final_target(target))
+
+def _live_cmp(code, cmp_slot):
+    """Return for each instruction whether the compare state is read after it"""
+    successors = []
+    for pc, instruction in enumerate(code):
+        op, _, target = instruction
+        following = [pc + 1] if op != OP_JUMP and pc + 1 < len(code) else []
+        if _is_jump(instruction) and target < len(code):
+            following.append(target)
+        successors.append(following)
+
+    live_in = [False] * len(code)
+    changed = True
+    while changed:
+        changed = False
+        for pc in reversed(range(len(code))):
+            op, a, _ = code[pc]
+            live_out = any(live_in[successor] for successor in successors[pc])
+            if op == OP_IF:
+                live = True
+            elif op in (OP_CMP, OP_BRANCH) or (op == OP_CONST and a == cmp_slot):
+                live = False
+            else:
+                live = live_out
+            if live != live_in[pc]:
+                live_in[pc] = live
+                changed = True
+    return [any(live_in[successor] for successor in successors[pc]) for pc in range(len(code))]
+
+def _compact(code, statements):
+    """Drop removed instructions, a removed instruction continues with the next one"""
+    new_pc = []
+    count = 0
+    for instruction in code:
+        new_pc.append(count)
+        if instruction is not None:
+            count += 1
+    new_pc.append(count)
+    compact = []
+    compact_statements = []
+    for pc, instruction in enumerate(code):
+        if instruction is None:
+            continue
+        if _is_jump(instruction):
+            op, a, target = instruction
+            instruction = (op, a, new_pc[target])
+        compact.append(instruction)
+        compact_statements.append(statements[pc])
+    return compact, tuple(compact_statements)
+
+def optimize(code, statements, cmp_slot, noreturn=NORETURN):
+    """Peephole optimize the instructions of a function
+
+    Compares of two literals are folded, cmp+if pairs are fused into a
+    compare-and-branch instruction which only stores the compare state if a
+    later if reads it, instructions behind unconditional jumps and calls of
+    noreturn functions are removed and jumps to jumps are threaded.
+
+    Returns the new instructions and the statement index of each of them.
+    """
+    code = list(code)
+    _fold_and_fuse(code, cmp_slot)
+    _remove_unreachable(code, noreturn)
+    _thread_jumps(code)
+
+    code, statements = _compact(code, statements)
+
+    # Remove stores of the compare state nobody reads and jumps to the next instruction
+    live = _live_cmp(code, cmp_slot)
+    for pc, (op, a, b) in enumerate(code):
+        if op == OP_BRANCH and not live[pc]:
+            code[pc] = (op, a[:3] + (False,), b)
+        elif op == OP_CONST and a == cmp_slot and not live[pc]:
+            code[pc] = None
+        elif op == OP_JUMP and b == pc + 1:
+            code[pc] = None
+    return _compact(code, statements)
@@ -0,0 +1,121 @@
+import json
+from time import perf_counter
+
+from .bytecode import OPCODE_NAMES, _pop_params, _run
+
+class Instrument:
+    """Base of the observers run() accepts as profile
+
+    Instrumented modules always run in the bytecode interpreter, its loop
+    reports function entries and exits and FFI calls to the hook methods.
+    Async FFI calls aren't moved to a thread then. Without an instrument
+    nothing is recorded and the tiers run unchanged.
+    """
+
+    def enter(self, func):
+        """Called when a function starts running"""
+
+    def leave(self, func):
+        """Called when a function returns, or hands its frame to a tail call"""
+
+    def call_ffi(self, name, ffi_function, args, func, pc):
+        """Call a FFI function from instruction pc - 1 of func"""
+        return ffi_function(*args)
+
+    def finish(self, counts):
+        """Called after main returned with the number of executed instructions per opcode"""
+
+    def execute(self, functions, func_name, ffi_functions, stack, textViews=None):
+        """Execute a compiled function like bytecode.execute
+
+        textViews are the source positions of the module, see generateModules.
+        """
+        self.textViews = textViews or {}
+        # Names of the foreign functions bound by the linker
+        self._ffi_names = {id(ffi_function): name for name, ffi_function in ffi_functions.items()}
+        func = functions.get(func_name)
+        if func is None:
+            print(f"Error: Function '{func_name}' not found")
+            return
+        frame = list(func.template)
+        _pop_params(func, frame, stack)
+        _run(func, frame, functions, ffi_functions, stack, self)
+
+    def _call_bound(self, ffi_function, args, func, pc):
+        """call_ffi for a foreign function the linker bound into the code"""
+        name = self._ffi_names.get(id(ffi_function), getattr(ffi_function, '__name__', '?'))
+        return self.call_ffi(name, ffi_function, args, func, pc)
+
+class Profiler(Instrument):
+    """Call counts and times of a xil run, passed to run() as profile
+
+    functions: function name -> {'calls', 'inclusive', 'exclusive'}, times in seconds
+    opcodes: opcode name -> number of executed instructions
+    ffi: FFI function name -> {'calls', 'time'}
+    """
+
+    def __init__(self):
+        self.functions = {}
+        self.opcodes = dict.fromkeys(OPCODE_NAMES, 0)
+        self.ffi = {}
+        # Running calls as [function name, start time, time spent in callees]
+        self._calls = []
+        # Functions with a running call, recursive calls count their time once
+        self._active = {}
+
+    def enter(self, func):
+        record = self.functions.get(func.name)
+        if record is None:
+            record = self.functions[func.name] = {'calls': 0, 'inclusive': 0.0, 'exclusive': 0.0}
+        record['calls'] += 1
+        self._active[func.name] = self._active.get(func.name, 0) + 1
+        self._calls.append([func.name, perf_counter(), 0.0])
+
+    def leave(self, func):
+        name, start, callee_time = self._calls.pop()
+        elapsed = perf_counter() - start
+        record = self.functions[name]
+        record['exclusive'] += elapsed - callee_time
+        self._active[name] -= 1
+        if not self._active[name]:
+            record['inclusive'] += elapsed
+        if self._calls:
+            self._calls[-1][2] += elapsed
+
+    def call_ffi(self, name, ffi_function, args, func, pc):
+        record = self.ffi.get(name)
+        if record is None:
+            record = self.ffi[name] = {'calls': 0, 'time': 0.0}
+        start = perf_counter()
+        try:
+            return ffi_function(*args)
+        finally:
+            record['time'] += perf_counter() - start
+            record['calls'] += 1
+
+    def finish(self, counts):
+        for op, count in enumerate(counts):
+            self.opcodes[OPCODE_NAMES[op]] += count
+
+    def as_dict(self):
+        """Return the profile as plain dictionaries"""
+        return {'functions': self.functions, 'opcodes': self.opcodes, 'ffi': self.ffi}
+
+    def to_json(self, indent=2):
+        """Return the profile as JSON"""
+        return json.dumps(self.as_dict(), indent=indent)
+
+    def table(self, sort='exclusive'):
+        """Return the profile as text table, functions sorted by the given column"""
+        lines = [f"{'function':<24} {'calls':>10} {'inclusive s':>12} {'exclusive s':>12}"]
+        for name, record in sorted(self.functions.items(), key=lambda item: item[1][sort], reverse=True):
+            lines.append(f"{name:<24} {record['calls']:>10} {record['inclusive']:>12.6f} {record['exclusive']:>12.6f}")
+        lines.append('')
+        lines.append(f"{'ffi':<24} {'calls':>10} {'time s':>12}")
+        for name, record in sorted(self.ffi.items(), key=lambda item: item[1]['time'], reverse=True):
+            lines.append(f"{name:<24} {record['calls']:>10} {record['time']:>12.6f}")
+        lines.append('')
+        lines.append(f"{'opcode':<24} {'count':>10}")
+        for name, count in sorted(self.opcodes.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"{name:<24} {count:>10}")
+        return '\n'.join(lines)
@@ -0,0 +1,47 @@
+"""Cooperative scheduler, runs xil executions as tasks of an asyncio event loop
+
+An execution is a generator over the bytecode of its functions. It hands
+control back to the loop once it used up its budget of calls and jumps,
+so one thread interleaves many executions and a long loop can't starve
+the others. Calls of foreign functions declared async run in an executor
+while the loop runs the other tasks.
+"""
+import asyncio
+
+from .bytecode import _interpret, _pop_params
+from .ffi import _ffi_pool
+
+# Calls and taken jumps a task executes before the other tasks get their turn
+TASK_BUDGET = 1000
+
+async def run_task(functions, func_name, ffi_functions, stack, blocking=frozenset(), budget=TASK_BUDGET,
+                   executor=None):
+    """Execute a compiled function like bytecode.execute, as task of the running event loop
+
+    blocking holds the ids of the foreign functions which run in executor,
+    by default the thread pool of async FFI calls. Tasks of the same compiled
+    functions may run concurrently in one event loop.
+    """
+    func = functions.get(func_name)
+    if func is None:
+        print(f"Error: Function '{func_name}' not found")
+        return
+    frame = list(func.template)
+    _pop_params(func, frame, stack)
+    loop = asyncio.get_running_loop()
+    executor = executor or _ffi_pool()
+    steps = _interpret(func, frame, functions, ffi_functions, stack, blocking=blocking, budget=max(budget, 1))
+    result = None
+    try:
+        while True:
+            request = steps.send(result)
+            if request is None:
+                await asyncio.sleep(0)
+                result = None
+            else:
+                ffi_function, args = request
+                result = await loop.run_in_executor(executor, ffi_function, *args)
+    except StopIteration:
+        pass
+    finally:
+        steps.close()
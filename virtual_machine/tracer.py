@@ -0,0 +1,114 @@
+import json
+import os
+from threading import get_ident
+from time import perf_counter_ns
+
+from .profiler import Instrument
+
+class Tracer(Instrument):
+    """Timeline of a xil run, passed to run() as profile
+
+    Function entries and exits and FFI calls are recorded as events in a
+    ring buffer which is allocated up front. Once it is full the oldest
+    events are overwritten, dropped counts them. Each event keeps the id of
+    the thread it happened on. Source positions are only looked up when the
+    events are exported, as Chrome trace events or as folded stacks for
+    flame graphs.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        # Events as (phase, name, start ns, duration ns, function, pc, thread id)
+        self._ring = [None] * capacity
+        self._written = 0
+        self.textViews = {}
+
+    def _record(self, event):
+        self._ring[self._written % self.capacity] = event
+        self._written += 1
+
+    def enter(self, func):
+        self._record(('B', func.name, perf_counter_ns(), 0, func, None, get_ident()))
+
+    def leave(self, func):
+        self._record(('E', func.name, perf_counter_ns(), 0, func, None, get_ident()))
+
+    def call_ffi(self, name, ffi_function, args, func, pc):
+        start = perf_counter_ns()
+        try:
+            return ffi_function(*args)
+        finally:
+            self._record(('X', name, start, perf_counter_ns() - start, func, pc, get_ident()))
+
+    @property
+    def dropped(self):
+        """Number of events overwritten because the ring was full"""
+        return max(0, self._written - self.capacity)
+
+    def events(self):
+        """Return the recorded events, oldest first"""
+        if self._written <= self.capacity:
+            return self._ring[:self._written]
+        split = self._written % self.capacity
+        return self._ring[split:] + self._ring[:split]
+
+    def _location(self, func, pc):
+        """Return the unit, row and column of a function or of instruction pc - 1"""
+        unit, views = self.textViews.get(func.name, (None, ()))
+        view = views[0] if views else None
+        if pc is not None and func.statements:
+            statement = func.statements[pc - 1] + 1
+            if statement < len(views) and views[statement] is not None:
+                view = views[statement]
+        return {'unit': unit, 'function': func.name,
+                'row': view.row if view else None, 'column': view.column if view else None}
+
+    def chrome_trace(self):
+        """Return the events in the Chrome Trace Event format"""
+        pid = os.getpid()
+        trace_events = []
+        for phase, name, start, duration, func, pc, tid in self.events():
+            event = {'name': name, 'cat': 'ffi' if phase == 'X' else 'xil', 'ph': phase,
+                     'ts': start / 1000, 'pid': pid, 'tid': tid, 'args': self._location(func, pc)}
+            if phase == 'X':
+                event['dur'] = duration / 1000
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'otherData': {'dropped': self.dropped}}
+
+    def folded_stacks(self):
+        """Return the events as folded stacks, one 'main;callee;ffi microseconds' line per stack"""
+        weights = {}
+        stack = []
+        last = None
+
+        def account(until):
+            if stack and last is not None and until > last:
+                key = ';'.join(stack)
+                weights[key] = weights.get(key, 0) + until - last
+
+        for phase, name, start, duration, func, pc, _ in self.events():
+            account(start)
+            if phase == 'B':
+                stack.append(name)
+            elif phase == 'E':
+                # Entries may have been overwritten in the ring
+                if stack and stack[-1] == name:
+                    stack.pop()
+            else:
+                stack.append(name)
+                last = start
+                account(start + duration)
+                stack.pop()
+                start += duration
+            last = start
+        return ''.join(f"{key} {max(1, round(weight / 1000))}\n" for key, weight in weights.items())
+
+    def write_chrome_trace(self, file_path):
+        """Write the Chrome trace JSON, it can be opened in chrome://tracing or Perfetto"""
+        with open(file_path, 'w', encoding='utf-8') as file:
+            json.dump(self.chrome_trace(), file)
+
+    def write_folded_stacks(self, file_path):
+        """Write the folded stacks, the input format of flamegraph.pl and speedscope"""
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(self.folded_stacks())
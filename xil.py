@@ -0,0 +1,224 @@
+"""xil command line: build, run, fmt, check and dump xil programs
+
+Each subcommand imports only the subsystems it needs, `xil run app.xasg`
+never loads the translator, yaml or the formatter's parser. --import-time
+reports how long those imports took on stderr, like python -X importtime.
+"""
+import argparse
+import importlib
+import sys
+from pathlib import Path
+from time import perf_counter
+
+# Import time the run path of a built program may take, asserted by the tests
+RUN_IMPORT_BUDGET_MS = 500
+
+# (subsystem, seconds) of every subsystem imported by _load
+_import_times = []
+
+def _load(name):
+    """Import a subsystem on first use and record how long it took"""
+    module = sys.modules.get(name)
+    if module is None:
+        start = perf_counter()
+        module = importlib.import_module(name)
+        _import_times.append((name, perf_counter() - start))
+    return module
+
+def import_report():
+    """Return the import times of the loaded subsystems in the format of -X importtime"""
+    lines = ["import time: cumulative [us] | subsystem"]
+    for name, seconds in _import_times:
+        lines.append(f"import time: {round(seconds * 1e6):>15} | {name}")
+    total = sum(seconds for _, seconds in _import_times)
+    lines.append(f"import time: {round(total * 1e6):>15} | total")
+    return '\n'.join(lines)
+
+def _user_errors():
+    """Exceptions which are reported as message, of the subsystems loaded so far"""
+    errors = [FileNotFoundError, ValueError]
+    if 'yaml' in sys.modules:
+        errors.append(sys.modules['yaml'].YAMLError)
+    if 'virtual_machine' in sys.modules:
+        errors.append(sys.modules['virtual_machine'].LinkError)
+    return tuple(errors)
+
+def _load_job(paths):
+    """Return the source files and the linked modules of a job"""
+    main = _load('main')
+    files = main.source_files(paths)
+    _load('asg_utils')
+    if any(file.suffix != '.xasg' for file in files):
+        _load('translator')
+    if any(file.suffix == '.xasg' for file in files):
+        _load('virtual_machine')
+    return files, main.load_modules(files)
+
+def _cache(vm, files, module, enabled):
+    """Return the compile cache of a module loaded from .xasg graphs, None for translated modules"""
+    graphs = [file for file in files if file.suffix == '.xasg']
+    if not enabled or not graphs or 'ops' not in module:
+        return None
+    return vm.CompileCache(vm.cache_path(graphs[0], module['module']))
+
+def cmd_run(args):
+    """Run the main function of every module"""
+    files, modules = _load_job(args.files)
+    vm = _load('virtual_machine')
+    main = _load('main')
+    exit_code = 0
+    for module in modules:
+        code = main.run_module(module, args.profile, args.trace, args.late_binding,
+                               _cache(vm, files, module, args.cache), args.mode, args.opt_level)
+        # The first module which exits with an error sets the exit code of the job
+        exit_code = exit_code or code
+    return exit_code
+
+def cmd_build(args):
+    """Translate sources into .xasg graphs and fill their compile caches"""
+    main = _load('main')
+    translator = _load('translator')
+    asg_utils = _load('asg_utils')
+    vm = _load('virtual_machine')
+    built = []
+    for file in main.source_files(args.files):
+        if file.suffix == '.xasg':
+            built.append(file)
+            continue
+        graph = translator.python_object_to_graph(translator.translate(file.name, file.read_text(encoding='utf-8')))
+        target = (Path(args.output) if args.output else file.parent) / f"{file.stem}.xasg"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        asg_utils.write_asg(graph, target)
+        built.append(target)
+        print(f"Built {target}")
+    # Link like the first run would, a missing function fails the build
+    for module in vm.load_graph_modules([asg_utils.read_asg(file) for file in built]):
+        vm.link_module(module, args.opt_level, args.late_binding, _cache(vm, built, module, args.cache))
+    return 0
+
+def cmd_check(args):
+    """Translate, validate and link without running"""
+    main = _load('main')
+    asg_utils = _load('asg_utils')
+    failed = False
+    for file in main.source_files(args.files):
+        if file.suffix == '.xasg':
+            # Reported here instead of failing the load
+            graph = asg_utils.read_asg(file, validate=False)
+        else:
+            translator = _load('translator')
+            graph = translator.python_object_to_graph(translator.translate(file.name, file.read_text(encoding='utf-8')))
+        for violation in asg_utils.validate_graph(graph):
+            textView = violation['textView']
+            position = f"{textView.row}:{textView.column}:" if textView else ''
+            print(f"Invalid graph: {file.name}:{position} {violation['message']}")
+            failed = True
+    if failed:
+        # Malformed graphs can't be loaded for linking
+        return 1
+    files, modules = _load_job(args.files)
+    vm = _load('virtual_machine')
+    for module in modules:
+        try:
+            vm.link_module(module, args.opt_level, args.late_binding)
+        except vm.LinkError as e:
+            print(f"Link error: {e}")
+            failed = True
+    if not failed:
+        print(f"Checked {len(files)} file(s)")
+    return 1 if failed else 0
+
+def cmd_fmt(args):
+    """Format xil sources in place, --check only reports"""
+    formatter = _load('formatter.formatter')
+    argv = list(args.files)
+    if args.recursive:
+        argv.append('--recursive')
+    if args.verbose:
+        argv.append('--verbose')
+    if not args.check:
+        argv.append('--format')
+    return formatter.main(argv)
+
+def cmd_dump(args):
+    """Print the compiled functions, the graph or the linked module of a file"""
+    file = Path(args.file)
+    asg_utils = _load('asg_utils')
+    if file.suffix == '.xasg':
+        graph = asg_utils.read_asg(file)
+    else:
+        translator = _load('translator')
+        graph = translator.python_object_to_graph(translator.translate(file.name, file.read_text(encoding='utf-8')))
+    if args.what == 'graph':
+        asg_utils.graph_to_mermaid(graph)
+        return 0
+    vm = _load('virtual_machine')
+    for module in vm.load_graph_modules([graph]):
+        if args.what == 'module':
+            print(module)
+            continue
+        from virtual_machine.bytecode import compile_module
+        for func in compile_module(module, {}, args.opt_level).values():
+            print(func)
+    return 0
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='xil', description='xil toolchain')
+    parser.add_argument('--import-time', action='store_true',
+                        help='Report the import time of the loaded subsystems on stderr')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def job(name, description, function):
+        command = commands.add_parser(name, help=description)
+        command.add_argument('files', nargs='*', default=['xil.yaml'],
+                             help='xil.yaml projects, directories, .xil sources or .xasg graphs')
+        command.add_argument('--opt-level', type=int, default=1)
+        command.add_argument('--late-binding', action='store_true',
+                             help='Look calls of unknown functions up when they run')
+        command.set_defaults(function=function)
+        return command
+
+    run = job('run', 'Run the main function of every module', cmd_run)
+    run.add_argument('--mode', choices=['closure', 'bytecode', 'reference', 'task'], default='closure')
+    run.add_argument('--profile', nargs='?', const='', default=None, metavar='FILE',
+                     help='Print a profile table, write it as JSON to FILE')
+    run.add_argument('--trace', metavar='FILE', help='Write a Chrome trace and FILE.folded')
+    run.add_argument('--no-cache', dest='cache', action='store_false',
+                     help="Don't use the __xilcache__ of .xasg graphs")
+    build = job('build', 'Translate sources into .xasg graphs', cmd_build)
+    build.add_argument('--output', '-o', help='Directory of the graphs, default next to the sources')
+    build.add_argument('--no-cache', dest='cache', action='store_false',
+                       help="Don't fill the __xilcache__ of the graphs")
+    job('check', 'Translate, validate and link without running', cmd_check)
+
+    fmt = commands.add_parser('fmt', help='Format xil sources')
+    fmt.add_argument('files', nargs='*')
+    fmt.add_argument('--check', action='store_true', help="Only report files which aren't formatted")
+    fmt.add_argument('--recursive', '-r', action='store_true')
+    fmt.add_argument('--verbose', '-v', action='store_true')
+    fmt.set_defaults(function=cmd_fmt)
+
+    dump = commands.add_parser('dump', help='Print the compiled functions, graph or module of a file')
+    dump.add_argument('file', help='.xil source or .xasg graph')
+    dump.add_argument('--what', choices=['bytecode', 'graph', 'module'], default='bytecode')
+    dump.add_argument('--opt-level', type=int, default=1)
+    dump.set_defaults(function=cmd_dump)
+    return parser
+
+def main(argv=None):
+    """Run a xil command, returns the exit code"""
+    args = _parser().parse_args(argv)
+    try:
+        return args.function(args)
+    except Exception as e:
+        if not isinstance(e, _user_errors()):
+            raise
+        prefix = 'Link error' if type(e).__name__ == 'LinkError' else 'Error'
+        print(f"{prefix}: {e}")
+        return 1
+    finally:
+        if args.import_time:
+            print(import_report(), file=sys.stderr)
+
+if __name__ == "__main__":
+    sys.exit(main())